@@ -0,0 +1,636 @@
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_POOL_SIZE = 4
+DEFAULT_DELETE_CHUNK = 5000
+# Table scans: keyset pages start at DEFAULT_PAGE_ROWS rows and are resized
+# to take about PAGE_SECONDS of database time each.
+DEFAULT_PAGE_ROWS = 50000
+MIN_PAGE_ROWS = 1000
+MAX_PAGE_ROWS = 200000
+PAGE_SECONDS = 2.0
+# Tables without a key column are read in Date_Time windows instead, resized
+# towards page_rows rows each.
+INITIAL_WINDOW = timedelta(hours=1)
+MIN_WINDOW = timedelta(seconds=1)
+MAX_WINDOW = timedelta(days=366)
+
+
+class ConnectionPool:
+    """Blocking pool of MySQL connections to one database.
+
+    Connections are opened lazily up to ``size`` and reused by the fetch and
+    delete paths. Each one is pinged before it is handed out, which also
+    reconnects sockets the server has dropped while they sat idle. A
+    connection whose user raised is closed instead of being returned.
+    """
+
+    def __init__(self, host, user, password, dbname, size=DEFAULT_POOL_SIZE):
+        self.size = size
+        # autocommit keeps reused connections from reading an old snapshot.
+        self._config = {"host": host, "user": user, "password": password, "database": dbname, "autocommit": True}
+        self._cond = threading.Condition()
+        self._idle = []
+        self._open = 0
+
+    def resize(self, size):
+        with self._cond:
+            self.size = size
+            self._cond.notify_all()
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            conn.ping(reconnect=True, attempts=3, delay=1)
+            yield conn
+        except BaseException:
+            self._discard(conn)
+            raise
+        self._checkin(conn)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            _close_quietly(conn)
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+        try:
+            import mysql.connector  # imported on first use to keep startup fast
+            return mysql.connector.connect(**self._config)
+        except BaseException:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, conn):
+        with self._cond:
+            if self._open <= self.size:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+        _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, user, password, dbname, size=None):
+    """Return the shared ConnectionPool for these credentials.
+
+    Passing size resizes the pool, so callers can match it to the number of
+    export workers before starting a run.
+    """
+    key = (host, user, password, dbname)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(host, user, password, dbname, size or DEFAULT_POOL_SIZE)
+        elif size and size != pool.size:
+            pool.resize(size)
+        return pool
+
+
+def iter_query_batches(host, user, password, dbname, query, batch_size=DEFAULT_BATCH_SIZE, params=None,
+                       raw=False):
+    """Stream the result of query through an unbuffered cursor.
+
+    The first item yielded is ``cursor.description``; every following item is
+    a list of at most ``batch_size`` rows read with ``fetchmany``, so only one
+    batch is held in memory at a time. With raw, the cursor returns the
+    server's text for every value instead of Python objects, which skips the
+    connector's per-value conversion (use raw_value_decoder() where a value
+    is needed).
+    """
+    with get_pool(host, user, password, dbname).connection() as conn:
+        cursor = conn.cursor(buffered=False, raw=raw)
+        cursor.execute(query, params)
+        yield cursor.description
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+
+
+class TableScan(namedtuple("TableScan", "table key_column start end after")):
+    """The rows of table within a Date_Time range, read page by page.
+
+    start and end are inclusive ``Date_Time`` bounds, None for open ends.
+    after is a ``(date_time, key)`` position the rows must come after; with
+    key None the rows of date_time's second come again (see
+    position_condition()). Rows without a
+    ``Date_Time`` are never part of a scan.
+    """
+    __slots__ = ()
+
+    def __new__(cls, table, key_column=None, start=None, end=None, after=None):
+        return super().__new__(cls, table, key_column, start, end, after)
+
+    def conditions(self):
+        """``(sql, params)`` of the range, without the paging position."""
+        sql = ["Date_Time IS NOT NULL"] if self.start is None and self.after is None else []
+        params = []
+        if self.start is not None:
+            sql.append("Date_Time >= %s")
+            params.append(self.start)
+        if self.end is not None:
+            sql.append("Date_Time <= %s")
+            params.append(self.end)
+        return sql, params
+
+
+def position_condition(key_column, date_time, key):
+    """``(sql, params)`` selecting the rows ordered after ``(date_time, key)``.
+
+    Rows are taken to be ordered by ``Date_Time`` and key_column. With key
+    None the rows of date_time's second are read again: rows committed after
+    the last read may share that second, and nothing else tells them apart,
+    so they come twice rather than not at all.
+    """
+    if key is None:
+        return "Date_Time >= %s", [date_time]
+    # Date_Time >= %s keeps the read on the Date_Time index; the OR breaks ties.
+    return (f"Date_Time >= %s AND (Date_Time > %s OR `{key_column}` > %s)",
+            [date_time, date_time, key])
+
+
+def iter_table_scan(host, user, password, dbname, scan, batch_size=DEFAULT_BATCH_SIZE, raw=False,
+                    page_rows=DEFAULT_PAGE_ROWS, retry=None, on_page=None):
+    """Read a TableScan as a series of short queries; yields like iter_query_batches.
+
+    With a key column the rows come in keyset pages, ordered by
+    ``Date_Time`` and key: every page starts after the last row read,
+    ``(Date_Time, key) > (last)``, so it is one index range read of at most
+    a page of rows. The page size is adjusted after every page so a page
+    takes about PAGE_SECONDS of database time. Without a key column the
+    range is read in ``Date_Time`` windows whose width is adjusted towards
+    page_rows rows each.
+
+    No query stays open for longer than a page, and the last row handed out
+    is the checkpoint: retry(fn), if given, runs every fetch, and a fetch
+    retried after a lost connection continues right after that row on a new
+    connection. on_page(rows, seconds) is called after every page.
+    """
+    pool = get_pool(host, user, password, dbname)
+    retry = retry or (lambda fn: fn())
+    if scan.key_column:
+        return _iter_keyset_pages(pool, scan, batch_size, raw, page_rows, retry, on_page)
+    return _iter_date_windows(pool, scan, batch_size, raw, page_rows, retry, on_page)
+
+
+class _Page:
+    """One page query: a pooled connection and its unbuffered cursor."""
+
+    def __init__(self, pool, query, params, raw):
+        self._connection = pool.connection()
+        conn = self._connection.__enter__()
+        self.cursor = None
+        self.seconds = 0.0
+        self.rows = 0
+        started = time.perf_counter()
+        try:
+            self.cursor = conn.cursor(buffered=False, raw=raw)
+            self.cursor.execute(query, params)
+        except BaseException as e:
+            self.close(e)
+            raise
+        self.seconds += time.perf_counter() - started
+
+    def fetch(self, size):
+        started = time.perf_counter()
+        try:
+            rows = self.cursor.fetchmany(size)
+        except BaseException as e:
+            self.close(e)
+            raise
+        self.seconds += time.perf_counter() - started
+        self.rows += len(rows)
+        return rows
+
+    def close(self, error=None):
+        """Give the connection back, or discard it when error left it unusable."""
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        if error is None:
+            self.cursor.close()
+            connection.__exit__(None, None, None)
+        else:
+            connection.__exit__(type(error), error, error.__traceback__)
+
+
+def _row_position(description, scan, raw):
+    """Return ``position(row) -> (date_time, key)`` for rows shaped like description."""
+    lowered = [desc[0].lower() for desc in description]
+    date_idx = lowered.index("date_time")
+    key_idx = lowered.index(scan.key_column.lower())
+    if not raw:
+        return lambda row: (row[date_idx], row[key_idx])
+    decode_date = raw_value_decoder(description[date_idx])
+    decode_key = raw_value_decoder(description[key_idx])
+    return lambda row: (decode_date(row[date_idx]), decode_key(row[key_idx]))
+
+
+def _iter_keyset_pages(pool, scan, batch_size, raw, page_rows, retry, on_page):
+    key = f"`{scan.key_column}`"
+    range_sql, range_params = scan.conditions()
+    position = scan.after
+    limit = max(MIN_PAGE_ROWS, min(MAX_PAGE_ROWS, page_rows))
+    page = None
+    lost = (0, 0.0)
+    row_position = None
+    described = False
+
+    def page_query(rows_left):
+        sql, params = list(range_sql), list(range_params)
+        if position is not None:
+            position_sql, position_params = position_condition(scan.key_column, *position)
+            sql.append(position_sql)
+            params += position_params
+        query = (f"SELECT * FROM `{scan.table}` WHERE {' AND '.join(sql)} "
+                 f"ORDER BY Date_Time, {key} LIMIT {int(rows_left)};")
+        return query, params
+
+    def fetch():
+        nonlocal page, lost
+        if page is None:
+            # After a lost connection only the rest of the page is read again.
+            page = _Page(pool, *page_query(limit - lost[0]), raw)
+            page.rows, page.seconds = lost[0], lost[1] + page.seconds
+        try:
+            return page.fetch(min(batch_size, limit - page.rows))
+        except Exception:
+            lost, page = (page.rows, page.seconds), None
+            raise
+
+    try:
+        while True:
+            page_done = False
+            rows = retry(fetch)
+            if not described:
+                yield page.cursor.description
+                row_position = _row_position(page.cursor.description, scan, raw)
+                described = True
+            if rows:
+                position = row_position(rows[-1])
+                yield rows
+            if rows and page.rows < limit:
+                continue
+            # A short page is the last one; after a full one the next page starts.
+            full, seconds = page.rows >= limit, page.seconds
+            if on_page:
+                on_page(page.rows, seconds)
+            page.close()
+            page, lost = None, (0, 0.0)
+            if not full:
+                return
+            scale = PAGE_SECONDS / seconds if seconds > 0 else 2.0
+            limit = max(MIN_PAGE_ROWS, min(MAX_PAGE_ROWS, int(limit * max(0.5, min(2.0, scale)))))
+    finally:
+        if page is not None:
+            page.close(GeneratorExit())
+
+
+def _iter_date_windows(pool, scan, batch_size, raw, page_rows, retry, on_page):
+    range_sql, range_params = scan.conditions()
+    if scan.after is not None:
+        position_sql, position_params = position_condition(None, scan.after[0], None)
+        range_sql.append(position_sql)
+        range_params += position_params
+    where = " AND ".join(range_sql)
+
+    def query(sql, params, raw_rows=False):
+        with pool.connection() as conn:
+            cursor = conn.cursor(raw=raw_rows)
+            started = time.perf_counter()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+            seconds = time.perf_counter() - started
+            description = cursor.description
+            cursor.close()
+        return description, rows, seconds
+
+    # The scan covers the rows present now; its first window starts at the first of them.
+    _, bounds, _ = retry(lambda: query(f"SELECT MIN(Date_Time), MAX(Date_Time) FROM `{scan.table}` WHERE {where}",
+                                       range_params))
+    low, high = bounds[0]
+    if low is None:
+        description, _, _ = retry(lambda: query(f"SELECT * FROM `{scan.table}` LIMIT 0", None, raw))
+        yield description
+        return
+    if not isinstance(low, datetime):
+        low, high = datetime.combine(low, datetime.min.time()), datetime.combine(high, datetime.min.time())
+    width = INITIAL_WINDOW
+    described = False
+    while low <= high:
+        last = low + width > high
+        window_sql = f"Date_Time >= %s AND Date_Time {'<=' if last else '<'} %s"
+        window_params = [low, high if last else low + width]
+        description, rows, seconds = retry(lambda: query(
+            f"SELECT * FROM `{scan.table}` WHERE {where} AND {window_sql} ORDER BY Date_Time",
+            range_params + window_params, raw))
+        if not described:
+            yield description
+            described = True
+        if on_page:
+            on_page(len(rows), seconds)
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+        if last:
+            return
+        low += width
+        scale = page_rows / len(rows) if rows else 4.0
+        width = max(MIN_WINDOW, min(MAX_WINDOW, width * max(0.25, min(4.0, scale))))
+
+
+def open_query_stream(host, user, password, dbname, query, batch_size=DEFAULT_BATCH_SIZE, params=None,
+                      raw=False, page_rows=DEFAULT_PAGE_ROWS, retry=None, on_page=None):
+    """Start streaming query and return ``(description, batches)``.
+
+    query is SQL or a TableScan; a scan is read by iter_table_scan (see
+    there for page_rows, retry and on_page) and ignores params. Returns None
+    when the query produced no rows, so callers can skip the upload before
+    anything is sent to Drive. raw is as for iter_query_batches.
+    """
+    if isinstance(query, TableScan):
+        batches = iter_table_scan(host, user, password, dbname, query, batch_size, raw, page_rows, retry, on_page)
+    else:
+        batches = iter_query_batches(host, user, password, dbname, query, batch_size, params, raw)
+    description = next(batches)
+    first = next(batches, None)
+    if first is None:
+        batches.close()
+        return None
+
+    def chained():
+        yield first
+        yield from batches
+
+    return description, chained()
+
+
+def raw_value_decoder(desc):
+    """Return the function that turns a raw cursor value of column desc into a Python value.
+
+    Values the connector would return as None (zero dates) decode to None.
+    """
+    from mysql.connector.constants import FieldType
+
+    type_code = desc[1]
+    if type_code in (FieldType.DATETIME, FieldType.TIMESTAMP):
+        parse = datetime.fromisoformat
+    elif type_code in (FieldType.DATE, FieldType.NEWDATE):
+        parse = date.fromisoformat
+    elif type_code in (FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.INT24,
+                       FieldType.LONGLONG, FieldType.YEAR):
+        return int
+    elif type_code in (FieldType.DECIMAL, FieldType.NEWDECIMAL):
+        parse = Decimal
+    else:
+        return lambda value: bytes(value).decode("utf-8", errors="replace")
+
+    def decode(value):
+        try:
+            return parse(bytes(value).decode("ascii"))
+        except ValueError:
+            return None
+
+    return decode
+
+
+def primary_key_column(host, user, password, dbname, table):
+    """Return the single-column primary key of table, or None.
+
+    Composite or missing keys return None; callers then fall back to
+    ``Date_Time`` alone.
+    """
+    with get_pool(host, user, password, dbname).connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY' "
+            "ORDER BY ORDINAL_POSITION",
+            (dbname, table)
+        )
+        columns = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return columns[0] if len(columns) == 1 else None
+
+
+def table_probe(host, user, password, dbname, table, start_date_str):
+    """Return ``[row count, latest Date_Time]`` of table from start_date_str on.
+
+    A cheap change check for full exports: both numbers only stay the same
+    while no row is added or deleted in that range. With an index on
+    ``Date_Time`` it does not read the rows themselves.
+    """
+    with get_pool(host, user, password, dbname).connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*), MAX(Date_Time) FROM `{table}` WHERE Date_Time >= %s", (start_date_str,))
+        count, latest = cursor.fetchone()
+        cursor.close()
+    return [int(count), str(latest) if latest is not None else None]
+
+
+def scan_estimate(host, user, password, dbname, scan):
+    """Return ``(rows, bytes_per_row)`` expected for a TableScan, without reading it.
+
+    rows is the optimizer's estimate from ``EXPLAIN``, which an index on
+    ``Date_Time`` keeps close; bytes_per_row is the table's average row
+    length from ``information_schema`` (0 when unknown).
+    """
+    sql, params = scan.conditions()
+    if scan.after is not None:
+        sql.append("Date_Time >= %s")
+        params.append(scan.after[0])
+    with get_pool(host, user, password, dbname).connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"EXPLAIN SELECT * FROM `{scan.table}` WHERE {' AND '.join(sql)}", params)
+        names = [desc[0].lower() for desc in cursor.description]
+        rows = sum(int(row[names.index("rows")] or 0) for row in cursor.fetchall())
+        cursor.execute("SELECT AVG_ROW_LENGTH FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s", (dbname, scan.table))
+        found = cursor.fetchone()
+        cursor.close()
+    return rows, int(found[0] or 0) if found else 0
+
+
+class RangeTracker:
+    """Record the ``Date_Time``/key position of rows flowing through an export.
+
+    For ordered exports (``Date_Time`` then key) the last row seen is the
+    high-watermark. The ``Date_Time`` span and the largest key are tracked
+    regardless of order and bound the rows purge_exported_rows() may delete.
+    """
+
+    def __init__(self, key_column=None, date_column="Date_Time"):
+        self.key_column = key_column
+        self.date_column = date_column
+        self.rows = 0
+        self.last_date_time = None
+        self.last_key = None
+        self.min_date_time = None
+        self.max_date_time = None
+        self.max_key = None
+        self._date_idx = None
+        self._key_idx = None
+        self._decode_date = None
+        self._decode_key = None
+
+    def set_columns(self, columns, raw_description=None):
+        """Locate the tracked columns; pass raw_description when rows come from a raw cursor."""
+        lowered = [c.lower() for c in columns]
+        self._date_idx = lowered.index(self.date_column.lower()) if self.date_column.lower() in lowered else None
+        if self.key_column and self.key_column.lower() in lowered:
+            self._key_idx = lowered.index(self.key_column.lower())
+        if raw_description:
+            # Only the tracked columns are decoded; the export keeps the raw bytes.
+            if self._date_idx is not None:
+                self._decode_date = raw_value_decoder(raw_description[self._date_idx])
+            if self._key_idx is not None:
+                self._decode_key = raw_value_decoder(raw_description[self._key_idx])
+
+    def observe(self, rows):
+        if not rows:
+            return
+        self.rows += len(rows)
+        if self._date_idx is not None:
+            dates = [row[self._date_idx] for row in rows]
+            if self._decode_date:
+                dates = [self._decode_date(d) if d is not None else None for d in dates]
+            self.last_date_time = dates[-1]
+            dates = [d for d in dates if d is not None]
+            if dates:
+                low, high = min(dates), max(dates)
+                if self.min_date_time is None or low < self.min_date_time:
+                    self.min_date_time = low
+                if self.max_date_time is None or high > self.max_date_time:
+                    self.max_date_time = high
+        if self._key_idx is not None:
+            keys = [row[self._key_idx] for row in rows]
+            if self._decode_key:
+                keys = [self._decode_key(k) if k is not None else None for k in keys]
+            self.last_key = keys[-1]
+            keys = [k for k in keys if k is not None]
+            if keys and (self.max_key is None or max(keys) > self.max_key):
+                self.max_key = max(keys)
+
+    def track(self, batches):
+        for rows in batches:
+            self.observe(rows)
+            yield rows
+
+    def watermark(self):
+        if self.last_date_time is None:
+            return None
+        key = self.last_key
+        if key is not None and not isinstance(key, (int, str)):
+            key = str(key)
+        return {"date_time": str(self.last_date_time), "key_column": self.key_column, "key": key}
+
+    def span(self):
+        """The rows seen, as JSON-safe values that from_span() turns back into a tracker."""
+        key = self.max_key
+        if key is not None and not isinstance(key, (int, str)):
+            key = str(key)
+        return {
+            "rows": self.rows,
+            "key_column": self.key_column,
+            "min_date_time": str(self.min_date_time) if self.min_date_time is not None else None,
+            "max_date_time": str(self.max_date_time) if self.max_date_time is not None else None,
+            "max_key": key,
+        }
+
+    @classmethod
+    def from_span(cls, span):
+        """A tracker that bounds the same rows as the one span() came from.
+
+        ``Date_Time`` values stay strings, which MySQL compares as datetimes.
+        """
+        tracker = cls(span["key_column"])
+        tracker.rows = span["rows"]
+        tracker.min_date_time = span["min_date_time"]
+        tracker.max_date_time = span["max_date_time"]
+        tracker.max_key = span["max_key"]
+        return tracker
+
+
+def purge_exported_rows(host, user, password, dbname, table, tracker, chunk_size=DEFAULT_DELETE_CHUNK,
+                        throttle_seconds=0.0, retry=None):
+    """Delete the rows an export covered, a chunk at a time.
+
+    Only rows inside the exported ``Date_Time`` span are touched; with a key
+    column, rows with a key above the largest exported one (i.e. inserted
+    after the SELECT) are kept as well. Without one nothing tells those rows
+    apart within the last exported second, so that second is left for the
+    next run, which exports it again (see position_condition()). Each ``DELETE ... LIMIT chunk_size``
+    commits on its own so row locks are held briefly, and throttle_seconds
+    pauses between chunks to leave room for the writers. retry(fn), if
+    given, runs the delete loop again on a fresh connection after a lost
+    connection or lock timeout.
+
+    Returns ``(rows_deleted, seconds)``; nothing is deleted when the export
+    carried no ``Date_Time`` values.
+    """
+    if tracker.min_date_time is None:
+        return 0, 0.0
+    params = [tracker.min_date_time, tracker.max_date_time]
+    if tracker.key_column and tracker.max_key is not None:
+        where = f"Date_Time >= %s AND Date_Time <= %s AND `{tracker.key_column}` <= %s"
+        params.append(tracker.max_key)
+        order_by = f"`{tracker.key_column}`"
+    else:
+        where = "Date_Time >= %s AND Date_Time < %s"
+        order_by = "Date_Time"
+    query = f"DELETE FROM `{table}` WHERE {where} ORDER BY {order_by} LIMIT {int(chunk_size)};"
+
+    deleted = 0
+    started = time.monotonic()
+
+    def delete_chunks():
+        nonlocal deleted
+        with get_pool(host, user, password, dbname).connection() as conn:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute(query, params)
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < chunk_size:
+                    break
+                if throttle_seconds:
+                    time.sleep(throttle_seconds)
+            cursor.close()
+
+    # Committed chunks stay deleted, so a retry just carries on with the rest.
+    (retry or (lambda fn: fn()))(delete_chunks)
+    return deleted, time.monotonic() - started
@@ -0,0 +1,407 @@
+import io
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaUpload
+
+from SyncRetry import retry_call
+from SyncState import JsonStore
+
+# Drive requires every chunk except the last to be a multiple of 256 KiB.
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+SPOOL_DIR = "upload_spool"
+DISCOVERY_CACHE_DIR = "discovery_cache"
+DISCOVERY_MAX_AGE = 30 * 24 * 3600
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/{api}/{apiVersion}/rest"
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+# Drive accepts at most 100 calls in one batch request.
+BATCH_LIMIT = 100
+
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+
+def discovery_document(api_name, api_version, cache_dir=DISCOVERY_CACHE_DIR, max_age=DISCOVERY_MAX_AGE):
+    """Return the discovery document JSON for api_name/api_version.
+
+    The text is read once per process. It comes from cache_dir, then from the
+    copies bundled with googleapiclient (which frozen builds often lack), and
+    only then from the network; whatever was found is written back to
+    cache_dir for the next start. A stale cached copy beats no copy at all.
+    """
+    key = (api_name, api_version)
+    with _discovery_lock:
+        if key in _discovery_docs:
+            return _discovery_docs[key]
+        path = os.path.join(cache_dir, f"{api_name}.{api_version}.json")
+        cached = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                cached = f.read()
+            if time.time() - os.path.getmtime(path) < max_age:
+                _discovery_docs[key] = cached
+                return cached
+        content = get_static_doc(api_name, api_version)
+        if content is None:
+            try:
+                resp, body = httplib2.Http(timeout=30).request(
+                    DISCOVERY_URL.format(api=api_name, apiVersion=api_version))
+                if resp.status >= 400:
+                    raise HttpError(resp, body)
+                content = body.decode("utf-8")
+            except Exception:
+                if cached is None:
+                    raise
+                content = cached
+        if content != cached:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+        _discovery_docs[key] = content
+        return content
+
+
+class ThreadLocalService:
+    """Give every thread its own Drive client built from shared credentials.
+
+    A googleapiclient service wraps a single httplib2 connection, which must
+    not be used from several threads at once.
+    """
+
+    def __init__(self, credentials, api_name="drive", api_version="v3"):
+        self.credentials = credentials
+        self.api_name = api_name
+        self.api_version = api_version
+        self._local = threading.local()
+
+    def get(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            # build_from_document adds per-method fields to the parsed dict, so
+            # every client parses its own copy of the cached text.
+            service = build_from_document(discovery_document(self.api_name, self.api_version),
+                                          credentials=self.credentials)
+            self._local.service = service
+        return service
+
+
+def execute_batch(service, requests, limit=BATCH_LIMIT):
+    """Execute independent Drive requests as batch requests.
+
+    requests maps any hashable key to an unexecuted HttpRequest. Returns a
+    dict with the same keys holding each response, or the HttpError that
+    request failed with. A single request is executed on its own, since
+    wrapping it in a batch saves nothing.
+    """
+    if len(requests) == 1:
+        (key, request), = requests.items()
+        try:
+            return {key: request.execute()}
+        except HttpError as e:
+            return {key: e}
+
+    results = {}
+    items = list(requests.items())
+    for start in range(0, len(items), limit):
+        keys = {}
+
+        def collect(request_id, response, exception):
+            results[keys[request_id]] = exception if exception is not None else response
+
+        batch = service.new_batch_http_request(callback=collect)
+        for i, (key, request) in enumerate(items[start:start + limit]):
+            keys[str(i)] = key
+            batch.add(request, request_id=str(i))
+        batch.execute()
+    return results
+
+
+def folder_query(name, parent_id):
+    """Drive search query for a folder called name directly inside parent_id."""
+    safe_name = name.replace("\\", "\\\\").replace("'", "\\'")
+    return (f"mimeType='{FOLDER_MIMETYPE}' and name='{safe_name}' "
+            f"and '{parent_id}' in parents and trashed=false")
+
+
+class TokenRefresher(threading.Thread):
+    """Refresh OAuth credentials in the background shortly before they expire.
+
+    Uploads then never stop for an inline token refresh. on_refresh is called
+    with the credentials after every refresh, e.g. to persist the new token.
+    """
+
+    def __init__(self, credentials, on_refresh=None, margin_seconds=300, retry_seconds=60):
+        super().__init__(name="token-refresh", daemon=True)
+        self.credentials = credentials
+        self.on_refresh = on_refresh
+        self.margin_seconds = margin_seconds
+        self.retry_seconds = retry_seconds
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        from google.auth.transport.requests import Request
+
+        request = Request()
+        while getattr(self.credentials, "refresh_token", None) and self.credentials.expiry:
+            # google-auth keeps expiry as a naive UTC datetime.
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            wait = (self.credentials.expiry - now).total_seconds() - self.margin_seconds
+            if self._stop_event.wait(max(wait, 0)):
+                return
+            try:
+                self.credentials.refresh(request)
+                if self.on_refresh:
+                    self.on_refresh(self.credentials)
+            except Exception:
+                if self._stop_event.wait(self.retry_seconds):
+                    return
+
+
+class StreamingMediaUpload(MediaUpload):
+    """Resumable upload body fed from an iterator of ``bytes`` chunks.
+
+    The total size is unknown until the iterator is exhausted, so the upload
+    is sent in ``chunksize`` pieces and only the piece in flight (plus one
+    chunk of read-ahead) is kept in memory.
+    """
+
+    def __init__(self, chunks, mimetype, chunksize=STREAM_CHUNK_SIZE):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._buffer = bytearray()
+        self._offset = 0
+        self._read_ahead = 0
+        self._size = None
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def size(self):
+        # next_chunk() asks for the size before sending each piece. Reading one
+        # piece ahead lets the final request carry the real total instead of "*".
+        self._fill(self._read_ahead + self._chunksize + 1)
+        return self._size
+
+    def getbytes(self, begin, length):
+        if begin < self._offset:
+            raise ValueError(f"Cannot rewind streaming upload to byte {begin}; buffer starts at {self._offset}")
+        del self._buffer[:begin - self._offset]
+        self._offset = begin
+        self._fill(begin + length)
+        self._read_ahead = begin + length
+        return bytes(self._buffer[:length])
+
+    def _fill(self, end):
+        while self._size is None and self._offset + len(self._buffer) < end:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._size = self._offset + len(self._buffer)
+            else:
+                self._buffer.extend(chunk)
+
+
+class UploadSessionStore(JsonStore):
+    """Resumable upload sessions persisted as JSON, keyed by spool file path.
+
+    A session is recorded as soon as Drive hands out its upload URI and is
+    removed once the file is created, so a restarted process can pick up any
+    session left behind and continue from the last committed byte.
+    """
+
+    def __init__(self, path="upload_sessions.json"):
+        super().__init__(path)
+
+    def put(self, entry):
+        self.set(entry["spool_path"], entry)
+
+    def pending(self):
+        return self.values()
+
+
+def spool_to_disk(file_name, source, spool_dir=SPOOL_DIR):
+    """Write a BytesIO or an iterator of byte chunks to a file in spool_dir."""
+    os.makedirs(spool_dir, exist_ok=True)
+    spool_path = os.path.join(spool_dir, f"{uuid.uuid4().hex}_{file_name}")
+    with open(spool_path, "wb") as f:
+        if isinstance(source, io.IOBase):
+            source.seek(0)
+            shutil.copyfileobj(source, f)
+        else:
+            for chunk in source:
+                f.write(chunk)
+    return spool_path
+
+
+def resumable_upload(service, store, file_name, source, folder_id, mimetype="text/csv",
+                     chunk_size=STREAM_CHUNK_SIZE, progress_callback=None, properties=None, retry=None):
+    """Spool source to disk and upload it in chunk_size pieces.
+
+    The session URI is saved in store after the first request, so the upload
+    can be finished by resume_pending_uploads() if this process dies.
+    properties is extra file metadata such as a description. retry(fn)
+    runs each chunk request (see SyncRetry.retry_call).
+    """
+    entry = {
+        "file_name": file_name,
+        "folder_id": folder_id,
+        "mimetype": mimetype,
+        "chunk_size": chunk_size,
+        "spool_path": spool_to_disk(file_name, source),
+        "resumable_uri": None,
+        "properties": properties,
+    }
+    store.put(entry)
+    return _run_resumable(service, store, entry, progress_callback, retry)
+
+
+def resume_pending_uploads(service, store, progress_callback=None, retry=None):
+    """Finish every upload left in store by an earlier run.
+
+    Call this once at startup, before any new upload is started.
+
+    Returns a list of ``(file_name, result)`` where result is the created
+    file resource or the exception that stopped it.
+    """
+    results = []
+    for entry in store.pending():
+        if not os.path.exists(entry["spool_path"]):
+            store.remove(entry["spool_path"])
+            continue
+        try:
+            results.append((entry["file_name"], _run_resumable(service, store, entry, progress_callback, retry)))
+        except Exception as e:
+            results.append((entry["file_name"], e))
+    return results
+
+
+def _run_resumable(service, store, entry, progress_callback, retry=None):
+    retry = retry or _default_retry(entry["file_name"])
+    media = MediaFileUpload(entry["spool_path"], mimetype=entry["mimetype"],
+                            chunksize=entry["chunk_size"], resumable=True)
+    file_metadata = dict(entry.get("properties") or {}, name=entry["file_name"], parents=[entry["folder_id"]])
+    request = service.files().create(body=file_metadata, media_body=media, fields="id, md5Checksum")
+    if entry["resumable_uri"]:
+        # Ask Drive how many bytes it already committed before sending more.
+        request.resumable_uri = entry["resumable_uri"]
+        request._in_error_state = True
+
+    response = None
+    while response is None:
+        try:
+            # A failed chunk leaves the request in its error state, so the
+            # retry first asks Drive where to continue and resends from there.
+            status, response = retry(request.next_chunk)
+        except HttpError as e:
+            if e.resp.status in (404, 410) and request.resumable_uri:
+                # The session expired; start a new one from byte zero.
+                request = service.files().create(body=file_metadata, media_body=media, fields="id, md5Checksum")
+                entry["resumable_uri"] = None
+                store.put(entry)
+                continue
+            raise
+        if request.resumable_uri and request.resumable_uri != entry["resumable_uri"]:
+            entry["resumable_uri"] = request.resumable_uri
+            store.put(entry)
+        if progress_callback:
+            done = media.size() if response is not None else request.resumable_progress
+            progress_callback(entry["file_name"], done, media.size())
+
+    media.stream().close()
+    store.remove(entry["spool_path"])
+    os.remove(entry["spool_path"])
+    return response
+
+
+def execute_upload(request, retry=None):
+    """Send a request with resumable media chunk by chunk; return the created file.
+
+    Only the failed chunk is sent again when retry(fn) retries a call.
+    """
+    retry = retry or _default_retry("upload")
+    response = None
+    while response is None:
+        _, response = retry(request.next_chunk)
+    return response
+
+
+def _default_retry(what):
+    return lambda fn: retry_call(fn, what)
+
+
+class FolderCache(JsonStore):
+    """Folder IDs keyed by ``(parent_id, name)``, persisted across runs.
+
+    Entries expire after ``ttl_seconds``; once ``max_entries`` is exceeded the
+    oldest ones are evicted. The cache is kept in memory and only written
+    back when it changes.
+    """
+
+    def __init__(self, path="folder_cache.json", ttl_seconds=7 * 24 * 3600, max_entries=2000):
+        super().__init__(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        try:
+            self._entries = self._load()
+        except ValueError:
+            self._entries = {}
+
+    def lookup(self, parent_id, name):
+        key = f"{parent_id}/{name}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["cached_at"] > self.ttl_seconds:
+                del self._entries[key]
+                self._save(self._entries)
+                return None
+            return entry["id"]
+
+    def store(self, parent_id, name, folder_id):
+        with self._lock:
+            self._entries[f"{parent_id}/{name}"] = {
+                "parent": parent_id, "name": name, "id": folder_id, "cached_at": time.time()
+            }
+            if len(self._entries) > self.max_entries:
+                oldest = sorted(self._entries, key=lambda k: self._entries[k]["cached_at"])
+                for key in oldest[:len(self._entries) - self.max_entries]:
+                    del self._entries[key]
+            self._save(self._entries)
+
+    def invalidate(self, folder_id):
+        """Forget folder_id and every cached folder below it."""
+        with self._lock:
+            stale = {folder_id}
+            removed = False
+            while True:
+                keys = [k for k, e in self._entries.items() if e["id"] in stale or e["parent"] in stale]
+                if not keys:
+                    break
+                for key in keys:
+                    stale.add(self._entries.pop(key)["id"])
+                removed = True
+            if removed:
+                self._save(self._entries)
@@ -1,25 +1,25 @@
 import sys
-import os
-import io
-import csv
 import threading
-import time
 from datetime import datetime, timedelta
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QLineEdit, QTextEdit, QCheckBox, QMessageBox,
     QTabWidget, QFileDialog, QListWidget, QListWidgetItem, QDialog,
     QDialogButtonBox, QGridLayout, QTimeEdit, QGroupBox, QFormLayout,
-    QDateTimeEdit, QDateEdit
+    QDateTimeEdit, QDateEdit, QSpinBox, QComboBox
 )
-from PyQt5.QtCore import Qt, QTime, QDate
-from googleapiclient.http import MediaIoBaseUpload
-from Google import Create_Service
-import mysql.connector
+from PyQt5.QtCore import Qt, QTime, QDate, QTimer, pyqtSignal
+from DBHelpers import DEFAULT_DELETE_CHUNK
+from DriveHelpers import STREAM_CHUNK_SIZE
+from ExportFormats import EXPORT_FORMATS
+from SyncEngine import SyncEngine, make_options, timestamped_log
+from SyncLog import LogSink
+from SyncScheduler import IntervalTrigger, parse_trigger
 
-
-def timestamped_log(msg):
-    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}"
+LOG_FLUSH_MS = 200
+LOG_MAX_LINES = 5000
+PROGRESS_REFRESH_MS = 1000
+SCHEDULE_RETRY_SECONDS = 60
 
 
 class AddScheduleTimeDialog(QDialog):
@@ -44,59 +44,63 @@ class AddScheduleTimeDialog(QDialog):
 
 
 class DriveMySQLUploader(QMainWindow):
+    # (email, error) from the background authentication thread
+    auth_finished = pyqtSignal(str, str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("MySQL to Google Drive Uploader")
         self.setGeometry(150, 100, 1000, 700)
 
-        self.tables_and_queries = {
-            "result": "SELECT * FROM `result`;",
-            "st01 loading": "SELECT * FROM `st01 loading`;",
-            "st03 pre0 data": "SELECT * FROM `st03 pre0 data`;",
-            "st03 pre data": "SELECT * FROM `st03 pre data`;",
-            "st04 fs0 data":"SELECT * FROM `st04 fs0 data`;",
-            "st04 fs1 data": "SELECT * FROM `st04 fs1 data`;",
-            "st04 fs data": "SELECT * FROM `st04 fs data`;",
-            "st05 fs0 data": "SELECT * FROM `st05 fs0 data`;",
-            "st05 fs1 data": "SELECT * FROM `st05 fs1 data`;",
-            "st05 fs data": "SELECT * FROM `st05 fs data`;",
-            "st06 fs0 data": "SELECT * FROM `st06 fs0 data`;",
-            "st06 fs1 data": "SELECT * FROM `st06 fs1 data`;",
-            "st06 fs data": "SELECT * FROM `st06 fs data`;",
-            "st07 gap": "SELECT * FROM `st07 gap`;",
-            "st07 illumination": "SELECT * FROM `st07 illumination`;",
-            "st08 pin data": "SELECT * FROM `st08 pin data`;",
-            "st09 laser": "SELECT * FROM `st09 laser`;",
-            "st10 scaner": "SELECT * FROM `st10 scaner`;",
-            "sws data": "SELECT * FROM `sws data`;",
-        }
-
-        self.service = None
-        try:
-            self.service = self.authenticate_drive()
-        except SystemExit:
-            raise
+        self.engine = SyncEngine()
+        self.tables_and_queries = self.engine.tables_and_queries
+        self.log_sink = LogSink()
 
-        self.auto_sync_thread = None
-        self.auto_sync_stop_flag = threading.Event()
-        self.schedule_threads = []
-        self.schedule_stop_flags = []
+        self.scheduler = None
+        self.metrics_server = None
 
         self.init_ui()
+        # Workers only queue log lines; the GUI thread appends them in batches.
+        self.log_widgets = {"manual": self.manual_log, "auto": self.auto_log}
+        for widget in self.log_widgets.values():
+            widget.document().setMaximumBlockCount(LOG_MAX_LINES)
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_logs)
+        self.log_timer.start(LOG_FLUSH_MS)
+        # Rows, rates and ETA of the tables being exported, next to the status.
+        self.progress_label = QLabel()
+        self.statusBar().addPermanentWidget(self.progress_label)
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.refresh_progress)
+        self.progress_timer.start(PROGRESS_REFRESH_MS)
+        # Show the window right away; Drive calls wait until this finishes.
+        self.statusBar().showMessage("Connecting to Google Drive...")
+        self.auth_finished.connect(self.on_authenticated)
+        threading.Thread(target=self.authenticate_drive, daemon=True).start()
 
     def authenticate_drive(self):
-        CLIENT_SECRET_FILE = "credentials.json"
-        API_NAME = "drive"
-        API_VERSION = "v3"
-        SCOPES = ["https://www.googleapis.com/auth/drive"]
         try:
-            service = Create_Service(CLIENT_SECRET_FILE, API_NAME, API_VERSION, SCOPES)
-            about = service.about().get(fields="user(emailAddress)").execute()
-            self.statusBar().showMessage(f"Authenticated as: {about['user']['emailAddress']}")
-            return service
+            email = self.engine.authenticate()
         except Exception as e:
-            QMessageBox.critical(self, "Google Drive Authentication Error", str(e))
-            sys.exit(1)
+            self.auth_finished.emit("", str(e))
+            return
+        self.auth_finished.emit(email, "")
+        self.engine.resume_interrupted_uploads(self.log_auto)
+
+    def on_authenticated(self, email, error):
+        if error:
+            QMessageBox.critical(self, "Google Drive Authentication Error", error)
+            QApplication.exit(1)
+            return
+        self.statusBar().showMessage(f"Authenticated as: {email}")
+
+    def refresh_progress(self):
+        lines = self.engine.progress.lines()
+        text = lines[0] if lines else ""
+        if len(lines) > 1:
+            text += f"  (+{len(lines) - 1} more)"
+        self.progress_label.setText(text)
+        self.progress_label.setToolTip("\n".join(lines))
 
     def init_ui(self):
         self.tabs = QTabWidget()
@@ -168,7 +172,7 @@ class DriveMySQLUploader(QMainWindow):
         layout.addWidget(self.manual_query)
 
         fn_layout = QHBoxLayout()
-        fn_layout.addWidget(QLabel("Custom File Name (with .csv):"))
+        fn_layout.addWidget(QLabel("Custom File Name (with extension):"))
         self.manual_file_name = QLineEdit()
         fn_layout.addWidget(self.manual_file_name)
         layout.addLayout(fn_layout)
@@ -184,8 +188,47 @@ class DriveMySQLUploader(QMainWindow):
         self.manual_drive_folder_id = QLineEdit()
         layout.addWidget(self.manual_drive_folder_id)
 
+        delete_layout = QHBoxLayout()
         self.manual_delete_checkbox = QCheckBox("Delete rows after upload")
-        layout.addWidget(self.manual_delete_checkbox)
+        self.manual_delete_chunk, self.manual_delete_pause = self.delete_tuning_spinboxes()
+        delete_layout.addWidget(self.manual_delete_checkbox)
+        delete_layout.addWidget(QLabel("Rows per delete:"))
+        delete_layout.addWidget(self.manual_delete_chunk)
+        delete_layout.addWidget(QLabel("Pause between deletes:"))
+        delete_layout.addWidget(self.manual_delete_pause)
+        layout.addLayout(delete_layout)
+
+        self.manual_stream_checkbox = QCheckBox("Stream export (low memory)")
+        self.manual_stream_checkbox.setChecked(True)
+        layout.addWidget(self.manual_stream_checkbox)
+
+        self.manual_bundle_checkbox = QCheckBox("Bundle selected tables into one .zip upload (with manifest)")
+        self.manual_bundle_checkbox.toggled.connect(self.update_custom_file_name_state)
+        layout.addWidget(self.manual_bundle_checkbox)
+
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Output format:"))
+        self.manual_format = self.format_combobox()
+        format_layout.addWidget(self.manual_format)
+        self.manual_split_by, self.manual_split_size, self.manual_part_uploads = self.split_controls()
+        format_layout.addWidget(QLabel("Split into parts by:"))
+        format_layout.addWidget(self.manual_split_by)
+        format_layout.addWidget(self.manual_split_size)
+        format_layout.addWidget(QLabel("Parallel part uploads:"))
+        format_layout.addWidget(self.manual_part_uploads)
+        format_layout.addStretch()
+        layout.addLayout(format_layout)
+
+        resumable_layout = QHBoxLayout()
+        self.manual_resumable_checkbox = QCheckBox("Resumable upload (survives restarts)")
+        self.manual_chunk_size = self.chunk_size_spinbox()
+        resumable_layout.addWidget(self.manual_resumable_checkbox)
+        resumable_layout.addWidget(QLabel("Chunk size:"))
+        resumable_layout.addWidget(self.manual_chunk_size)
+        resumable_layout.addWidget(QLabel("Parallel tables:"))
+        self.manual_workers = self.workers_spinbox()
+        resumable_layout.addWidget(self.manual_workers)
+        layout.addLayout(resumable_layout)
 
         btn_upload = QPushButton("Upload Now (Manual)")
         btn_upload.clicked.connect(self.manual_upload_clicked)
@@ -203,6 +246,64 @@ class DriveMySQLUploader(QMainWindow):
         widget.setLayout(layout)
         return widget
 
+    def chunk_size_spinbox(self):
+        spin = QSpinBox()
+        spin.setRange(1, 256)
+        spin.setSuffix(" MB")
+        spin.setValue(STREAM_CHUNK_SIZE // (1024 * 1024))
+        return spin
+
+    def delete_tuning_spinboxes(self):
+        chunk = QSpinBox()
+        chunk.setRange(100, 100000)
+        chunk.setSingleStep(1000)
+        chunk.setValue(DEFAULT_DELETE_CHUNK)
+        pause = QSpinBox()
+        pause.setRange(0, 10000)
+        pause.setSingleStep(50)
+        pause.setSuffix(" ms")
+        return chunk, pause
+
+    def format_combobox(self):
+        combo = QComboBox()
+        combo.addItems(list(EXPORT_FORMATS))
+        return combo
+
+    def split_controls(self):
+        """Split mode combo, rows/MB per part spinbox and parallel part uploads spinbox."""
+        combo = QComboBox()
+        combo.addItem("off", None)
+        combo.addItem("rows", "rows")
+        combo.addItem("MB", "mb")
+        combo.addItem("hour", "hour")
+        combo.addItem("day", "day")
+        size = QSpinBox()
+        size.setRange(1, 100000000)
+        size.setValue(1000000)
+        uploads = self.workers_spinbox()
+        uploads.setValue(3)
+
+        def update(index):
+            mode = combo.itemData(index)
+            size.setEnabled(mode in ("rows", "mb"))
+            uploads.setEnabled(mode is not None)
+            if mode == "rows":
+                size.setSuffix(" rows")
+                size.setValue(1000000)
+            elif mode == "mb":
+                size.setSuffix(" MB")
+                size.setValue(256)
+
+        combo.currentIndexChanged.connect(update)
+        update(0)
+        return combo, size, uploads
+
+    def workers_spinbox(self):
+        spin = QSpinBox()
+        spin.setRange(1, 16)
+        spin.setValue(4)
+        return spin
+
     def toggle_custom_sql(self, checked):
         self.manual_query.setEnabled(checked)
         self.manual_tables_list_widget.setEnabled(not checked)
@@ -216,25 +317,27 @@ class DriveMySQLUploader(QMainWindow):
                 1 for i in range(self.manual_tables_list_widget.count())
                 if self.manual_tables_list_widget.item(i).checkState() == Qt.Checked
             )
-            self.manual_file_name.setEnabled(selected_count == 1)
+            # A bundle of several tables is one file, so it can be named too.
+            self.manual_file_name.setEnabled(selected_count == 1 or self.manual_bundle_checkbox.isChecked())
 
     def manual_upload_clicked(self):
         threading.Thread(target=self._manual_upload_worker, daemon=True).start()
 
     def _manual_upload_worker(self):
         try:
+            options = self.manual_options()
             if self.btn_enable_sql.isChecked():
                 query = self.manual_query.toPlainText().strip()
                 if not query:
-                    self.log_append(self.manual_log, timestamped_log("⚠️ Custom SQL is empty."))
+                    self.log_manual(timestamped_log("⚠️ Custom SQL is empty."))
                     return
-                self.process_manual_upload(query, "custom_query")
+                self.engine.process_manual_upload(query, "custom_query", options, self.log_manual)
             else:
                 selected_tables = [self.manual_tables_list_widget.item(i).text()
                                    for i in range(self.manual_tables_list_widget.count())
                                    if self.manual_tables_list_widget.item(i).checkState() == Qt.Checked]
                 if not selected_tables:
-                    self.log_append(self.manual_log, timestamped_log("⚠️ No tables selected for upload."))
+                    self.log_manual(timestamped_log("⚠️ No tables selected for upload."))
                     return
 
                 start_dt = datetime.combine(self.manual_start_date.date().toPyDate(),
@@ -243,57 +346,37 @@ class DriveMySQLUploader(QMainWindow):
                                           self.manual_end_time.time().toPyTime())
                 start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
                 end_str = end_dt.strftime("%Y-%m-%d %H:%M:%S")
-
-                for table in selected_tables:
-                    query = f"SELECT * FROM `{table}` WHERE Date_Time BETWEEN '{start_str}' AND '{end_str}';"
-                    self.process_manual_upload(query, table)
+                self.engine.run_manual_tables(selected_tables, start_str, end_str, options, self.log_manual)
         except Exception as e:
-            self.log_append(self.manual_log, timestamped_log(f"❌ Manual upload error: {e}"))
-
-    def process_manual_upload(self, query, table_name):
-        self.log_append(self.manual_log, timestamped_log(f"🔍 Fetching data for {table_name}..."))
-        data = self.fetch_data_from_db(
-            self.manual_db_host.text().strip(),
-            self.manual_db_user.text().strip(),
-            self.manual_db_pass.text(),
-            self.manual_db_name.text().strip(),
-            query
-        )
-        if not data or len(data) <= 1:
-            self.log_append(self.manual_log, timestamped_log(f"⚠️ No data found for {table_name}."))
-            return
-        self.log_append(self.manual_log, timestamped_log(f"📄 Preparing CSV for {table_name}..."))
-        csv_buffer = self.convert_data_to_csv(data)
-        if self.manual_drive_folder_id.text().strip():
-            target_folder_id = self.manual_drive_folder_id.text().strip()
-        else:
-            manual_root_id = self.get_or_create_folder("Manual", "root")
-            if self.manual_optional_subfolder_checkbox.isChecked():
-                sub = self.manual_optional_subfolder_name.text().strip()
-                if sub:
-                    manual_root_id = self.get_or_create_folder(sub, manual_root_id)
-            target_folder_id = manual_root_id
-
+            self.log_manual(timestamped_log(f"❌ Manual upload error: {e}"))
+
+    def manual_options(self):
+        """Snapshot the Manual tab settings for the engine."""
+        subfolder = None
+        if self.manual_optional_subfolder_checkbox.isChecked():
+            subfolder = self.manual_optional_subfolder_name.text().strip() or None
+        file_name = None
         if self.manual_file_name.isEnabled():
-            filename = self.manual_file_name.text().strip()
-            if not filename:
-                filename = f"{table_name.replace(' ', '_').lower()}.csv"
-        else:
-            filename = f"{table_name.replace(' ', '_').lower()}.csv"
-
-        self.log_append(self.manual_log, timestamped_log(f"⬆️ Uploading file '{filename}' to Google Drive..."))
-        self.upload_file_to_drive(filename, csv_buffer, target_folder_id)
-        self.log_append(self.manual_log, timestamped_log(f"✅ Uploaded {filename} to Manual folder."))
-
-        if self.manual_delete_checkbox.isChecked():
-            self.delete_uploaded_rows(
-                self.manual_db_host.text().strip(),
-                self.manual_db_user.text().strip(),
-                self.manual_db_pass.text(),
-                self.manual_db_name.text().strip(),
-                table_name
-            )
-            self.log_append(self.manual_log, timestamped_log(f"🗑️ Deleted rows from table {table_name} after upload."))
+            file_name = self.manual_file_name.text().strip() or None
+        return make_options(
+            db_args=(self.manual_db_host.text().strip(), self.manual_db_user.text().strip(),
+                     self.manual_db_pass.text(), self.manual_db_name.text().strip()),
+            stream=self.manual_stream_checkbox.isChecked(),
+            format=self.manual_format.currentText(),
+            resumable=self.manual_resumable_checkbox.isChecked(),
+            chunk_size=self.manual_chunk_size.value() * 1024 * 1024,
+            workers=self.manual_workers.value(),
+            split_by=self.manual_split_by.currentData(),
+            split_size=self.manual_split_size.value(),
+            part_uploads=self.manual_part_uploads.value(),
+            delete=self.manual_delete_checkbox.isChecked(),
+            delete_chunk=self.manual_delete_chunk.value(),
+            delete_pause=self.manual_delete_pause.value() / 1000,
+            folder_id=self.manual_drive_folder_id.text().strip() or None,
+            subfolder=subfolder,
+            file_name=file_name,
+            bundle=self.manual_bundle_checkbox.isChecked(),
+        )
 
     # ---------------- Auto Upload Tab ----------------
     def auto_upload_tab(self):
@@ -303,6 +386,9 @@ class DriveMySQLUploader(QMainWindow):
         form = QGroupBox("Database Connection")
         form_layout = QFormLayout()
         self.auto_db_host = QLineEdit()
+        self.auto_db_host.setPlaceholderText("one host, or several separated by commas")
+        self.auto_db_host.setToolTip("With several hosts every run exports all of them concurrently, "
+                                     "each into its own folder named after the host")
         self.auto_db_user = QLineEdit()
         self.auto_db_pass = QLineEdit()
         self.auto_db_pass.setEchoMode(QLineEdit.Password)
@@ -321,6 +407,17 @@ class DriveMySQLUploader(QMainWindow):
         form.setLayout(form_layout)
         layout.addWidget(form)
 
+        self.auto_incremental_checkbox = QCheckBox("Incremental sync (only rows newer than the last upload)")
+        self.auto_incremental_checkbox.setChecked(True)
+        layout.addWidget(self.auto_incremental_checkbox)
+
+        self.auto_skip_unchanged_checkbox = QCheckBox("Skip tables unchanged since their last upload (full sync only)")
+        self.auto_skip_unchanged_checkbox.setChecked(True)
+        self.auto_incremental_checkbox.toggled.connect(
+            lambda checked: self.auto_skip_unchanged_checkbox.setEnabled(not checked))
+        self.auto_skip_unchanged_checkbox.setEnabled(False)
+        layout.addWidget(self.auto_skip_unchanged_checkbox)
+
         layout.addWidget(QLabel("Select Tables to Upload:"))
         self.tables_list_widget = QListWidget()
         for table_name in self.tables_and_queries.keys():
@@ -357,6 +454,15 @@ class DriveMySQLUploader(QMainWindow):
         btn_add_schedule.clicked.connect(self.open_schedule_time_dialog)
         schedule_layout.addWidget(btn_add_schedule)
 
+        cron_layout = QHBoxLayout()
+        self.cron_expression = QLineEdit()
+        self.cron_expression.setPlaceholderText("Cron: minute hour day month weekday, e.g. */30 6-18 * * 1-5")
+        btn_add_cron = QPushButton("Add Cron Expression")
+        btn_add_cron.clicked.connect(self.add_cron_expression)
+        cron_layout.addWidget(self.cron_expression)
+        cron_layout.addWidget(btn_add_cron)
+        schedule_layout.addLayout(cron_layout)
+
         self.schedule_times_list = QListWidget()
         schedule_layout.addWidget(self.schedule_times_list)
 
@@ -367,8 +473,54 @@ class DriveMySQLUploader(QMainWindow):
         self.schedule_widget.setLayout(schedule_layout)
         layout.addWidget(self.schedule_widget)
 
+        delete_layout = QHBoxLayout()
         self.auto_delete_checkbox = QCheckBox("Delete rows after upload")
-        layout.addWidget(self.auto_delete_checkbox)
+        self.auto_delete_chunk, self.auto_delete_pause = self.delete_tuning_spinboxes()
+        delete_layout.addWidget(self.auto_delete_checkbox)
+        delete_layout.addWidget(QLabel("Rows per delete:"))
+        delete_layout.addWidget(self.auto_delete_chunk)
+        delete_layout.addWidget(QLabel("Pause between deletes:"))
+        delete_layout.addWidget(self.auto_delete_pause)
+        layout.addLayout(delete_layout)
+
+        self.auto_stream_checkbox = QCheckBox("Stream export (low memory)")
+        self.auto_stream_checkbox.setChecked(True)
+        layout.addWidget(self.auto_stream_checkbox)
+
+        self.auto_outbox_checkbox = QCheckBox("Queue exports in a local outbox and upload them separately")
+        layout.addWidget(self.auto_outbox_checkbox)
+
+        format_layout = QHBoxLayout()
+        format_layout.addWidget(QLabel("Output format:"))
+        self.auto_format = self.format_combobox()
+        format_layout.addWidget(self.auto_format)
+        self.auto_split_by, self.auto_split_size, self.auto_part_uploads = self.split_controls()
+        format_layout.addWidget(QLabel("Split into parts by:"))
+        format_layout.addWidget(self.auto_split_by)
+        format_layout.addWidget(self.auto_split_size)
+        format_layout.addWidget(QLabel("Parallel part uploads:"))
+        format_layout.addWidget(self.auto_part_uploads)
+        format_layout.addStretch()
+        layout.addLayout(format_layout)
+
+        resumable_layout = QHBoxLayout()
+        self.auto_resumable_checkbox = QCheckBox("Resumable upload (survives restarts)")
+        self.auto_chunk_size = self.chunk_size_spinbox()
+        resumable_layout.addWidget(self.auto_resumable_checkbox)
+        resumable_layout.addWidget(QLabel("Chunk size:"))
+        resumable_layout.addWidget(self.auto_chunk_size)
+        resumable_layout.addWidget(QLabel("Parallel tables:"))
+        self.auto_workers = self.workers_spinbox()
+        resumable_layout.addWidget(self.auto_workers)
+        layout.addLayout(resumable_layout)
+
+        metrics_layout = QHBoxLayout()
+        metrics_layout.addWidget(QLabel("Metrics endpoint port (0 = off):"))
+        self.auto_metrics_port = QSpinBox()
+        self.auto_metrics_port.setRange(0, 65535)
+        metrics_layout.addWidget(self.auto_metrics_port)
+        metrics_layout.addStretch()
+        layout.addLayout(metrics_layout)
 
         btn_start = QPushButton("Start Auto Sync")
         btn_start.clicked.connect(self.start_auto_sync)
@@ -400,15 +552,27 @@ class DriveMySQLUploader(QMainWindow):
     def open_schedule_time_dialog(self):
         dlg = AddScheduleTimeDialog(self)
         if dlg.exec_():
-            t = dlg.selected_time_str()
-            existing = [self.schedule_times_list.item(i).text() for i in range(self.schedule_times_list.count())]
-            if t not in existing:
-                item = QListWidgetItem(t)
-                item.setCheckState(Qt.Checked)
-                self.schedule_times_list.addItem(item)
-                self.log_append(self.auto_log, timestamped_log(f"➕ Added schedule time {t}"))
-            else:
-                self.log_append(self.auto_log, timestamped_log(f"⚠️ Schedule time {t} already exists"))
+            self.add_schedule_entry(dlg.selected_time_str())
+
+    def add_cron_expression(self):
+        expression = " ".join(self.cron_expression.text().split())
+        try:
+            parse_trigger(expression)
+        except ValueError as e:
+            QMessageBox.warning(self, "Input Error", str(e))
+            return
+        self.add_schedule_entry(expression)
+        self.cron_expression.clear()
+
+    def add_schedule_entry(self, t):
+        existing = [self.schedule_times_list.item(i).text() for i in range(self.schedule_times_list.count())]
+        if t not in existing:
+            item = QListWidgetItem(t)
+            item.setCheckState(Qt.Checked)
+            self.schedule_times_list.addItem(item)
+            self.log_auto(timestamped_log(f"➕ Added schedule time {t}"))
+        else:
+            self.log_auto(timestamped_log(f"⚠️ Schedule time {t} already exists"))
 
     def remove_selected_schedule_times(self):
         for item in self.schedule_times_list.selectedItems():
@@ -421,6 +585,7 @@ class DriveMySQLUploader(QMainWindow):
         if not selected_tables:
             QMessageBox.warning(self, "Input Error", "Please select at least one table to upload.")
             return
+        options = self.auto_options()
 
         if self.interval_radio.isChecked():
             qtime = self.auto_interval.time()
@@ -428,17 +593,13 @@ class DriveMySQLUploader(QMainWindow):
             if interval_td.total_seconds() <= 0:
                 QMessageBox.warning(self, "Input Error", "Please enter a valid interval greater than 0 seconds")
                 return
-            if self.auto_sync_thread and self.auto_sync_thread.is_alive():
+            if self.scheduler and self.scheduler.is_running():
                 QMessageBox.information(self, "Info", "Auto Sync is already running.")
                 return
-            self.auto_sync_stop_flag.clear()
-            self.log_append(self.auto_log, timestamped_log(f"⏳ Starting interval auto sync every {str(interval_td)}..."))
-            self.auto_sync_thread = threading.Thread(
-                target=self.interval_sync_worker,
-                args=(selected_tables, interval_td),
-                daemon=True
-            )
-            self.auto_sync_thread.start()
+            self.log_auto(timestamped_log(f"⏳ Starting interval auto sync every {str(interval_td)}..."))
+            self.scheduler = self.engine.create_scheduler(options, self.log_auto)
+            self.scheduler.add_job("Interval sync", IntervalTrigger(interval_td), selected_tables,
+                                   retry_seconds=SCHEDULE_RETRY_SECONDS)
         else:
             schedule_times = [self.schedule_times_list.item(i).text()
                               for i in range(self.schedule_times_list.count())
@@ -446,187 +607,87 @@ class DriveMySQLUploader(QMainWindow):
             if not schedule_times:
                 QMessageBox.warning(self, "Input Error", "Please select at least one schedule time.")
                 return
-            self.stop_schedule_syncs()
-            self.schedule_stop_flags = []
-            self.schedule_threads = []
+            self.stop_scheduler()
+            self.scheduler = self.engine.create_scheduler(options, self.log_auto)
             for st in schedule_times:
-                stop_flag = threading.Event()
-                self.schedule_stop_flags.append(stop_flag)
-                thread = threading.Thread(target=self.schedule_worker,
-                                          args=(selected_tables, st, stop_flag),
-                                          daemon=True)
-                self.schedule_threads.append(thread)
-                thread.start()
-            self.log_append(self.auto_log, timestamped_log(f"✅ Scheduled sync will run at: {', '.join(schedule_times)} for tables: {', '.join(selected_tables)}"))
+                self.scheduler.add_job("Scheduled sync", parse_trigger(st), selected_tables,
+                                       retry_seconds=SCHEDULE_RETRY_SECONDS)
+            self.log_auto(timestamped_log(f"✅ Scheduled sync will run at: {', '.join(schedule_times)} for tables: {', '.join(selected_tables)}"))
+        self.start_metrics_server()
+        self.scheduler.start()
+
+    def start_metrics_server(self):
+        port = self.auto_metrics_port.value()
+        if self.metrics_server and self.metrics_server.port == port:
+            return
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if not port:
+            return
+        try:
+            self.metrics_server = self.engine.start_metrics_server(port)
+        except OSError as e:
+            self.log_auto(timestamped_log(f"⚠️ Could not start the metrics endpoint on port {port}: {e}"))
+            return
+        self.log_auto(timestamped_log(f"📈 Metrics at http://127.0.0.1:{port}/metrics"))
 
     def stop_auto_sync(self):
-        self.log_append(self.auto_log, timestamped_log("🛑 Stopping auto sync..."))
-        self.auto_sync_stop_flag.set()
-        self.stop_schedule_syncs()
-
-    def stop_schedule_syncs(self):
-        for flag in self.schedule_stop_flags:
-            flag.set()
-        for thread in self.schedule_threads:
-            thread.join(timeout=1)
-        self.schedule_stop_flags = []
-        self.schedule_threads = []
-
-    def interval_sync_worker(self, selected_tables, interval_td):
-        self.log_append(self.auto_log, timestamped_log("▶️ Interval sync worker started."))
-        while not self.auto_sync_stop_flag.is_set():
-            try:
-                self.log_append(self.auto_log, timestamped_log("▶️ Running interval sync..."))
-                self.run_all_queries(selected_tables, auto_mode=True)
-                self.log_append(self.auto_log, timestamped_log("✅ Interval sync iteration completed."))
-            except Exception as e:
-                self.log_append(self.auto_log, timestamped_log(f"❌ Interval sync error: {e}"))
-            wait_seconds = int(interval_td.total_seconds())
-            while wait_seconds > 0 and not self.auto_sync_stop_flag.is_set():
-                time.sleep(min(wait_seconds, 1))
-                wait_seconds -= 1
-        self.log_append(self.auto_log, timestamped_log("🛑 Interval sync worker stopped."))
-
-    def schedule_worker(self, selected_tables, schedule_time_str, stop_flag):
-        self.log_append(self.auto_log, timestamped_log(f"⏳ Schedule worker started for {schedule_time_str}"))
-        while not stop_flag.is_set():
-            now = datetime.now()
-            target_today = datetime.strptime(schedule_time_str, "%H:%M:%S").replace(
-                year=now.year, month=now.month, day=now.day
-            )
-            target_time = target_today
-            if now >= target_time:
-                target_time = target_today + timedelta(days=1)
-            wait_seconds = int((target_time - now).total_seconds())
-            wait_time_str = str(timedelta(seconds=wait_seconds))
-            self.log_append(self.auto_log, timestamped_log(f"⏳ Waiting {wait_time_str} seconds until scheduled sync at {schedule_time_str}"))
-            while wait_seconds > 0 and not stop_flag.is_set():
-                time.sleep(min(wait_seconds, 1))
-                wait_seconds -= 1
-            if stop_flag.is_set():
-                self.log_append(self.auto_log, timestamped_log("🛑 Scheduled sync stopped before running."))
-                return
-            while not stop_flag.is_set():
-                try:
-                    self.log_append(self.auto_log, timestamped_log(f"▶️ Running scheduled sync for tables: {', '.join(selected_tables)}"))
-                    self.run_all_queries(selected_tables, auto_mode=True)
-                    self.log_append(self.auto_log, timestamped_log("✅ Scheduled sync completed successfully."))
-                    break
-                except Exception as e:
-                    self.log_append(self.auto_log, timestamped_log(f"❌ Scheduled sync error: {e}. Retrying in 60 seconds..."))
-                retry_wait = 60
-                while retry_wait > 0 and not stop_flag.is_set():
-                    time.sleep(min(retry_wait, 1))
-                    retry_wait -= 1
-
-    def run_all_queries(self, selected_tables, auto_mode=False):
-        ts_folder_name = datetime.now().strftime("%Y%m%d%H%M%S")
-        root_folder_id = "root"
-        auto_root_id = self.get_or_create_folder("Auto", root_folder_id)
-        year_str = datetime.now().strftime("%Y")
-        year_folder_id = self.get_or_create_folder(year_str, auto_root_id)
-        date_str = datetime.now().strftime("%Y%m%d")
-        date_folder_id = self.get_or_create_folder(date_str, year_folder_id)
-        timestamp_folder_id = self.get_or_create_folder(ts_folder_name, date_folder_id)
-        self.log_append(self.auto_log, timestamped_log(f"Using Drive folder structure: Auto/{year_str}/{date_str}/{ts_folder_name}"))
-
-        for table in selected_tables:
-            query = self.tables_and_queries.get(table)
-            if not query:
-                self.log_append(self.auto_log, timestamped_log(f"⚠️ No query found for table {table}, skipping..."))
-                continue
-            if auto_mode:
-                start_date_str = self.auto_start_date.date().toString("yyyy-MM-dd")
-                query = f"SELECT * FROM `{table}` WHERE Date_Time >= '{start_date_str}';"
-            csv_file_name = f"{table.replace(' ', '_').lower()}.csv"
-            try:
-                self.log_append(self.auto_log, timestamped_log(f"⏳ Processing table '{table}'..."))
-                data = self.fetch_data_from_db(
-                    self.auto_db_host.text().strip(),
-                    self.auto_db_user.text().strip(),
-                    self.auto_db_pass.text(),
-                    self.auto_db_name.text().strip(),
-                    query
-                )
-                if not data or len(data) <= 1:
-                    self.log_append(self.auto_log, timestamped_log(f"⚠️ No data found for table {table}, skipping upload."))
-                    continue
-                csv_buffer = self.convert_data_to_csv(data)
-                self.upload_file_to_drive(csv_file_name, csv_buffer, timestamp_folder_id)
-                self.log_append(self.auto_log, timestamped_log(f"✅ Uploaded {csv_file_name} to Drive."))
-
-                if self.auto_delete_checkbox.isChecked():
-                    self.delete_uploaded_rows(
-                        self.auto_db_host.text().strip(),
-                        self.auto_db_user.text().strip(),
-                        self.auto_db_pass.text(),
-                        self.auto_db_name.text().strip(),
-                        table
-                    )
-                    self.log_append(self.auto_log, timestamped_log(f"🗑️ Deleted rows from table {table} after upload."))
-            except Exception as e:
-                self.log_append(self.auto_log, timestamped_log(f"❌ Error processing table {table}: {e}"))
-                raise
-
-    # ---------------- DB and Drive helpers ----------------
-    def fetch_data_from_db(self, host, user, password, dbname, query):
-        conn = None
-        try:
-            conn = mysql.connector.connect(host=host, user=user, password=password, database=dbname)
-            cursor = conn.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description]
-            result = [columns] + list(rows)
-            return result
-        finally:
-            if conn:
-                conn.close()
-
-    def convert_data_to_csv(self, data):
-        output = io.StringIO()
-        writer = csv.writer(output)
-        for row in data:
-            writer.writerow(row)
-        text = output.getvalue()
-        byte_buf = io.BytesIO(text.encode("utf-8"))
-        byte_buf.seek(0)
-        return byte_buf
-
-    def upload_file_to_drive(self, file_name, file_buffer, folder_id):
-        file_metadata = {"name": file_name, "parents": [folder_id]}
-        media = MediaIoBaseUpload(file_buffer, mimetype="text/csv")
-        res = self.service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-        return res
-
-    def delete_uploaded_rows(self, host, user, password, dbname, table_name):
-        conn = mysql.connector.connect(host=host, user=user, password=password, database=dbname)
-        cursor = conn.cursor()
-        cursor.execute(f"DELETE FROM `{table_name}`;")
-        conn.commit()
-        conn.close()
-
-    def get_or_create_folder(self, folder_name, parent_id):
-        safe_name = folder_name.replace("'", "\\'")
-        query = f"mimeType='application/vnd.google-apps.folder' and name='{safe_name}' and '{parent_id}' in parents and trashed=false"
-        results = self.service.files().list(q=query, fields="files(id, name)").execute()
-        files = results.get("files", [])
-        if files:
-            return files[0]["id"]
-        file_metadata = {"name": folder_name, "mimeType": "application/vnd.google-apps.folder", "parents": [parent_id]}
-        folder = self.service.files().create(body=file_metadata, fields="id").execute()
-        return folder["id"]
-
-    def log_append(self, widget, msg):
-        widget.append(msg)
-        widget.verticalScrollBar().setValue(widget.verticalScrollBar().maximum())
+        self.log_auto(timestamped_log("🛑 Stopping auto sync..."))
+        self.stop_scheduler()
+
+    def stop_scheduler(self):
+        if self.scheduler:
+            self.scheduler.stop()
+            self.scheduler = None
+
+    def auto_options(self):
+        """Snapshot the Auto tab settings; a running sync keeps using them."""
+        hosts = list(dict.fromkeys(host.strip() for host in self.auto_db_host.text().split(",") if host.strip()))
+        credentials = (self.auto_db_user.text().strip(), self.auto_db_pass.text(), self.auto_db_name.text().strip())
+        return make_options(
+            db_args=(hosts[0] if hosts else "",) + credentials,
+            sources=[{"name": host, "db_args": (host,) + credentials} for host in hosts] if len(hosts) > 1 else (),
+            start_date=self.auto_start_date.date().toString("yyyy-MM-dd"),
+            incremental=self.auto_incremental_checkbox.isChecked(),
+            skip_unchanged=self.auto_skip_unchanged_checkbox.isChecked(),
+            stream=self.auto_stream_checkbox.isChecked(),
+            format=self.auto_format.currentText(),
+            resumable=self.auto_resumable_checkbox.isChecked(),
+            chunk_size=self.auto_chunk_size.value() * 1024 * 1024,
+            workers=self.auto_workers.value(),
+            split_by=self.auto_split_by.currentData(),
+            split_size=self.auto_split_size.value(),
+            part_uploads=self.auto_part_uploads.value(),
+            outbox=self.auto_outbox_checkbox.isChecked(),
+            delete=self.auto_delete_checkbox.isChecked(),
+            delete_chunk=self.auto_delete_chunk.value(),
+            delete_pause=self.auto_delete_pause.value() / 1000,
+        )
+
+    def log_manual(self, msg):
+        self.log_sink.emit("manual", msg)
+
+    def log_auto(self, msg):
+        self.log_sink.emit("auto", msg)
+
+    def flush_logs(self):
+        batches = {}
+        for event in self.log_sink.drain():
+            batches.setdefault(event.channel, []).append(event.message)
+        for channel, lines in batches.items():
+            widget = self.log_widgets[channel]
+            widget.append("\n".join(lines[-LOG_MAX_LINES:]))
+            widget.verticalScrollBar().setValue(widget.verticalScrollBar().maximum())
 
 
 def main():
     app = QApplication(sys.argv)
     win = DriveMySQLUploader()
     win.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    win.log_sink.close()
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
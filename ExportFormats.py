@@ -0,0 +1,427 @@
+import csv
+import io
+import re
+import tempfile
+import zipfile
+import zlib
+from collections import namedtuple
+from decimal import Decimal
+
+from DBHelpers import RangeTracker
+
+# format name -> (file extension, Drive mimetype)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+PARQUET_ROW_GROUP_ROWS = 100000
+# How an export can be split into parts; "rows" and "mb" take a size.
+SPLIT_MODES = ("rows", "mb", "hour", "day")
+# Parts up to this size are spooled in memory, larger ones on disk.
+PART_SPOOL_MEMORY = 32 * 1024 * 1024
+# Formats that can encode the bytes of a raw cursor without converting them.
+RAW_FORMATS = ("csv", "csv.gz")
+# Several tables exported as one archive (see iter_zip_chunks).
+BUNDLE_EXTENSION = ".zip"
+BUNDLE_MIMETYPE = "application/zip"
+# Bundle members with these extensions are compressed already and stored as is.
+_COMPRESSED_EXTENSIONS = (".gz", ".parquet")
+# A CSV field containing one of these must be quoted (csv.QUOTE_MINIMAL).
+_RAW_CSV_SPECIAL = re.compile(rb'[",\r\n]')
+
+# number counts from 1; body is a file object positioned at 0; stats is a
+# RangeTracker that saw only this part's rows.
+ExportPart = namedtuple("ExportPart", "number body size stats")
+
+
+def export_file_name(base_name, fmt):
+    return base_name + EXPORT_FORMATS[fmt][0]
+
+
+def part_file_name(base_name, fmt, number):
+    """``table.part-0001.csv`` style name of part number of an export."""
+    return f"{base_name}.part-{number:04d}{EXPORT_FORMATS[fmt][0]}"
+
+
+def strip_export_extension(file_name, fmt):
+    extension = EXPORT_FORMATS[fmt][0]
+    return file_name[:-len(extension)] if file_name.endswith(extension) else file_name
+
+
+def export_mimetype(fmt):
+    return EXPORT_FORMATS[fmt][1]
+
+
+def supports_raw_rows(fmt, split_by=None):
+    """Whether an export can read its rows through a raw cursor.
+
+    Splitting by hour or day needs ``Date_Time`` as a datetime, and Parquet
+    needs typed values, so those keep the converting cursor.
+    """
+    return fmt in RAW_FORMATS and split_by not in ("hour", "day")
+
+
+def iter_export_chunks(fmt, columns, batches, description=None, raw=False):
+    """Encode row batches in the given export format as ``bytes`` chunks.
+
+    raw means the rows come from a raw cursor and hold the server's text
+    bytes; only RAW_FORMATS accept them.
+    """
+    if fmt == "csv":
+        return iter_csv_chunks(columns, batches, description, raw)
+    if fmt == "csv.gz":
+        return iter_gzip_chunks(iter_csv_chunks(columns, batches, description, raw))
+    if fmt == "parquet":
+        if raw:
+            raise ValueError("Parquet export needs typed rows, not a raw cursor")
+        return iter_parquet_chunks(columns, batches, description)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def iter_csv_chunks(columns, batches, description=None, raw=False):
+    """Encode a header row and row batches as UTF-8 CSV.
+
+    Yields one ``bytes`` chunk per batch, so memory stays bounded by the
+    batch size. With ``cursor.description`` every batch is encoded by
+    csv_batch_encoder(); without it rows go through csv.writer.
+    """
+    if description:
+        encode = csv_batch_encoder(description, raw)
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        yield header.getvalue().encode("utf-8")
+        for rows in batches:
+            if rows:
+                yield encode(rows)
+        return
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield text.getvalue().encode("utf-8")
+        text.seek(0)
+        text.truncate(0)
+    if text.tell():
+        yield text.getvalue().encode("utf-8")
+
+
+def _quote_raw_csv(value):
+    return b'"' + bytes(value).replace(b'"', b'""') + b'"' if _RAW_CSV_SPECIAL.search(value) else value
+
+
+def _decode_binary(value):
+    return bytes(value).decode("utf-8", errors="replace")
+
+
+def _csv_converter(desc):
+    """Return the converter csv.writer needs for values of column desc, or None.
+
+    csv.writer already writes numbers (floats as their shortest repr),
+    ISO dates and text the way they should look; decimals are written in
+    fixed point (never ``1E+2``) and binary strings as UTF-8 text rather
+    than as a ``b'...'`` literal.
+    """
+    from mysql.connector.constants import FieldType
+
+    type_code = desc[1]
+    charset = desc[8] if len(desc) > 8 else None
+    if type_code in (FieldType.DECIMAL, FieldType.NEWDECIMAL):
+        return lambda value: format(value, "f")
+    if type_code in (FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB, FieldType.LONG_BLOB, FieldType.BLOB,
+                     FieldType.VAR_STRING, FieldType.STRING, FieldType.VARCHAR) and charset == 63:
+        return lambda value: _decode_binary(value) if isinstance(value, (bytes, bytearray)) else value
+    return None
+
+
+def _raw_csv_converter(desc):
+    """Like _csv_converter() for the text bytes of a raw cursor; None if they are used as they are."""
+    from mysql.connector.constants import FieldType
+
+    type_code = desc[1]
+    charset = desc[8] if len(desc) > 8 else None
+    if type_code in (FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.INT24, FieldType.LONGLONG,
+                     FieldType.YEAR, FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL,
+                     FieldType.DATETIME, FieldType.TIMESTAMP, FieldType.DATE, FieldType.NEWDATE, FieldType.TIME):
+        return None  # numbers and ISO dates: the server's text is already CSV-safe
+    if type_code == FieldType.BIT:
+        return lambda value: b"%d" % int.from_bytes(value, "big")
+    if charset == 63:
+        return lambda value: _quote_raw_csv(_decode_binary(value).encode("utf-8"))
+    return _quote_raw_csv
+
+
+def csv_batch_encoder(description, raw=False):
+    """Build ``encode(rows) -> bytes`` for rows shaped like description.
+
+    The converter of every column is chosen once from its type. Typed rows
+    go through csv.writer, with only the columns it would get wrong
+    converted first. Raw rows from a raw cursor are joined as bytes: numbers
+    and dates are copied as the server sent them, text columns are quoted
+    where needed and NULL is an empty field. Both write what csv.writer
+    writes for the same values.
+    """
+    if not raw:
+        converters = [(i, conv) for i, conv in enumerate(map(_csv_converter, description)) if conv]
+        text = io.StringIO()
+        writer = csv.writer(text)
+
+        def encode_typed(rows):
+            if converters:
+                rows = [_convert_row(row, converters) for row in rows]
+            writer.writerows(rows)
+            data = text.getvalue().encode("utf-8")
+            text.seek(0)
+            text.truncate(0)
+            return data
+
+        return encode_typed
+
+    converters = [(i, conv) for i, conv in enumerate(map(_raw_csv_converter, description)) if conv]
+    # csv.writer quotes a lone empty field, so a blank line is not read back as no row.
+    single = len(description) == 1
+
+    def encode_raw(rows):
+        lines = []
+        append = lines.append
+        for row in rows:
+            values = [b"" if value is None else value for value in row]
+            for i, convert in converters:
+                if values[i]:
+                    values[i] = convert(values[i])
+            if single and not values[0]:
+                values[0] = b'""'
+            append(b",".join(values))
+        append(b"")
+        return b"\r\n".join(lines)
+
+    return encode_raw
+
+
+def _convert_row(row, converters):
+    row = list(row)
+    for i, convert in converters:
+        if row[i] is not None:
+            row[i] = convert(row[i])
+    return row
+
+
+def iter_gzip_chunks(chunks, level=6):
+    """Gzip a stream of byte chunks without holding the whole file."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_zip_chunks(members, level=1):
+    """Zip ``(name, chunks)`` members into a stream of byte chunks.
+
+    Each member is deflated as its chunks arrive, so no member is ever held
+    whole. The archive cannot seek back, so sizes follow every member in a
+    ZIP64 data descriptor. Level 1 deflates CSV about five times faster
+    than the default level for a slightly larger archive. Members opened by
+    name carry no modification time (they show 1980-01-01).
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=level) as archive:
+        for name, chunks in members:
+            # Members opened by name take the archive's compression and level.
+            archive.compression = (zipfile.ZIP_STORED if name.endswith(_COMPRESSED_EXTENSIONS)
+                                   else zipfile.ZIP_DEFLATED)
+            with archive.open(name, "w", force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        # The last member's descriptor is written when it closes.
+        yield sink.drain()
+    yield sink.drain()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained as chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_type(pa, desc):
+    from mysql.connector.constants import FieldType
+
+    type_code = desc[1]
+    charset = desc[8] if len(desc) > 8 else None
+    if type_code in (FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.INT24,
+                     FieldType.LONGLONG, FieldType.YEAR, FieldType.BIT):
+        return pa.int64()
+    if type_code in (FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL, FieldType.NEWDECIMAL):
+        # cursor.description carries no precision, so decimals become doubles.
+        return pa.float64()
+    if type_code in (FieldType.DATETIME, FieldType.TIMESTAMP):
+        return pa.timestamp("us")
+    if type_code in (FieldType.DATE, FieldType.NEWDATE):
+        return pa.date32()
+    if type_code == FieldType.TIME:
+        return pa.duration("us")
+    if type_code in (FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB, FieldType.LONG_BLOB,
+                     FieldType.BLOB, FieldType.GEOMETRY) and charset == 63:
+        return pa.binary()
+    return pa.string()
+
+
+def _arrow_value(value, arrow_type, pa):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)) and arrow_type == pa.string():
+        return value.decode("utf-8", errors="replace")
+    return value
+
+
+def iter_parquet_chunks(columns, batches, description=None, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """Write row batches as a Parquet file and yield its bytes as produced.
+
+    Batches are gathered into row groups of about ``row_group_rows`` rows, so
+    memory is bounded by one row group. Column types come from
+    ``cursor.description`` when given, otherwise pyarrow infers them from the
+    first row group.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(d[0], _arrow_type(pa, d)) for d in description]) if description else None
+    sink = _ChunkSink()
+    writer = None
+    pending = []
+
+    def flush():
+        nonlocal schema, writer
+        values = list(zip(*pending)) if pending else [[] for _ in columns]
+        if schema is None:
+            arrays = [pa.array([_arrow_value(v, None, pa) for v in col]) for col in values]
+            arrays = [a.cast(pa.string()) if pa.types.is_null(a.type) else a for a in arrays]
+            schema = pa.schema([(name, a.type) for name, a in zip(columns, arrays)])
+        else:
+            arrays = [pa.array([_arrow_value(v, field.type, pa) for v in col], type=field.type)
+                      for col, field in zip(values, schema)]
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema, compression="snappy")
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        pending.clear()
+
+    for rows in batches:
+        pending.extend(rows)
+        if len(pending) >= row_group_rows:
+            flush()
+            yield sink.drain()
+    if pending or writer is None:
+        flush()
+    writer.close()
+    yield sink.drain()
+
+
+def _date_bucket(value, split_by):
+    if value is None or not hasattr(value, "date"):
+        return None
+    if split_by == "day":
+        return value.date()
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def iter_export_parts(fmt, columns, batches, description=None, split_by="rows", split_size=1000000,
+                      spool_memory=PART_SPOOL_MEMORY, raw=False):
+    """Encode row batches into several complete files and yield them as ExportPart.
+
+    split_by "rows" starts a new part every split_size rows and "mb" once a
+    part has grown to about split_size MB (checked between batches). "hour"
+    and "day" start a new part whenever the ``Date_Time`` hour or day
+    changes, so rows should arrive ordered by ``Date_Time``; a bucket that
+    shows up again later gets another part. Each part is yielded as soon as
+    it is finished, so it can be uploaded while the next one is encoded.
+    raw rows (see iter_export_chunks) cannot be split by hour or day.
+    """
+    if split_by not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode: {split_by}")
+    lowered = [c.lower() for c in columns]
+    date_idx = lowered.index("date_time") if "date_time" in lowered else None
+    if split_by in ("hour", "day") and date_idx is None:
+        raise ValueError(f"Cannot split by {split_by}: the export has no Date_Time column")
+    max_bytes = split_size * 1024 * 1024
+    source = iter(batches)
+    pushed_back = []
+
+    def next_batch():
+        if pushed_back:
+            return pushed_back.pop()
+        for rows in source:
+            if rows:
+                return rows
+        return None
+
+    number = 0
+    while True:
+        first = next_batch()
+        if first is None:
+            return
+        pushed_back.append(first)
+        number += 1
+        body = tempfile.SpooledTemporaryFile(max_size=spool_memory)
+        size = 0
+
+        def part_batches():
+            taken = 0
+            bucket = _date_bucket(first[0][date_idx], split_by) if date_idx is not None else None
+            while True:
+                if split_by == "mb" and taken and size >= max_bytes:
+                    return
+                rows = next_batch()
+                if rows is None:
+                    return
+                if split_by == "rows":
+                    cut = split_size - taken
+                elif split_by in ("hour", "day"):
+                    cut = next((i for i, row in enumerate(rows)
+                                if _date_bucket(row[date_idx], split_by) not in (bucket, None)), len(rows))
+                else:
+                    cut = len(rows)
+                if cut < len(rows):
+                    pushed_back.append(rows[cut:])
+                    rows = rows[:cut]
+                if rows:
+                    taken += len(rows)
+                    yield rows
+                if pushed_back:
+                    return
+
+        stats = RangeTracker()
+        stats.set_columns(columns, description if raw else None)
+        for chunk in iter_export_chunks(fmt, columns, stats.track(part_batches()), description, raw):
+            body.write(chunk)
+            size += len(chunk)
+        body.seek(0)
+        yield ExportPart(number, body, size, stats)
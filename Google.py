@@ -7,13 +7,11 @@ from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 from google.auth.transport.requests import Request
 
 
-def Create_Service(client_secret_file, api_name, api_version, *scopes):
-    print(client_secret_file, api_name, api_version, scopes, sep='-')
+def Load_Credentials(client_secret_file, api_name, api_version, scopes):
     CLIENT_SECRET_FILE = client_secret_file
     API_SERVICE_NAME = api_name
     API_VERSION = api_version
-    SCOPES = [scope for scope in scopes[0]]
-    print(SCOPES)
+    SCOPES = [scope for scope in scopes]
 
     cred = None
 
@@ -31,8 +29,26 @@ def Create_Service(client_secret_file, api_name, api_version, *scopes):
             flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
             cred = flow.run_local_server()
 
-        with open(pickle_file, 'wb') as token:
-            pickle.dump(cred, token)
+        Save_Credentials(cred, API_SERVICE_NAME, API_VERSION)
+
+    return cred
+
+
+def Save_Credentials(cred, api_name, api_version):
+    pickle_file = f'token_{api_name}_{api_version}.pickle'
+    with open(pickle_file + '.tmp', 'wb') as token:
+        pickle.dump(cred, token)
+    os.replace(pickle_file + '.tmp', pickle_file)
+
+
+def Create_Service(client_secret_file, api_name, api_version, *scopes):
+    print(client_secret_file, api_name, api_version, scopes, sep='-')
+    API_SERVICE_NAME = api_name
+    API_VERSION = api_version
+    SCOPES = [scope for scope in scopes[0]]
+    print(SCOPES)
+
+    cred = Load_Credentials(client_secret_file, api_name, api_version, SCOPES)
 
     try:
         service = build(API_SERVICE_NAME, API_VERSION, credentials=cred)
@@ -0,0 +1,363 @@
+"""Headless runner for servers and scheduled tasks.
+
+    python SyncCLI.py --config sync_config.json [--check | --estimate | --once]
+
+The config is a JSON file, for example (schedule entries are daily
+``HH:MM:SS`` times or five-field cron expressions)::
+
+    {
+        "database": {"host": "10.0.0.5", "user": "sync", "password_env": "SYNC_DB_PASSWORD", "database": "line1"},
+        "tables": ["result", "st01 loading"],
+        "mode": "interval",
+        "interval": "00:05:00",
+        "schedule": ["06:00:00", "18:00:00", "*/30 8-17 * * 1-5"],
+        "start_date": "2024-01-01",
+        "format": "csv.gz",
+        "stream": true,
+        "incremental": true,
+        "skip_unchanged": true,
+        "precheck": true,
+        "resumable": false,
+        "chunk_size_mb": 8,
+        "workers": 4,
+        "delete": false,
+        "delete_chunk": 5000,
+        "delete_pause_ms": 0,
+        "credentials": "credentials.json",
+        "metrics_port": 9464,
+        "split_by": "rows",
+        "split_size": 1000000,
+        "part_uploads": 3,
+        "outbox": false,
+        "outbox_uploads": 2,
+        "page_scans": true,
+        "preflight": true,
+        "progress_interval": 30
+    }
+
+"split_by" is one of rows, mb, hour or day and cuts every export into
+``table.part-0001.csv`` style parts plus ``table.manifest.json``;
+"split_size" is the rows or MB per part.
+
+With "incremental": false, "skip_unchanged" leaves out tables whose content
+hash matches their last upload, and "precheck" first compares a
+``COUNT(*)``/``MAX(Date_Time)`` probe so unchanged tables are not even
+queried. Fingerprints are kept in sync_fingerprints.json.
+
+Drive and database calls that fail with a rate limit, a 5xx or a lost
+connection are retried with jittered exponential backoff (see SyncRetry).
+When tables still fail, only those with such transient errors are run
+again, about 60 seconds later and then with growing delays, until the next
+scheduled run.
+
+With "outbox": true, exports are written to sync_outbox/ and uploaded from
+there by "outbox_uploads" separate threads, so a slow or unreachable Drive
+does not hold up (or waste) database extraction. Exports that could not be
+uploaded stay queued across restarts; rows are deleted only after their
+upload succeeded. With --once the runner waits until the outbox is empty.
+
+With "page_scans" (the default) tables are read in short keyset pages of
+``(Date_Time, key)`` order instead of one long query; a lost connection
+only repeats the current page. Tables without a primary key are read in
+``Date_Time`` windows sized to similar row counts.
+
+"database" may also be a list of such objects, one per production line,
+each with an optional "name" (default: its host)::
+
+    "database": [
+        {"name": "line1", "host": "10.0.0.5", "user": "sync", "password_env": "SYNC_DB_PASSWORD", "database": "line"},
+        {"name": "line2", "host": "10.0.0.6", "user": "sync", "password_env": "SYNC_DB_PASSWORD", "database": "line"}
+    ]
+
+All databases are exported concurrently in every run, each into its own
+folder under ``Auto/YYYY/YYYYMMDD/<timestamp>/<name>``; "workers" applies
+per database, while Drive uploads of all of them share one client and one
+concurrency limit.
+
+Every run starts with a pre-flight estimate of the rows, MB and duration of
+each table ("preflight"; --estimate prints it and exits). While tables are
+exported, their rows, rows/s, MB/s and ETA are logged every
+"progress_interval" seconds (0: never) and served at ``/progress``.
+
+Every uploaded file is recorded in the export catalog sync_catalog.sqlite,
+mirrored to Drive as daily shards under ``Auto/catalog/`` (see
+SyncCatalog).
+
+With "metrics_port" set, per-stage metrics are served at
+``http://127.0.0.1:<port>/metrics`` (Prometheus) and the last run at
+``/summary``. Every run also writes a JSON summary to sync_runs/.
+
+Only the standard library and the Qt-free helpers are imported until a sync
+actually starts, so ``--help`` and ``--check`` return immediately.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from datetime import datetime, timedelta
+
+CONFIG_KEYS = {
+    "database", "tables", "mode", "interval", "schedule", "start_date", "format", "stream", "incremental",
+    "resumable", "chunk_size_mb", "workers", "delete", "delete_chunk", "delete_pause_ms", "credentials",
+    "metrics_port", "split_by", "split_size", "part_uploads", "skip_unchanged", "precheck", "outbox",
+    "outbox_uploads", "page_scans", "preflight", "progress_interval",
+}
+SCHEDULE_RETRY_SECONDS = 60
+DEFAULT_PROGRESS_INTERVAL = 30
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def _parse_time(value, what):
+    try:
+        return datetime.strptime(value, "%H:%M:%S")
+    except (TypeError, ValueError):
+        raise ConfigError(f"{what} must be HH:MM:SS, got {value!r}")
+
+
+def _int_setting(config, key, default, minimum):
+    value = config.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ConfigError(f"{key} must be a whole number of at least {minimum}, got {value!r}")
+    return value
+
+
+def _database_args(db, what):
+    password = db.get("password")
+    if password is None and db.get("password_env"):
+        password = os.environ.get(db["password_env"])
+        if password is None:
+            raise ConfigError(f"Environment variable {db['password_env']} is not set")
+    missing = [k for k in ("host", "user", "database") if not db.get(k)]
+    if missing:
+        raise ConfigError(f"{what} is missing: {', '.join(missing)}")
+    return db["host"], db["user"], password or "", db["database"]
+
+
+def load_config(path):
+    """Read and validate the config file; return ``(config, options)``."""
+    from ExportFormats import EXPORT_FORMATS, SPLIT_MODES
+    from SyncEngine import TABLES_AND_QUERIES, make_options
+    from SyncScheduler import parse_trigger
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    except OSError as e:
+        raise ConfigError(f"Cannot read {path}: {e}")
+    except ValueError as e:
+        raise ConfigError(f"{path} is not valid JSON: {e}")
+    if not isinstance(config, dict):
+        raise ConfigError("The config must be a JSON object")
+    unknown = set(config) - CONFIG_KEYS
+    if unknown:
+        raise ConfigError(f"Unknown config key(s): {', '.join(sorted(unknown))}")
+
+    databases = config.get("database") or {}
+    if not isinstance(databases, list):
+        databases = [databases]
+    if not databases:
+        raise ConfigError("database must list at least one database")
+    sources = []
+    for i, db in enumerate(databases):
+        what = "database" if len(databases) == 1 else f"database[{i}]"
+        if not isinstance(db, dict):
+            raise ConfigError(f"{what} must be an object")
+        sources.append({"name": str(db.get("name") or db.get("host") or ""),
+                        "db_args": _database_args(db, what)})
+    names = [source["name"] for source in sources]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ConfigError(f"Give every database its own \"name\"; {', '.join(duplicates)} is used more than once")
+
+    tables = config.get("tables") or []
+    if not tables:
+        raise ConfigError("tables must list at least one table")
+    unknown_tables = [t for t in tables if t not in TABLES_AND_QUERIES]
+    if unknown_tables:
+        raise ConfigError(f"Unknown table(s): {', '.join(unknown_tables)}")
+
+    mode = config.get("mode", "interval")
+    if mode == "interval":
+        interval = _parse_time(config.get("interval", "00:05:00"), "interval")
+        if not (interval.hour or interval.minute or interval.second):
+            raise ConfigError("interval must be greater than 0 seconds")
+    elif mode == "schedule":
+        if not config.get("schedule"):
+            raise ConfigError("schedule must list at least one HH:MM:SS time or cron expression")
+        for value in config["schedule"]:
+            try:
+                parse_trigger(value)
+            except (AttributeError, ValueError) as e:
+                raise ConfigError(f"schedule entry {value!r}: {e}")
+    else:
+        raise ConfigError(f"mode must be 'interval' or 'schedule', got {mode!r}")
+
+    progress_interval = config.get("progress_interval", DEFAULT_PROGRESS_INTERVAL)
+    if not isinstance(progress_interval, (int, float)) or progress_interval < 0:
+        raise ConfigError(f"progress_interval must be a number of seconds, got {progress_interval!r}")
+
+    port = config.get("metrics_port")
+    if port is not None and (not isinstance(port, int) or not 0 <= port <= 65535):
+        raise ConfigError(f"metrics_port must be a port number, got {port!r}")
+
+    split_by = config.get("split_by")
+    if split_by is not None and split_by not in SPLIT_MODES:
+        raise ConfigError(f"split_by must be one of {', '.join(SPLIT_MODES)}, got {split_by!r}")
+    split_size = config.get("split_size", 1000000)
+    if not isinstance(split_size, int) or split_size < 1:
+        raise ConfigError(f"split_size must be a positive number, got {split_size!r}")
+    chunk_size_mb = _int_setting(config, "chunk_size_mb", 8, 1)
+    workers = _int_setting(config, "workers", 4, 1)
+    delete_chunk = _int_setting(config, "delete_chunk", 5000, 1)
+    delete_pause_ms = _int_setting(config, "delete_pause_ms", 0, 0)
+    part_uploads = _int_setting(config, "part_uploads", 3, 1)
+    outbox_uploads = _int_setting(config, "outbox_uploads", 2, 1)
+
+    fmt = config.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        raise ConfigError(f"format must be one of {', '.join(EXPORT_FORMATS)}, got {fmt!r}")
+    if config.get("start_date"):
+        try:
+            datetime.strptime(config["start_date"], "%Y-%m-%d")
+        except ValueError:
+            raise ConfigError(f"start_date must be YYYY-MM-DD, got {config['start_date']!r}")
+
+    options = make_options(
+        db_args=sources[0]["db_args"],
+        sources=sources if len(sources) > 1 else (),
+        start_date=config.get("start_date"),
+        incremental=bool(config.get("incremental", True)),
+        skip_unchanged=bool(config.get("skip_unchanged", True)),
+        precheck=bool(config.get("precheck", True)),
+        stream=bool(config.get("stream", True)),
+        format=fmt,
+        resumable=bool(config.get("resumable", False)),
+        chunk_size=chunk_size_mb * 1024 * 1024,
+        workers=workers,
+        delete=bool(config.get("delete", False)),
+        delete_chunk=delete_chunk,
+        delete_pause=delete_pause_ms / 1000,
+        split_by=split_by,
+        split_size=split_size,
+        part_uploads=part_uploads,
+        outbox=bool(config.get("outbox", False)),
+        outbox_uploads=outbox_uploads,
+        page_scans=bool(config.get("page_scans", True)),
+        preflight=bool(config.get("preflight", True)),
+    )
+    return config, options
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export MySQL tables to Google Drive without the GUI.")
+    parser.add_argument("--config", required=True, help="path of the JSON sync config")
+    parser.add_argument("--check", action="store_true", help="validate the config and exit")
+    parser.add_argument("--estimate", action="store_true",
+                        help="estimate the rows, size and duration of the next sync and exit")
+    parser.add_argument("--once", action="store_true", help="run one sync of all tables and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Windows consoles may not encode the emoji in log lines.
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(errors="replace")
+    try:
+        config, options = load_config(args.config)
+    except ConfigError as e:
+        print(f"Config error: {e}", file=sys.stderr)
+        return 2
+    if args.check:
+        print(f"Config OK: {len(options['sources']) or 1} database(s), {len(config['tables'])} table(s), "
+              f"mode {config.get('mode', 'interval')}")
+        return 0
+
+    if args.estimate:
+        from SyncEngine import SyncEngine
+
+        engine = SyncEngine()
+        engine.preflight(engine.auto_exports(config["tables"], options), options,
+                         lambda line: print(line, flush=True))
+        return 0
+
+    from SyncLog import LogSink
+
+    # Lines go to stdout and the rotating sync.log from one writer thread.
+    log_sink = LogSink(console=True, keep_events=False)
+    try:
+        return run(args, config, options, log_sink.channel("auto"))
+    finally:
+        log_sink.close()
+
+
+def log_progress(engine, log, interval, stop_flag):
+    """Log the progress of the exports in flight every interval seconds until stop_flag is set."""
+    from SyncEngine import timestamped_log
+
+    while not stop_flag.wait(interval):
+        for line in engine.progress.lines():
+            log(timestamped_log(f"📶 {line}"))
+
+
+def run(args, config, options, log):
+    from SyncEngine import SyncEngine, TablesFailed, timestamped_log
+
+    engine = SyncEngine()
+    stop_flag = threading.Event()
+    interval = config.get("progress_interval", DEFAULT_PROGRESS_INTERVAL)
+    if interval:
+        threading.Thread(target=log_progress, args=(engine, log, interval, stop_flag),
+                         name="progress-log", daemon=True).start()
+    log(timestamped_log(f"Authenticated as: {engine.authenticate(config.get('credentials', 'credentials.json'))}"))
+    if config.get("metrics_port"):
+        server = engine.start_metrics_server(config["metrics_port"])
+        log(timestamped_log(f"📈 Metrics at http://127.0.0.1:{server.port}/metrics"))
+    engine.resume_interrupted_uploads(log)
+    tables = config["tables"]
+
+    if args.once:
+        try:
+            results = engine.run_all_queries(tables, options, log, auto_mode=True)
+        except TablesFailed:
+            results = None
+        finally:
+            stop_flag.set()
+        if options["outbox"] and engine.drain_outbox(options, log, wait=True):
+            return 1
+        return 0 if results is not None else 1
+    if options["outbox"]:
+        engine.drain_outbox(options, log)
+
+    def request_stop(signum, frame):
+        log(timestamped_log("🛑 Stopping..."))
+        stop_flag.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    from SyncScheduler import IntervalTrigger, parse_trigger
+
+    scheduler = engine.create_scheduler(options, log)
+    if config.get("mode", "interval") == "interval":
+        interval = _parse_time(config.get("interval", "00:05:00"), "interval")
+        interval_td = timedelta(hours=interval.hour, minutes=interval.minute, seconds=interval.second)
+        scheduler.add_job("Interval sync", IntervalTrigger(interval_td), tables, retry_seconds=SCHEDULE_RETRY_SECONDS)
+    else:
+        for entry in config["schedule"]:
+            scheduler.add_job("Scheduled sync", parse_trigger(entry), tables, retry_seconds=SCHEDULE_RETRY_SECONDS)
+    scheduler.start()
+    # Wake up regularly so signals are handled promptly on every platform.
+    while not stop_flag.wait(1):
+        pass
+    scheduler.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+CATALOG_FILE = "sync_catalog.sqlite"
+# The catalog is mirrored to Drive as one file per upload day, in
+# Auto/<MIRROR_FOLDER>/YYYY-MM/ (see mirror_name).
+MIRROR_FOLDER = "catalog"
+MIRROR_MIMETYPE = "application/vnd.sqlite3"
+
+FILES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    rows INTEGER,
+    first_date_time TEXT,
+    last_date_time TEXT,
+    bytes INTEGER,
+    md5 TEXT,
+    uploaded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_by_time ON files (table_name, last_date_time, first_date_time);
+CREATE INDEX IF NOT EXISTS files_by_upload ON files (uploaded_at);
+"""
+SCHEMA = FILES_SCHEMA + "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);\n"
+COLUMNS = ("file_id", "name", "kind", "table_name", "source", "folder", "rows", "first_date_time",
+           "last_date_time", "bytes", "md5", "uploaded_at")
+
+
+def mirror_name(day):
+    """Drive file name of the mirror shard of upload day ``YYYY-MM-DD``."""
+    return f"catalog-{day}.sqlite"
+
+
+class ExportCatalog:
+    """Index of every file auto runs uploaded, kept in one SQLite file.
+
+    A ``files`` row holds the Drive file ID, name and folder path, its kind
+    (export, part or manifest), table, source (``host/database``), row
+    count, ``Date_Time`` span, size and the MD5 Drive computed. Date_Times
+    are stored as ``YYYY-MM-DD HH:MM:SS`` text, so they compare correctly.
+
+    The catalog is mirrored to Drive in daily shards: the files uploaded on
+    one day go to ``Auto/catalog/YYYY-MM/catalog-YYYY-MM-DD.sqlite``, so a
+    shard only changes on its own day and past days are never sent again.
+    Rows are uploaded on their Date_Time's day or later, so finding the files
+    of a table for a time range means querying the shards from its start
+    day on::
+
+        SELECT file_id, folder, name FROM files
+        WHERE table_name = 'result' AND kind != 'manifest'
+          AND last_date_time >= '2024-03-01' AND first_date_time < '2024-03-02'
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        # Upload days whose mirror shard is out of date, kept in meta so a
+        # restart does not forget them.
+        self._changed_days = set()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'changed_days'").fetchone()
+            self._changed_days = set(row[0].split(",")) if row and row[0] else set()
+        return self._conn
+
+    def _save_changed_days(self, conn):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('changed_days', ?)",
+                     (",".join(sorted(self._changed_days)),))
+
+    def add(self, entry):
+        """Insert or replace the row of one uploaded file (a dict keyed by COLUMNS)."""
+        entry = dict(entry, uploaded_at=entry.get("uploaded_at") or f"{datetime.now():%Y-%m-%d %H:%M:%S}")
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) "
+                             f"VALUES ({', '.join('?' * len(COLUMNS))})", [entry.get(c) for c in COLUMNS])
+                day = entry["uploaded_at"][:10]
+                if day not in self._changed_days:
+                    self._changed_days.add(day)
+                    self._save_changed_days(conn)
+
+    def find(self, table, start=None, end=None, source=None):
+        """Return the export and part files of table with rows between start and end, oldest first."""
+        sql = ["table_name = ?", "kind != 'manifest'"]
+        params = [table]
+        if start is not None:
+            sql.append("last_date_time >= ?")
+            params.append(str(start))
+        if end is not None:
+            sql.append("first_date_time <= ?")
+            params.append(str(end))
+        if source is not None:
+            sql.append("source = ?")
+            params.append(source)
+        with self._lock:
+            cursor = self._connection().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM files WHERE {' AND '.join(sql)} ORDER BY first_date_time", params)
+            return [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+
+    def bytes_per_row(self, table, fmt, recent=20):
+        """Average bytes per row of the recent fmt files of table, or None without any."""
+        with self._lock:
+            found = self._connection().execute(
+                "SELECT SUM(bytes), SUM(rows) FROM (SELECT bytes, rows FROM files "
+                "WHERE table_name = ? AND kind != 'manifest' AND name LIKE ? AND rows > 0 AND bytes > 0 "
+                "ORDER BY uploaded_at DESC LIMIT ?)", (table, f"%.{fmt}", recent)).fetchone()
+        return found[0] / found[1] if found and found[1] else None
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def changed_days(self):
+        """Upload days (``YYYY-MM-DD``) whose mirror shard is out of date, oldest first."""
+        with self._lock:
+            self._connection()
+            return sorted(self._changed_days)
+
+    def snapshot(self, target, day):
+        """Write the files uploaded on day to a new SQLite file at target; returns how many."""
+        if os.path.exists(target):
+            os.remove(target)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM files WHERE uploaded_at >= ? AND uploaded_at < ?",
+                (day, day + "~")).fetchall()
+        shard = sqlite3.connect(target)
+        try:
+            with shard:
+                shard.executescript(FILES_SCHEMA)
+                shard.executemany(f"INSERT INTO files ({', '.join(COLUMNS)}) "
+                                  f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        finally:
+            shard.close()
+        return len(rows)
+
+    def mirrored(self, day, rows):
+        """Record that the shard of day went to Drive with rows files, unless files were added since."""
+        with self._lock:
+            conn = self._connection()
+            current = conn.execute("SELECT COUNT(*) FROM files WHERE uploaded_at >= ? AND uploaded_at < ?",
+                                   (day, day + "~")).fetchone()[0]
+            if current != rows:
+                return
+            with conn:
+                self._changed_days.discard(day)
+                self._save_changed_days(conn)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
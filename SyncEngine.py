@@ -0,0 +1,1629 @@
+import hashlib
+import io
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta
+from itertools import chain, islice
+
+from DBHelpers import (
+    DEFAULT_BATCH_SIZE, DEFAULT_DELETE_CHUNK, DEFAULT_PAGE_ROWS, RangeTracker, TableScan, get_pool,
+    iter_table_scan, open_query_stream, primary_key_column, scan_estimate,
+    purge_exported_rows, table_probe
+)
+from ExportFormats import (
+    BUNDLE_EXTENSION, BUNDLE_MIMETYPE, PART_SPOOL_MEMORY, export_file_name, export_mimetype, iter_export_chunks,
+    iter_export_parts, iter_zip_chunks, part_file_name, strip_export_extension, supports_raw_rows
+)
+from SyncCatalog import MIRROR_FOLDER, MIRROR_MIMETYPE, ExportCatalog, mirror_name
+from SyncMetrics import Metrics, Progress, StageClock, format_estimate, write_run_summary
+from SyncOutbox import Outbox
+from SyncRetry import DriveGovernor, classify, retry_batch, retry_call
+from SyncState import FingerprintStore, WatermarkStore, incremental_query, incremental_scan
+
+# PyQt5, googleapiclient and mysql.connector are only imported when first
+# needed, so the headless runner can validate a config without loading them.
+
+TABLES_AND_QUERIES = {
+    "result": "SELECT * FROM `result`;",
+    "st01 loading": "SELECT * FROM `st01 loading`;",
+    "st03 pre0 data": "SELECT * FROM `st03 pre0 data`;",
+    "st03 pre data": "SELECT * FROM `st03 pre data`;",
+    "st04 fs0 data":"SELECT * FROM `st04 fs0 data`;",
+    "st04 fs1 data": "SELECT * FROM `st04 fs1 data`;",
+    "st04 fs data": "SELECT * FROM `st04 fs data`;",
+    "st05 fs0 data": "SELECT * FROM `st05 fs0 data`;",
+    "st05 fs1 data": "SELECT * FROM `st05 fs1 data`;",
+    "st05 fs data": "SELECT * FROM `st05 fs data`;",
+    "st06 fs0 data": "SELECT * FROM `st06 fs0 data`;",
+    "st06 fs1 data": "SELECT * FROM `st06 fs1 data`;",
+    "st06 fs data": "SELECT * FROM `st06 fs data`;",
+    "st07 gap": "SELECT * FROM `st07 gap`;",
+    "st07 illumination": "SELECT * FROM `st07 illumination`;",
+    "st08 pin data": "SELECT * FROM `st08 pin data`;",
+    "st09 laser": "SELECT * FROM `st09 laser`;",
+    "st10 scaner": "SELECT * FROM `st10 scaner`;",
+    "sws data": "SELECT * FROM `sws data`;",
+}
+
+CLIENT_SECRET_FILE = "credentials.json"
+API_NAME = "drive"
+API_VERSION = "v3"
+# Export rate assumed for pre-flight estimates until a table was exported once.
+ASSUMED_ROWS_PER_S = 20000
+# Today's catalog shard is mirrored to Drive at most this often; shards of
+# past days go up as soon as they have changed.
+CATALOG_MIRROR_SECONDS = 3600
+# Encoded chunks a bundle member may be read ahead of the archive.
+BUNDLE_PREFETCH_CHUNKS = 16
+SCOPES = ["https://www.googleapis.com/auth/drive"]
+
+# Export options shared by the Manual/Auto tabs and the headless runner.
+DEFAULT_OPTIONS = {
+    "db_args": ("", "", "", ""),
+    "start_date": None,
+    "incremental": True,
+    "stream": True,
+    "format": "csv",
+    "resumable": False,
+    "chunk_size": 8 * 1024 * 1024,
+    "workers": 4,
+    "delete": False,
+    "delete_chunk": DEFAULT_DELETE_CHUNK,
+    "delete_pause": 0.0,
+    "folder_id": None,
+    "subfolder": None,
+    "file_name": None,
+    # None, or a mode from ExportFormats.SPLIT_MODES; split_size is rows or MB.
+    "split_by": None,
+    "split_size": 1000000,
+    "part_uploads": 3,
+    # Full auto exports: skip tables whose COUNT/MAX probe (precheck) or
+    # content hash matches their last upload.
+    "skip_unchanged": True,
+    "precheck": True,
+    # Auto exports go to a local outbox first, drained by outbox_uploads
+    # upload threads, so DB extraction and Drive uploads run independently.
+    "outbox": False,
+    "outbox_uploads": 2,
+    # Read known tables in short keyset pages (or Date_Time windows) instead
+    # of one long query; see DBHelpers.iter_table_scan.
+    "page_scans": True,
+    # Auto runs over several databases at once: [{"name", "db_args"}], each
+    # exported into its own "name" folder of the run. Empty: just db_args.
+    "sources": (),
+    # Estimate rows, bytes and duration of every table before a run starts.
+    "preflight": True,
+    # Manual exports of several tables go into one zip archive with a
+    # manifest, uploaded as a single file (see run_manual_bundle).
+    "bundle": False,
+}
+
+
+def timestamped_log(msg):
+    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}"
+
+
+def file_properties(table, tracker):
+    """Drive description and appProperties for an export of table seen by tracker."""
+    properties = {"table": table, "rows": str(tracker.rows)}
+    description = f"{tracker.rows} row(s) of {table}"
+    if tracker.min_date_time is not None:
+        properties["first_date_time"] = str(tracker.min_date_time)
+        properties["last_date_time"] = str(tracker.max_date_time)
+        description += f", Date_Time {tracker.min_date_time} to {tracker.max_date_time}"
+    return {"description": description, "appProperties": properties}
+
+
+def db_sources(options):
+    """Return the ``[(name, db_args)]`` an auto run exports; name is None without options["sources"]."""
+    if not options["sources"]:
+        return [(None, options["db_args"])]
+    return [(source["name"], tuple(source["db_args"])) for source in options["sources"]]
+
+
+def source_log(log, name):
+    """Wrap log so every line names the database source it is about."""
+    def log_line(line):
+        stamp, sep, message = line.partition("] ")
+        log(f"{stamp}{sep}[{name}] {message}" if sep else f"[{name}] {line}")
+
+    return log_line
+
+
+def progress_key(db_args, table):
+    """Key of an export of table in SyncEngine.progress."""
+    return db_args[0], db_args[3], table
+
+
+def split_order(options):
+    """ORDER BY for table queries whose export is split by Date_Time bucket."""
+    return " ORDER BY Date_Time" if options["split_by"] in ("hour", "day") else ""
+
+
+def _json_value(value):
+    return str(value) if value is not None else None
+
+
+def manifest_entry(base_name, fmt, part):
+    return {
+        "name": part_file_name(base_name, fmt, part.number),
+        "rows": part.stats.rows,
+        "bytes": part.size,
+        "first_date_time": _json_value(part.stats.min_date_time),
+        "last_date_time": _json_value(part.stats.max_date_time),
+    }
+
+
+def manifest_body(table, options, entries):
+    """The ``.manifest.json`` contents of a split export made of entries."""
+    body = {
+        "table": table,
+        "format": options["format"],
+        "split_by": options["split_by"],
+        "split_size": options["split_size"] if options["split_by"] in ("rows", "mb") else None,
+        "rows": sum(entry["rows"] for entry in entries),
+        "parts": entries,
+    }
+    return json.dumps(body, indent=1).encode("utf-8")
+
+
+class TablesFailed(RuntimeError):
+    """A run in which some tables failed.
+
+    retry_tables lists the failed tables whose error was transient (rate
+    limit, server or connection trouble); the scheduler retries only those.
+    """
+
+    def __init__(self, failed, retry_tables):
+        super().__init__(f"{len(failed)} table(s) failed: {', '.join(failed)}")
+        self.failed = failed
+        self.retry_tables = retry_tables
+
+
+class Prefetch:
+    """Iterate iterable on a background thread, up to depth items ahead.
+
+    Errors are raised to the consumer. Closing (or abandoning the
+    iteration) stops the thread and closes iterable there.
+    """
+
+    def __init__(self, iterable, depth, name=None):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, args=(iterable,), name=name, daemon=True).start()
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put((True, item)):
+                    return
+        except BaseException as e:
+            self._put((False, e))
+        else:
+            self._put((False, None))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close:
+                close()
+
+    def _put(self, entry):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                ok, item = self._queue.get()
+                if not ok:
+                    if item is not None:
+                        raise item
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self._stopped.set()
+
+
+def make_options(**overrides):
+    options = dict(DEFAULT_OPTIONS)
+    options.update(overrides)
+    if not options["start_date"]:
+        options["start_date"] = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+    return options
+
+
+class SyncEngine:
+    """Export/upload logic shared by the GUI and the headless runner.
+
+    Every entry point takes an ``options`` dict (see make_options) and a
+    ``log`` callable that receives finished, timestamped log lines.
+    """
+
+    def __init__(self, tables_and_queries=None, drive_clients=None):
+        from DriveHelpers import FolderCache, UploadSessionStore
+
+        self.tables_and_queries = dict(tables_and_queries or TABLES_AND_QUERIES)
+        # Pass drive_clients (anything with get()) to skip authenticate(),
+        # e.g. to run against a fake Drive.
+        self.drive_clients = drive_clients
+        self.token_refresher = None
+        self._auth_done = threading.Event()
+        self._auth_error = None
+        if drive_clients is not None:
+            self._auth_done.set()
+        self.stream_batch_size = DEFAULT_BATCH_SIZE
+        self.scan_page_rows = DEFAULT_PAGE_ROWS
+        self.upload_sessions = UploadSessionStore()
+        self.watermarks = WatermarkStore()
+        self.fingerprints = FingerprintStore()
+        self.folder_cache = FolderCache()
+        self.table_key_columns = {}
+        self.metrics = Metrics()
+        self.progress = Progress()
+        # Shared by all threads, so a rate limit slows every Drive request down.
+        self.drive_governor = DriveGovernor()
+        self.outbox = Outbox()
+        self._outbox_lock = threading.Lock()
+        self._outbox_pool = None
+        self._outbox_jobs = {}
+        self._outbox_swept = False
+        # Parallel exports into the same new folder must not each create it.
+        self._folder_lock = threading.Lock()
+        self.catalog = ExportCatalog()
+        self._catalog_lock = threading.Lock()
+        # time.monotonic() of the last upload of today's catalog shard.
+        self._catalog_published = float("-inf")
+
+    def authenticate(self, client_secret_file=CLIENT_SECRET_FILE):
+        """Load Drive credentials and return the authenticated e-mail address.
+
+        Safe to run on a background thread: ``service`` blocks until this has
+        finished. A TokenRefresher keeps the token fresh from then on.
+        """
+        from DriveHelpers import ThreadLocalService, TokenRefresher
+        from Google import Load_Credentials, Save_Credentials
+
+        try:
+            credentials = Load_Credentials(client_secret_file, API_NAME, API_VERSION, SCOPES)
+            self.drive_clients = ThreadLocalService(credentials, API_NAME, API_VERSION)
+            self.token_refresher = TokenRefresher(
+                credentials, on_refresh=lambda cred: Save_Credentials(cred, API_NAME, API_VERSION))
+            self.token_refresher.start()
+            about = self.drive_retry("about")(self.drive_clients.get().about().get(fields="user(emailAddress)").execute)
+            return about["user"]["emailAddress"]
+        except Exception as e:
+            self._auth_error = e
+            raise
+        finally:
+            self._auth_done.set()
+
+    def drive_retry(self, what, log=None):
+        """Return retry(fn) for Drive calls about what, paced by the shared governor."""
+        retry_log = (lambda msg: log(timestamped_log(msg))) if log else None
+        return lambda fn: retry_call(fn, what, governor=self.drive_governor, log=retry_log)
+
+    def db_retry(self, what, log=None):
+        """Return retry(fn) for database calls about what."""
+        retry_log = (lambda msg: log(timestamped_log(msg))) if log else None
+        return lambda fn: retry_call(fn, what, log=retry_log)
+
+    @property
+    def service(self):
+        """The Drive client owned by the calling thread."""
+        self._auth_done.wait()
+        if self._auth_error is not None:
+            raise RuntimeError(f"Google Drive authentication failed: {self._auth_error}")
+        return self.drive_clients.get()
+
+    # ---------------- Auto sync ----------------
+    def start_metrics_server(self, port, host="127.0.0.1"):
+        """Serve /metrics, /summary and /progress on port; returns the MetricsServer."""
+        from SyncMetrics import MetricsServer
+
+        return MetricsServer(self.metrics, port, host, progress=self.progress)
+
+    def create_scheduler(self, options, log, overlap="coalesce"):
+        """Return a Scheduler whose jobs run run_all_queries with options."""
+        from SyncScheduler import Scheduler
+
+        return Scheduler(lambda tables: self.run_all_queries(tables, options, log, auto_mode=True),
+                         lambda msg: log(timestamped_log(msg)), overlap=overlap)
+
+    def run_all_queries(self, selected_tables, options, log, auto_mode=False):
+        started = time.time()
+        metrics_before = self.metrics.snapshot()
+        ts_folder_name = datetime.now().strftime("%Y%m%d%H%M%S")
+        year_str = datetime.now().strftime("%Y")
+        date_str = datetime.now().strftime("%Y%m%d")
+        folder_names = ["Auto", year_str, date_str, ts_folder_name]
+        sources = db_sources(options)
+        source_folders = {name: folder_names + [name] if name else folder_names for name, _ in sources}
+        folder_lock = threading.Lock()
+        folder_ids = {}
+
+        def folder_getter(name):
+            def folder_id():
+                # Created by the first upload, so a run without changes leaves no empty folder
+                # behind; the folders of all sources are resolved together in that one call.
+                with folder_lock:
+                    if not folder_ids:
+                        ids = self.resolve_folder_paths(list(source_folders.values()))
+                        folder_ids.update(zip(source_folders, ids))
+                        per_source = " (one folder per database)" if options["sources"] else ""
+                        log(timestamped_log(f"Using Drive folder structure: "
+                                            f"Auto/{year_str}/{date_str}/{ts_folder_name}{per_source}"))
+                    return folder_ids[name]
+
+            return folder_id
+
+        if options["outbox"]:
+            # Exports a previous run could not upload go first.
+            self.drain_outbox(options, log)
+
+        # Every source gets its own connection pool and workers; Drive calls of
+        # all of them share the service and the drive_governor limit.
+        workers = max(1, min(options["workers"], len(selected_tables)))
+        source_runs = []
+        for name, db_args in sources:
+            get_pool(*db_args, size=workers)
+            source_runs.append((name, dict(options, db_args=db_args, sources=()),
+                                source_log(log, name) if name else log, folder_getter(name)))
+        tasks = [(table, source_run) for table in selected_tables for source_run in source_runs]
+        estimates = {}
+        if options["preflight"]:
+            estimates = self.preflight(self.auto_exports(selected_tables, options), options, log)
+
+        def export_task(task):
+            table, (name, source_options, log_source, get_folder_id) = task
+            key = progress_key(source_options["db_args"], table)
+            result = self.with_progress(key, f"{name}/{table}" if name else table, estimates.get(key),
+                                        self.export_auto_table, table, get_folder_id, auto_mode, source_options,
+                                        log_source, folder_names=source_folders[name])
+            if name:
+                result["source"] = name
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers * len(sources), thread_name_prefix="auto-export") as pool:
+            results = list(pool.map(export_task, tasks))
+        self.update_file_metadata(dict(r["metadata"] for r in results if r.get("metadata")), log)
+        self.publish_catalog(log)
+
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        log(timestamped_log("📊 Run summary: " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items()))))
+        summary = self.metrics.run_summary(metrics_before, selected_tables, started, results)
+        try:
+            write_run_summary(summary, ts_folder_name)
+        except OSError as e:
+            log(timestamped_log(f"⚠️ Could not write the run summary: {e}"))
+        failed = [result for result in results if result["status"] == "failed"]
+        if failed:
+            # A table failing on any source is run again on all of them.
+            raise TablesFailed(list(dict.fromkeys(result["table"] for result in failed)),
+                               list(dict.fromkeys(result["table"] for result in failed
+                                                  if result["error_class"] != "fatal")))
+        return results
+
+    def auto_exports(self, tables, options):
+        """The ``(key, label, db_args, TableScan)`` of the exports an auto run of tables does, for preflight()."""
+        exports = []
+        for table in tables:
+            for name, db_args in db_sources(options):
+                scan = TableScan(table, start=options["start_date"])
+                if options["incremental"]:
+                    watermark = self.watermarks.get(WatermarkStore.key(db_args[0], db_args[3], table))
+                    if watermark:
+                        scan = TableScan(table, after=(watermark["date_time"], None))
+                exports.append((progress_key(db_args, table), f"{name}/{table}" if name else table, db_args, scan))
+        return exports
+
+    def manual_exports(self, tables, start_str, end_str, options):
+        """Like auto_exports, for a manual export of tables from start_str to end_str."""
+        db_args = options["db_args"]
+        return [(progress_key(db_args, table), table, db_args, TableScan(table, start=start_str, end=end_str))
+                for table in tables]
+
+    def preflight(self, exports, options, log):
+        """Estimate exports of ``(key, label, db_args, TableScan)``; return ``{key: estimate}``.
+
+        Every estimate is logged, then the totals. The estimates run in
+        parallel and cost two small queries per table (see scan_estimate).
+        """
+        def estimate(export):
+            key, label, db_args, scan = export
+            try:
+                return key, label, self.estimate_export(db_args, scan, options["format"])
+            except Exception as e:
+                log(timestamped_log(f"⚠️ Could not estimate {label}: {e}"))
+                return key, label, None
+
+        workers = max(1, min(options["workers"] * len(db_sources(options)), len(exports)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preflight") as pool:
+            results = list(pool.map(estimate, exports))
+        estimates = {key: result for key, _, result in results if result}
+        for _, label, result in results:
+            if result and result["rows"]:
+                log(timestamped_log(f"🔎 {format_estimate(label, result)}"))
+        if estimates:
+            total = {field: sum(e[field] for e in estimates.values()) for field in ("rows", "bytes")}
+            # Tables export options["workers"] at a time (per source), so the run takes about the sum
+            # spread over them.
+            total["seconds"] = max(max(e["seconds"] for e in estimates.values()),
+                                   sum(e["seconds"] for e in estimates.values()) / workers)
+            log(timestamped_log(f"🔎 Pre-flight: {format_estimate(f'{len(estimates)} table(s)', total)}"))
+        return estimates
+
+    def estimate_export(self, db_args, scan, fmt):
+        """Return ``{"rows", "bytes", "seconds"}`` expected for exporting scan in format fmt.
+
+        Bytes per row come from the table's recent exports in the catalog
+        (else its average row length), the rate from this process's
+        metrics (else ASSUMED_ROWS_PER_S).
+        """
+        rows, row_length = self.db_retry(f"estimate of {scan.table}")(lambda: scan_estimate(*db_args, scan))
+        bytes_per_row = self.catalog.bytes_per_row(scan.table, fmt) or row_length
+        rows_per_s = self.metrics.rows_per_second(scan.table) or ASSUMED_ROWS_PER_S
+        return {"rows": rows, "bytes": round(rows * bytes_per_row), "seconds": rows / rows_per_s}
+
+    def with_progress(self, key, label, estimate, fn, *args, **kwargs):
+        """Call fn while its export is shown in self.progress as label."""
+        self.progress.begin(key, label, estimate)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.progress.end(key)
+
+    def export_auto_table(self, table, get_folder_id, auto_mode, options, log, folder_names=None):
+        """Export one table into the folder get_folder_id() returns and report how it went.
+
+        Errors are caught and returned in the result so one failing table
+        does not stop the others. With options["skip_unchanged"], a full
+        (non-incremental) export whose probe or content matches the last
+        upload is reported as "unchanged" and not uploaded again. With
+        options["outbox"] the export is queued for folder_names instead and
+        reported as "queued" (see queue_auto_export).
+        """
+        result = {"table": table, "status": "uploaded", "rows": 0, "error": None}
+        query = self.tables_and_queries.get(table)
+        if not query:
+            log(timestamped_log(f"⚠️ No query found for table {table}, skipping..."))
+            result["status"] = "skipped"
+            return result
+        db_args = options["db_args"]
+        params = None
+        watermark_key = None
+        fingerprint = None
+        catalog = {"folder": "/".join(folder_names), "source": f"{db_args[0]}/{db_args[3]}"} if folder_names else None
+        csv_file_name = export_file_name(table.replace(' ', '_').lower(), options["format"])
+        try:
+            if auto_mode and options["skip_unchanged"] and not options["incremental"]:
+                fingerprint = self.check_fingerprint(table, options)
+                if fingerprint["unchanged"]:
+                    log(timestamped_log(f"⏸️ {table} is unchanged since its last upload, skipping."))
+                    result["status"] = "unchanged"
+                    return result
+            key_column = None
+            if options["delete"] or (auto_mode and (options["incremental"] or options["page_scans"])):
+                key_column = self.table_key_column(db_args, table)
+            tracker = RangeTracker(key_column)
+            if auto_mode:
+                if options["page_scans"]:
+                    query = TableScan(table, key_column, start=options["start_date"])
+                else:
+                    query = (f"SELECT * FROM `{table}` WHERE Date_Time >= '{options['start_date']}'"
+                             f"{split_order(options)};")
+                if options["incremental"]:
+                    watermark_key = WatermarkStore.key(db_args[0], db_args[3], table)
+                    build = incremental_scan if options["page_scans"] else incremental_query
+                    query, params = build(table, self.watermarks.get(watermark_key), key_column,
+                                          options["start_date"])
+            log(timestamped_log(f"⏳ Processing table '{table}'..."))
+            if options["outbox"] and auto_mode:
+                result["status"], result["rows"] = self.queue_auto_export(
+                    table, query, params, tracker, fingerprint, watermark_key, folder_names, options, log)
+                return result
+            if options["split_by"]:
+                parts = self.upload_split_export(db_args, query, table, table.replace(' ', '_').lower(),
+                                                 get_folder_id, options, log, params=params, tracker=tracker,
+                                                 catalog=catalog)
+                if not parts:
+                    log(timestamped_log(f"⚠️ No data found for table {table}, skipping upload."))
+                    result["status"] = "empty"
+                    self.save_fingerprint(fingerprint)
+                    return result
+                log(timestamped_log(f"✅ Uploaded {table} to Drive as {parts} part(s)."))
+                self.save_fingerprint(fingerprint)
+                self.finish_auto_table(table, tracker, watermark_key, options, log)
+                result["rows"] = tracker.rows
+                return result
+            csv_buffer = self.prepare_export(db_args, query, options["stream"], options["format"],
+                                             params=params, tracker=tracker, table=table)
+            if csv_buffer is None:
+                log(timestamped_log(f"⚠️ No data found for table {table}, skipping upload."))
+                result["status"] = "empty"
+                self.save_fingerprint(fingerprint)
+                return result
+            if fingerprint:
+                csv_buffer, fingerprint["sha256"] = self.hash_export(csv_buffer, table)
+                if fingerprint["previous_sha256"] == fingerprint["sha256"]:
+                    csv_buffer.close()
+                    log(timestamped_log(f"⏸️ {table} has the same content as its last upload, skipping."))
+                    result["status"] = "unchanged"
+                    self.save_fingerprint(fingerprint)
+                    return result
+            # A buffered export is complete here, so its metadata goes with the upload.
+            streamed = not isinstance(csv_buffer, io.IOBase)
+            uploaded = self.upload_file_to_drive(csv_file_name, csv_buffer, get_folder_id(),
+                                                 mimetype=export_mimetype(options["format"]),
+                                                 resumable=options["resumable"],
+                                                 chunk_size=options["chunk_size"],
+                                                 log=log, table=table,
+                                                 properties=None if streamed else file_properties(table, tracker))
+            if streamed:
+                result["metadata"] = (uploaded["id"], file_properties(table, tracker))
+            self.catalog_file(uploaded, csv_file_name, file_properties(table, tracker), catalog, log)
+            result["rows"] = tracker.rows
+            log(timestamped_log(f"✅ Uploaded {csv_file_name} to Drive."))
+            self.save_fingerprint(fingerprint)
+            self.finish_auto_table(table, tracker, watermark_key, options, log)
+        except Exception as e:
+            log(timestamped_log(f"❌ Error processing table {table}: {e}"))
+            result["status"] = "failed"
+            result["error"] = str(e)
+            result["error_class"] = classify(e)
+        return result
+
+    def check_fingerprint(self, table, options):
+        """Compare table with the fingerprint of its last upload.
+
+        Returns the fingerprint to save after this export. "unchanged" is
+        set when the cheap COUNT/MAX probe (options["precheck"]) matches, in
+        which case the table need not be queried at all. Otherwise
+        "previous_sha256" is the content hash to compare the new export with.
+        """
+        db_args = options["db_args"]
+        key = FingerprintStore.key(db_args[0], db_args[3], table)
+        scope = {name: options[name] for name in ("start_date", "format", "split_by", "split_size")}
+        previous = self.fingerprints.get(key)
+        if previous and previous.get("scope") != scope:
+            previous = None
+        probe = None
+        if options["precheck"]:
+            started = time.perf_counter()
+            try:
+                probe = self.db_retry(f"probe of {table}")(
+                    lambda: table_probe(*db_args, table, options["start_date"]))
+            except Exception:
+                self.metrics.record("probe", table, seconds=time.perf_counter() - started, error=True)
+                raise
+            self.metrics.record("probe", table, seconds=time.perf_counter() - started)
+        return {
+            "key": key,
+            "scope": scope,
+            "probe": probe,
+            "sha256": None,
+            "previous_sha256": previous.get("sha256") if previous else None,
+            "unchanged": bool(previous and probe is not None and previous.get("probe") == probe),
+        }
+
+    def save_fingerprint(self, fingerprint):
+        if fingerprint:
+            self.fingerprints.set(fingerprint["key"], {
+                "scope": fingerprint["scope"],
+                "probe": fingerprint["probe"],
+                "sha256": fingerprint["sha256"],
+                "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+
+    def hash_export(self, body, table):
+        """Return ``(file object, sha256 hex digest)`` of an export body.
+
+        A streamed body is encoded into a spooled temporary file first, since
+        whether it is uploaded at all depends on the hash.
+        """
+        if isinstance(body, io.BytesIO):
+            digest = hashlib.sha256(body.getbuffer()).hexdigest()
+            body.seek(0)
+            return body, digest
+        spool = tempfile.SpooledTemporaryFile(max_size=PART_SPOOL_MEMORY)
+        try:
+            digest = self.copy_export(body, spool, table)
+        except Exception:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool, digest
+
+    def copy_export(self, body, target, table):
+        """Write an export body to the file object target; return its sha256 hex digest."""
+        digest = hashlib.sha256()
+        if isinstance(body, io.BytesIO):
+            digest.update(body.getbuffer())
+            target.write(body.getbuffer())
+            return digest.hexdigest()
+        try:
+            for chunk in body:
+                digest.update(chunk)
+                target.write(chunk)
+        finally:
+            self.metrics.record_stream(table, body)
+        return digest.hexdigest()
+
+    def finish_auto_table(self, table, tracker, watermark_key, options, log):
+        """Advance the watermark and purge the exported rows once table is uploaded."""
+        self.advance_watermark(table, tracker, watermark_key, log)
+        if options["delete"]:
+            self.delete_uploaded_rows(*options["db_args"], table, tracker,
+                                      chunk_size=options["delete_chunk"],
+                                      throttle_seconds=options["delete_pause"],
+                                      log=log)
+
+    def advance_watermark(self, table, tracker, watermark_key, log):
+        if watermark_key and tracker.watermark():
+            self.watermarks.set(watermark_key, tracker.watermark())
+            log(timestamped_log(f"📌 {table}: {tracker.rows} new row(s), watermark now {tracker.last_date_time}"))
+
+    # ---------------- Outbox ----------------
+    def queue_auto_export(self, table, query, params, tracker, fingerprint, watermark_key, folder_names,
+                          options, log):
+        """Write the export of table into the outbox and hand it to the upload pool.
+
+        Returns ``(status, rows)``. Once the files are safely in the outbox
+        the watermark and fingerprint move on, since the rows are no longer
+        lost if the process dies; the rows are only deleted after the upload
+        (see upload_outbox_job).
+        """
+        fmt = options["format"]
+        base_name = table.replace(' ', '_').lower()
+        self.sweep_outbox(log)
+        path = self.outbox.create()
+        try:
+            if options["split_by"]:
+                files = self.write_split_export(path, query, table, base_name, options, params, tracker)
+            else:
+                files = self.write_export(path, query, table, export_file_name(base_name, fmt), options,
+                                          params, tracker, fingerprint)
+            if not files:
+                self.outbox.abandon(path)
+                log(timestamped_log(f"⚠️ No data found for table {table}, skipping upload."))
+                self.save_fingerprint(fingerprint)
+                return "empty", 0
+            if fingerprint and fingerprint["sha256"] and fingerprint["previous_sha256"] == fingerprint["sha256"]:
+                self.outbox.abandon(path)
+                log(timestamped_log(f"⏸️ {table} has the same content as its last upload, skipping."))
+                self.save_fingerprint(fingerprint)
+                return "unchanged", 0
+            db_args = options["db_args"]
+            job = {
+                "table": table,
+                "folder": folder_names,
+                "files": files,
+                "source": [db_args[0], db_args[3]],
+                "delete": tracker.span() if options["delete"] else None,
+            }
+            job_id = self.outbox.commit(path, job)
+        except Exception:
+            self.outbox.abandon(path)
+            raise
+        log(timestamped_log(f"📥 Queued {table} ({tracker.rows} row(s), {len(files)} file(s)) for upload."))
+        self.save_fingerprint(fingerprint)
+        self.advance_watermark(table, tracker, watermark_key, log)
+        self.submit_outbox_job(job_id, options, log)
+        return "queued", tracker.rows
+
+    def write_export(self, path, query, table, file_name, options, params, tracker, fingerprint):
+        """Write the export of query to file_name in path; return its outbox file entries."""
+        fmt = options["format"]
+        body = self.prepare_export(options["db_args"], query, options["stream"], fmt,
+                                   params=params, tracker=tracker, table=table)
+        if body is None:
+            return []
+        with open(os.path.join(path, file_name), "wb") as f:
+            digest = self.copy_export(body, f, table)
+        if fingerprint:
+            fingerprint["sha256"] = digest
+        return [{"name": file_name, "path": file_name, "mimetype": export_mimetype(fmt),
+                 "properties": file_properties(table, tracker)}]
+
+    def write_split_export(self, path, query, table, base_name, options, params, tracker):
+        """Write the parts and manifest of a split export to path; return their outbox file entries.
+
+        The manifest comes last, so it is also uploaded last.
+        """
+        fmt = options["format"]
+        parts = self.export_parts(options["db_args"], query, table, options, params=params, tracker=tracker)
+        if parts is None:
+            return []
+        files = []
+        manifest = []
+        try:
+            for part in parts:
+                name = part_file_name(base_name, fmt, part.number)
+                with part.body, open(os.path.join(path, name), "wb") as f:
+                    shutil.copyfileobj(part.body, f)
+                properties = file_properties(table, part.stats)
+                properties["appProperties"]["part"] = str(part.number)
+                files.append({"name": name, "path": name, "mimetype": export_mimetype(fmt),
+                              "properties": properties})
+                manifest.append(manifest_entry(base_name, fmt, part))
+        finally:
+            parts.close()
+        name = f"{base_name}.manifest.json"
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(manifest_body(table, options, manifest))
+        files.append({"name": name, "path": name, "mimetype": "application/json",
+                      "properties": file_properties(table, tracker)})
+        return files
+
+    def submit_outbox_job(self, job_id, options, log):
+        """Queue job_id on the outbox upload pool unless it is already there; return its future."""
+        with self._outbox_lock:
+            future = self._outbox_jobs.get(job_id)
+            if future is not None:
+                return future
+            if self._outbox_pool is None:
+                self._outbox_pool = ThreadPoolExecutor(max_workers=max(1, options["outbox_uploads"]),
+                                                       thread_name_prefix="outbox-upload")
+            future = self._outbox_pool.submit(self.upload_outbox_job, job_id, options, log)
+            self._outbox_jobs[job_id] = future
+        future.add_done_callback(lambda _: self._forget_outbox_job(job_id))
+        return future
+
+    def sweep_outbox(self, log):
+        """Once per engine, before its first export is written: drop exports a crashed process left unfinished."""
+        with self._outbox_lock:
+            if self._outbox_swept:
+                return
+            self._outbox_swept = True
+            stale = self.outbox.discard_incomplete()
+        if stale:
+            log(timestamped_log(f"🧹 Discarded {stale} unfinished export(s) from the outbox."))
+
+    def _forget_outbox_job(self, job_id):
+        with self._outbox_lock:
+            self._outbox_jobs.pop(job_id, None)
+
+    def drain_outbox(self, options, log, wait=False):
+        """Upload every export waiting in the outbox, e.g. ones left by an earlier run.
+
+        With wait, blocks until they are done and returns how many failed;
+        failed exports stay in the outbox for the next drain.
+        """
+        self.sweep_outbox(log)
+        futures = [self.submit_outbox_job(job_id, options, log) for job_id, _ in self.outbox.pending()]
+        if not wait:
+            return None
+        with self._outbox_lock:
+            # Include jobs queued by a run that is still going.
+            futures = set(futures) | set(self._outbox_jobs.values())
+        failed = sum(1 for future in futures if not future.result())
+        self.publish_catalog(log, force=True)
+        return failed
+
+    def upload_outbox_job(self, job_id, options, log):
+        """Upload the files of an outbox job, then delete its rows; return whether it succeeded.
+
+        Every uploaded file's Drive ID is saved in the job right away, so a
+        retry after a failure or restart does not upload it again.
+        """
+        from googleapiclient.errors import HttpError
+
+        try:
+            job = self.outbox.load(job_id)
+        except OSError:
+            return True  # finished by an earlier submission
+        table = job["table"]
+        try:
+            folder_id = self.ensure_folder_path(job["folder"])
+            for entry in job["files"]:
+                if entry.get("file_id"):
+                    continue
+                with open(self.outbox.file_path(job_id, entry), "rb") as body:
+                    try:
+                        uploaded = self.upload_file_to_drive(
+                            entry["name"], body, folder_id, mimetype=entry["mimetype"],
+                            resumable=options["resumable"], chunk_size=options["chunk_size"],
+                            log=log, table=table, properties=entry["properties"])
+                    except HttpError as e:
+                        if e.resp.status == 404:
+                            self.folder_cache.invalidate(folder_id)
+                        raise
+                entry["file_id"] = uploaded["id"]
+                self.outbox.update(job_id, job)
+                self.catalog_file(uploaded, entry["name"], entry["properties"],
+                                  {"folder": "/".join(job["folder"]), "source": "/".join(job["source"])}, log)
+            log(timestamped_log(f"✅ Uploaded {table} to Drive ({'/'.join(job['folder'])}) from the outbox."))
+            if job["delete"]:
+                self.delete_outbox_rows(job, options, log)
+        except Exception as e:
+            log(timestamped_log(f"❌ Outbox upload of {table} failed, keeping it for the next run: {e}"))
+            return False
+        self.outbox.remove(job_id)
+        return True
+
+    def delete_outbox_rows(self, job, options, log):
+        db_args = next((db_args for _, db_args in db_sources(options) if [db_args[0], db_args[3]] == job["source"]),
+                       None)
+        if db_args is None:
+            log(timestamped_log(f"⚠️ {job['table']} was exported from {'/'.join(job['source'])}, "
+                                f"not a configured database; rows were not deleted."))
+            return
+        self.delete_uploaded_rows(*db_args, job["table"], RangeTracker.from_span(job["delete"]),
+                                  chunk_size=options["delete_chunk"],
+                                  throttle_seconds=options["delete_pause"],
+                                  log=log)
+
+    # ---------------- Manual upload ----------------
+    def run_manual_tables(self, selected_tables, start_str, end_str, options, log):
+        if options["bundle"] and len(selected_tables) > 1:
+            self.run_manual_bundle(selected_tables, start_str, end_str, options, log)
+            return
+        workers = min(options["workers"], len(selected_tables))
+        get_pool(*options["db_args"], size=workers)
+        if not options["folder_id"] and len(selected_tables) > 1:
+            # Resolve the shared folder once instead of in every worker.
+            try:
+                options = dict(options, folder_id=self.ensure_folder_path(self.manual_folder_names(options)))
+            except Exception as e:
+                log(timestamped_log(f"❌ Could not prepare the Manual folder: {e}"))
+                return
+        estimates = {}
+        if options["preflight"]:
+            estimates = self.preflight(self.manual_exports(selected_tables, start_str, end_str, options), options, log)
+        metadata = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="manual-export") as pool:
+            futures = {}
+            for table in selected_tables:
+                try:
+                    query = self.manual_table_query(table, start_str, end_str, options)
+                except Exception as e:
+                    log(timestamped_log(f"❌ Manual upload error for {table}: {e}"))
+                    continue
+                key = progress_key(options["db_args"], table)
+                futures[pool.submit(self.with_progress, key, table, estimates.get(key), self.process_manual_upload,
+                                    query, table, options, log, defer_metadata=True)] = table
+            for future in as_completed(futures):
+                try:
+                    pending = future.result()
+                except Exception as e:
+                    log(timestamped_log(f"❌ Manual upload error for {futures[future]}: {e}"))
+                    continue
+                if pending:
+                    metadata[pending[0]] = pending[1]
+        self.update_file_metadata(metadata, log)
+
+    def manual_table_query(self, table, start_str, end_str, options):
+        """The query (SQL or a TableScan) of a manual export of table from start_str to end_str."""
+        if options["page_scans"]:
+            return TableScan(table, self.table_key_column(options["db_args"], table), start=start_str, end=end_str)
+        return (f"SELECT * FROM `{table}` WHERE Date_Time BETWEEN '{start_str}' AND '{end_str}'"
+                f"{split_order(options)};")
+
+    def run_manual_bundle(self, selected_tables, start_str, end_str, options, log):
+        """Export selected_tables into one zip archive in the Manual folder.
+
+        Every table is one member in options["format"], followed by a
+        ``manifest.json`` of their rows and Date_Time spans. Up to
+        options["workers"] tables (at least two) are queried and encoded
+        ahead on background threads while the archive compresses and uploads
+        the current one, so the click costs a single upload. Bundles are not
+        split into parts. A table that fails aborts the whole archive, so
+        nothing is uploaded and no rows are deleted.
+        """
+        fmt = options["format"]
+        db_args = options["db_args"]
+        ahead = max(2, options["workers"])
+        get_pool(*db_args, size=ahead)
+        if options["split_by"]:
+            log(timestamped_log("⚠️ Bundles are not split into parts; exporting every table whole."))
+        if options["folder_id"]:
+            target_folder_id = options["folder_id"]
+        else:
+            target_folder_id = self.ensure_folder_path(self.manual_folder_names(options))
+        estimates = {}
+        if options["preflight"]:
+            estimates = self.preflight(self.manual_exports(selected_tables, start_str, end_str, options), options, log)
+        filename = options["file_name"] or f"manual_{start_str}_{end_str}".replace(" ", "_").replace(":", "")
+        if not filename.endswith(BUNDLE_EXTENSION):
+            filename += BUNDLE_EXTENSION
+        trackers = {}
+        # Members in the archive so far; manifest lists those finished.
+        names = []
+        manifest = []
+
+        def member_chunks(table):
+            try:
+                tracker = trackers[table] = RangeTracker(
+                    self.table_key_column(db_args, table) if options["delete"] else None)
+                query = self.manual_table_query(table, start_str, end_str, options)
+                body = self.prepare_export(db_args, query, True, fmt, tracker=tracker, table=table)
+                if body is None:
+                    return
+                try:
+                    yield from body
+                finally:
+                    self.metrics.record_stream(table, body)
+            except Exception as e:
+                log(timestamped_log(f"❌ Manual upload error for {table}: {e}"))
+                raise
+
+        def start(table):
+            log(timestamped_log(f"🔍 Fetching data for {table}..."))
+            key = progress_key(db_args, table)
+            self.progress.begin(key, table, estimates.get(key))
+            return table, Prefetch(member_chunks(table), BUNDLE_PREFETCH_CHUNKS, name=f"bundle-{table}")
+
+        def members():
+            waiting = iter(selected_tables)
+            started = deque(start(table) for table in islice(waiting, ahead))
+            try:
+                while started:
+                    table, chunks = started.popleft()
+                    following = next(waiting, None)
+                    if following is not None:
+                        started.append(start(following))
+                    try:
+                        chunks = iter(chunks)
+                        first = next(chunks, None)
+                        if first is None:
+                            log(timestamped_log(f"⚠️ No data found for {table}."))
+                            continue
+                        name = export_file_name(table.replace(' ', '_').lower(), fmt)
+                        counted = StageClock(chain([first], chunks))
+                        names.append(name)
+                        yield name, counted
+                    finally:
+                        chunks.close()
+                        self.progress.end(progress_key(db_args, table))
+                    tracker = trackers[table]
+                    manifest.append({
+                        "name": name,
+                        "table": table,
+                        "rows": tracker.rows,
+                        "bytes": counted.amount,
+                        "first_date_time": _json_value(tracker.min_date_time),
+                        "last_date_time": _json_value(tracker.max_date_time),
+                    })
+            finally:
+                for table, chunks in started:
+                    chunks.close()
+                    self.progress.end(progress_key(db_args, table))
+            body = {"format": fmt, "start": start_str, "end": end_str,
+                    "created": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+                    "rows": sum(entry["rows"] for entry in manifest), "tables": manifest}
+            yield "manifest.json", [json.dumps(body, indent=1).encode("utf-8")]
+
+        parts = members()
+        zipped = iter_zip_chunks(parts)
+        try:
+            # The archive yields nothing before its first member has data, or before the manifest.
+            first = next(zipped)
+            if not names:
+                log(timestamped_log(f"⚠️ No data found for {', '.join(selected_tables)}."))
+                return
+            log(timestamped_log(f"⬆️ Uploading {len(selected_tables)} table(s) as '{filename}' to Google Drive..."))
+            archive = chain([first], zipped)
+            body = StageClock(archive) if options["stream"] else io.BytesIO(b"".join(archive))
+            uploaded = self.upload_file_to_drive(filename, body, target_folder_id, mimetype=BUNDLE_MIMETYPE,
+                                                 resumable=options["resumable"], chunk_size=options["chunk_size"],
+                                                 log=log, table=filename)
+        finally:
+            zipped.close()
+            parts.close()
+        log(timestamped_log(f"✅ Uploaded {len(manifest)} table(s) as {filename} "
+                            f"({uploaded['bytes'] / 1048576:,.1f} MB) to Manual folder."))
+        if options["delete"]:
+            for entry in manifest:
+                self.delete_uploaded_rows(*db_args, entry["table"], trackers[entry["table"]],
+                                          chunk_size=options["delete_chunk"],
+                                          throttle_seconds=options["delete_pause"],
+                                          log=log)
+
+    def manual_folder_names(self, options):
+        folder_names = ["Manual"]
+        if options["subfolder"]:
+            folder_names.append(options["subfolder"])
+        return folder_names
+
+    def process_manual_upload(self, query, table_name, options, log, defer_metadata=False):
+        """Export query as table_name into the Manual folder.
+
+        Metadata of a streamed export is only known after its upload. With
+        defer_metadata it is returned as ``(file_id, body)`` for the caller
+        to batch with other files; otherwise it is written right away.
+        """
+        from googleapiclient.errors import HttpError
+
+        log(timestamped_log(f"🔍 Fetching data for {table_name}..."))
+        fmt = options["format"]
+        db_args = options["db_args"]
+        tracker = None
+        if table_name in self.tables_and_queries:
+            tracker = RangeTracker(self.table_key_column(db_args, table_name) if options["delete"] else None)
+        if options["split_by"]:
+            self.process_manual_split_upload(query, table_name, tracker, options, log)
+            return None
+        csv_buffer = self.prepare_export(db_args, query, options["stream"], fmt, tracker=tracker, table=table_name)
+        if csv_buffer is None:
+            log(timestamped_log(f"⚠️ No data found for {table_name}."))
+            return
+        log(timestamped_log(f"📄 Preparing {fmt} for {table_name}..."))
+        if options["folder_id"]:
+            target_folder_id = options["folder_id"]
+        else:
+            target_folder_id = self.ensure_folder_path(self.manual_folder_names(options))
+
+        filename = options["file_name"] or export_file_name(table_name.replace(' ', '_').lower(), fmt)
+        streamed = not isinstance(csv_buffer, io.IOBase)
+
+        log(timestamped_log(f"⬆️ Uploading file '{filename}' to Google Drive..."))
+        try:
+            uploaded = self.upload_file_to_drive(
+                filename, csv_buffer, target_folder_id,
+                mimetype=export_mimetype(fmt),
+                resumable=options["resumable"],
+                chunk_size=options["chunk_size"],
+                log=log, table=table_name,
+                properties=file_properties(table_name, tracker) if tracker and not streamed else None)
+        except HttpError as e:
+            if e.resp.status == 404:
+                # The cached folder was deleted in Drive; the next attempt resolves it again.
+                self.folder_cache.invalidate(target_folder_id)
+            raise
+        log(timestamped_log(f"✅ Uploaded {filename} to Manual folder."))
+
+        if options["delete"]:
+            if tracker is None:
+                log(timestamped_log("⚠️ Rows are not deleted for custom SQL exports."))
+            else:
+                self.delete_uploaded_rows(*db_args, table_name, tracker,
+                                          chunk_size=options["delete_chunk"],
+                                          throttle_seconds=options["delete_pause"],
+                                          log=log)
+        if tracker and streamed:
+            pending = (uploaded["id"], file_properties(table_name, tracker))
+            if defer_metadata:
+                return pending
+            self.update_file_metadata(dict([pending]), log)
+        return None
+
+    def process_manual_split_upload(self, query, table_name, tracker, options, log):
+        fmt = options["format"]
+        if options["folder_id"]:
+            target_folder_id = options["folder_id"]
+        else:
+            target_folder_id = self.ensure_folder_path(self.manual_folder_names(options))
+        if options["file_name"]:
+            base_name = strip_export_extension(options["file_name"], fmt)
+        else:
+            base_name = table_name.replace(' ', '_').lower()
+        parts = self.upload_split_export(options["db_args"], query, table_name, base_name,
+                                         lambda: target_folder_id, options, log, tracker=tracker)
+        if not parts:
+            log(timestamped_log(f"⚠️ No data found for {table_name}."))
+            return
+        log(timestamped_log(f"✅ Uploaded {table_name} to Manual folder as {parts} part(s)."))
+
+        if options["delete"]:
+            if tracker is None:
+                log(timestamped_log("⚠️ Rows are not deleted for custom SQL exports."))
+            else:
+                self.delete_uploaded_rows(*options["db_args"], table_name, tracker,
+                                          chunk_size=options["delete_chunk"],
+                                          throttle_seconds=options["delete_pause"],
+                                          log=log)
+
+    def upload_split_export(self, db_args, query, table, base_name, get_folder_id, options, log,
+                            params=None, tracker=None, catalog=None):
+        """Export query as ``base_name.part-NNNN`` files plus ``base_name.manifest.json``.
+
+        The files go to the folder get_folder_id() returns once the first
+        part is ready.
+
+        Parts are cut as options["split_by"] asks (see iter_export_parts)
+        and up to options["part_uploads"] of them upload concurrently while
+        the next one is encoded. The manifest lists every part with its row
+        count and ``Date_Time`` span and is only uploaded once all parts are
+        in Drive, so a folder without a manifest holds an incomplete export.
+        Split exports always read the rows through a streaming cursor.
+
+        Every file is added to the export catalog under catalog (see
+        catalog_file). Returns the number of parts, or 0 when the query has
+        no rows.
+        """
+        fmt = options["format"]
+        parts = self.export_parts(db_args, query, table, options, params=params, tracker=tracker)
+        if parts is None:
+            return 0
+        manifest = []
+
+        folder_id = None
+
+        def upload_part(part, folder_id):
+            name = part_file_name(base_name, fmt, part.number)
+            properties = file_properties(table, part.stats)
+            properties["appProperties"]["part"] = str(part.number)
+            try:
+                uploaded = self.upload_file_to_drive(name, part.body, folder_id, mimetype=export_mimetype(fmt),
+                                                     resumable=options["resumable"],
+                                                     chunk_size=options["chunk_size"],
+                                                     table=table, properties=properties)
+            finally:
+                part.body.close()
+            self.catalog_file(uploaded, name, properties, catalog, log)
+            return name
+
+        workers = max(1, options["part_uploads"])
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="part-upload") as pool:
+            uploading = set()
+            try:
+                for part in parts:
+                    manifest.append(manifest_entry(base_name, fmt, part))
+                    if folder_id is None:
+                        folder_id = get_folder_id()
+                    uploading.add(pool.submit(upload_part, part, folder_id))
+                    # Keep at most `workers` finished parts waiting, so spooled parts stay bounded.
+                    if len(uploading) >= workers:
+                        done, uploading = wait(uploading, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+            except BaseException:
+                # Parts not yet started are not worth uploading without a manifest.
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            finally:
+                parts.close()
+            for future in as_completed(uploading):
+                future.result()
+
+        properties = file_properties(table, tracker) if tracker else None
+        uploaded = self.upload_file_to_drive(f"{base_name}.manifest.json",
+                                             io.BytesIO(manifest_body(table, options, manifest)), folder_id,
+                                             mimetype="application/json", table=table, properties=properties)
+        self.catalog_file(uploaded, f"{base_name}.manifest.json", properties, catalog, log)
+        return len(manifest)
+
+    def export_parts(self, db_args, query, table, options, params=None, tracker=None):
+        """Return a generator of the ExportPart files of query, or None when it has no rows.
+
+        Fetch and encode are recorded once the generator is exhausted or
+        closed.
+        """
+        raw = supports_raw_rows(options["format"], options["split_by"])
+        started = time.perf_counter()
+        try:
+            opened = self.open_rows(db_args, query, table, params, raw)
+        except Exception:
+            self.metrics.record("fetch", table, seconds=time.perf_counter() - started, error=True)
+            raise
+        if opened is None:
+            self.metrics.record("fetch", table, seconds=time.perf_counter() - started)
+            return None
+        description, batches = opened
+        columns = [desc[0] for desc in description]
+        fetched = StageClock(batches)
+        fetched.seconds = time.perf_counter() - started
+        batches = fetched
+        if tracker:
+            tracker.set_columns(columns, description if raw else None)
+            batches = tracker.track(batches)
+        parts = StageClock(iter_export_parts(options["format"], columns, batches, description, options["split_by"],
+                                             options["split_size"], raw=raw), measure=lambda part: part.size)
+        self.progress.watch(progress_key(db_args, table), rows=fetched, nbytes=parts)
+
+        def recorded_parts():
+            try:
+                yield from parts
+            finally:
+                self.metrics.record("fetch", table, seconds=fetched.seconds, rows=fetched.amount,
+                                    error=fetched.failed)
+                self.metrics.record("encode", table, seconds=max(parts.seconds - fetched.seconds, 0.0),
+                                    rows=fetched.amount, nbytes=parts.amount,
+                                    error=parts.failed and not fetched.failed)
+
+        return recorded_parts()
+
+    # ---------------- DB and Drive helpers ----------------
+    def prepare_export(self, db_args, query, stream, fmt="csv", params=None, tracker=None, table=None):
+        """Return the file body for query in format fmt, or None when it has no rows.
+
+        In stream mode the body is a StageClock over the encoded chunks, fed
+        by a server-side cursor; fetch and encode are timed while it is
+        consumed and recorded by upload_file_to_drive(). Otherwise it is the
+        fully buffered BytesIO and both stages are recorded here. When a
+        RangeTracker is given it sees every exported row. CSV exports read
+        the rows through a raw cursor (see supports_raw_rows).
+        """
+        raw = supports_raw_rows(fmt)
+        if stream:
+            started = time.perf_counter()
+            try:
+                opened = self.open_rows(db_args, query, table, params, raw)
+            except Exception:
+                self.metrics.record("fetch", table, seconds=time.perf_counter() - started, error=True)
+                raise
+            if opened is None:
+                self.metrics.record("fetch", table, seconds=time.perf_counter() - started)
+                return None
+            description, batches = opened
+            columns = [desc[0] for desc in description]
+            fetched = StageClock(batches)
+            fetched.seconds = time.perf_counter() - started
+            batches = fetched
+            if tracker:
+                tracker.set_columns(columns, description if raw else None)
+                batches = tracker.track(batches)
+            encoded = StageClock(iter_export_chunks(fmt, columns, batches, description, raw), upstream=fetched)
+            self.progress.watch(progress_key(db_args, table), rows=fetched, nbytes=encoded)
+            return encoded
+        started = time.perf_counter()
+        try:
+            description, rows = self.fetch_data_from_db(*db_args, query, params=params, raw=raw, table=table)
+        except Exception:
+            self.metrics.record("fetch", table, seconds=time.perf_counter() - started, error=True)
+            raise
+        self.metrics.record("fetch", table, seconds=time.perf_counter() - started, rows=len(rows))
+        self.progress.add(progress_key(db_args, table), rows=len(rows))
+        if not rows:
+            return None
+        columns = [desc[0] for desc in description]
+        if tracker:
+            tracker.set_columns(columns, description if raw else None)
+            tracker.observe(rows)
+        started = time.perf_counter()
+        body = io.BytesIO(b"".join(iter_export_chunks(fmt, columns, [rows], description, raw)))
+        self.metrics.record("encode", table, seconds=time.perf_counter() - started, rows=len(rows),
+                            nbytes=body.getbuffer().nbytes)
+        self.progress.add(progress_key(db_args, table), nbytes=body.getbuffer().nbytes)
+        return body
+
+    def open_rows(self, db_args, query, table, params=None, raw=False):
+        """open_query_stream() under db_retry. Every page of a TableScan is
+        retried on its own and recorded as a "page" stage."""
+        return self.db_retry(f"query of {table}")(lambda: open_query_stream(
+            *db_args, query, batch_size=self.stream_batch_size, params=params, raw=raw, **self.scan_args(table)))
+
+    def scan_args(self, table):
+        return dict(page_rows=self.scan_page_rows, retry=self.db_retry(f"page of {table}"),
+                    on_page=lambda rows, seconds: self.metrics.record("page", table, seconds=seconds, rows=rows))
+
+    def table_key_column(self, db_args, table):
+        cache_key = (db_args[0], db_args[3], table)
+        if cache_key not in self.table_key_columns:
+            self.table_key_columns[cache_key] = self.db_retry(f"key column of {table}")(
+                lambda: primary_key_column(*db_args, table))
+        return self.table_key_columns[cache_key]
+
+    def fetch_data_from_db(self, host, user, password, dbname, query, params=None, raw=False, table=None):
+        """Run query (SQL or a TableScan) and return ``(cursor.description, rows)`` with every row in memory."""
+        if isinstance(query, TableScan):
+            batches = iter_table_scan(host, user, password, dbname, query, self.stream_batch_size, raw,
+                                      **self.scan_args(table or query.table))
+            description = next(batches)
+            return description, [row for batch in batches for row in batch]
+        with get_pool(host, user, password, dbname).connection() as conn:
+            cursor = conn.cursor(raw=raw)
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            description = cursor.description
+            cursor.close()
+        return description, rows
+
+    def upload_file_to_drive(self, file_name, file_buffer, folder_id, mimetype="text/csv", resumable=False,
+                             chunk_size=DEFAULT_OPTIONS["chunk_size"], log=None, table=None, properties=None):
+        """Upload file_buffer and record the upload stage for table.
+
+        A streamed body (StageClock) is fetched and encoded while it is
+        uploaded; that time is recorded as fetch/encode, not as upload.
+        properties is extra file metadata (see file_properties). Returns
+        Drive's ``{"id", "md5Checksum"}`` plus the "bytes" uploaded.
+        """
+        started = time.perf_counter()
+        try:
+            res = self._upload(file_name, file_buffer, folder_id, mimetype, resumable, chunk_size, log, properties)
+        except Exception:
+            seconds = time.perf_counter() - started
+            if isinstance(file_buffer, StageClock):
+                seconds -= self.record_body(table, file_buffer)
+                upstream_failed = file_buffer.failed or bool(file_buffer.upstream and file_buffer.upstream.failed)
+            else:
+                upstream_failed = False
+            self.metrics.record("upload", table, seconds=max(seconds, 0.0), error=not upstream_failed)
+            raise
+        seconds = time.perf_counter() - started
+        if isinstance(file_buffer, StageClock):
+            seconds -= self.record_body(table, file_buffer)
+            size = file_buffer.amount
+        elif isinstance(file_buffer, io.IOBase):
+            size = file_buffer.seek(0, io.SEEK_END)
+        else:
+            size = 0
+        self.metrics.record("upload", table, seconds=max(seconds, 0.0), nbytes=size)
+        return dict(res, bytes=size)
+
+    def record_body(self, table, body):
+        """Record the fetch and encode stages of a streamed body and return the seconds it took.
+
+        Bodies without an upstream (bundles) record their stages per member.
+        """
+        if body.upstream is None:
+            return body.seconds
+        return self.metrics.record_stream(table, body)
+
+    def _upload(self, file_name, file_buffer, folder_id, mimetype, resumable, chunk_size, log, properties=None):
+        from googleapiclient.http import MediaIoBaseUpload
+        from DriveHelpers import StreamingMediaUpload, execute_upload, resumable_upload
+
+        progress_callback = self.upload_progress_logger(log) if log else None
+        retry = self.drive_retry(f"upload of {file_name}", log)
+        if resumable:
+            return resumable_upload(self.service, self.upload_sessions, file_name, file_buffer, folder_id,
+                                    mimetype=mimetype, chunk_size=chunk_size,
+                                    progress_callback=progress_callback, properties=properties, retry=retry)
+        file_metadata = dict(properties or {}, name=file_name, parents=[folder_id])
+        if isinstance(file_buffer, io.BytesIO):
+            media = MediaIoBaseUpload(file_buffer, mimetype=mimetype)
+        elif isinstance(file_buffer, io.IOBase):
+            # Spooled files can be large; send them in chunks, not as one multipart body.
+            media = MediaIoBaseUpload(file_buffer, mimetype=mimetype, chunksize=chunk_size, resumable=True)
+        else:
+            media = StreamingMediaUpload(file_buffer, mimetype=mimetype, chunksize=chunk_size)
+        request = self.service.files().create(body=file_metadata, media_body=media, fields="id, md5Checksum")
+        if media.resumable():
+            # Chunked: a retry resends the failed chunk, not the whole file.
+            return execute_upload(request, retry)
+        return retry(request.execute)
+
+    def catalog_file(self, uploaded, name, properties, catalog, log):
+        """Add an uploaded file to the export catalog.
+
+        catalog is ``{"folder", "source"}`` of the file, or None for files
+        that are not catalogued (manual exports).
+        """
+        if catalog is None:
+            return
+        app_properties = (properties or {}).get("appProperties", {})
+        if name.endswith(".manifest.json"):
+            kind = "manifest"
+        else:
+            kind = "part" if "part" in app_properties else "export"
+        try:
+            self.catalog.add(dict(
+                catalog, file_id=uploaded["id"], name=name, kind=kind, table_name=app_properties.get("table", ""),
+                rows=int(app_properties["rows"]) if "rows" in app_properties else None,
+                first_date_time=app_properties.get("first_date_time"),
+                last_date_time=app_properties.get("last_date_time"),
+                bytes=uploaded.get("bytes"), md5=uploaded.get("md5Checksum")))
+        except sqlite3.Error as e:
+            log(timestamped_log(f"⚠️ Could not add {name} to the export catalog: {e}"))
+
+    def publish_catalog(self, log, force=False):
+        """Upload the changed daily shards of the export catalog (see ExportCatalog).
+
+        Today's shard is uploaded at most every CATALOG_MIRROR_SECONDS
+        unless force; it keeps growing until the day is over, and the last
+        upload of a day happens on the first publish of the next. Every
+        shard is updated in place, so its Drive ID stays the same.
+        """
+        from googleapiclient.errors import HttpError
+        from googleapiclient.http import MediaIoBaseUpload
+
+        with self._catalog_lock:
+            today = f"{datetime.now():%Y-%m-%d}"
+            due = force or time.monotonic() - self._catalog_published >= CATALOG_MIRROR_SECONDS
+            days = [day for day in self.catalog.changed_days() if due or day < today]
+            for day in days:
+                name = mirror_name(day)
+                fd, path = tempfile.mkstemp(suffix=".sqlite")
+                os.close(fd)
+                try:
+                    rows = self.catalog.snapshot(path, day)
+                    with open(path, "rb") as f:
+                        content = f.read()
+                    retry = self.drive_retry(f"upload of {name}", log)
+                    file_id = self.catalog.get_meta(f"mirror_file_id:{day}")
+                    if file_id:
+                        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=MIRROR_MIMETYPE)
+                        try:
+                            retry(self.service.files().update(fileId=file_id, media_body=media, fields="id").execute)
+                        except HttpError as e:
+                            if e.resp.status != 404:
+                                raise
+                            file_id = None
+                    if not file_id:
+                        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=MIRROR_MIMETYPE)
+                        body = {"name": name, "parents": [self.ensure_folder_path(["Auto", MIRROR_FOLDER, day[:7]])]}
+                        created = retry(self.service.files().create(body=body, media_body=media, fields="id").execute)
+                        self.catalog.set_meta(f"mirror_file_id:{day}", created["id"])
+                    self.catalog.mirrored(day, rows)
+                except Exception as e:
+                    log(timestamped_log(f"⚠️ Could not upload the export catalog shard {name}: {e}"))
+                finally:
+                    os.remove(path)
+            if today in days:
+                self._catalog_published = time.monotonic()
+
+    def upload_progress_logger(self, log):
+        def log_progress(file_name, uploaded, total):
+            percent = uploaded * 100 // total if total else 100
+            log(timestamped_log(f"⬆️ {file_name}: {percent}% ({uploaded / 1048576:.1f} of {total / 1048576:.1f} MB)"))
+        return log_progress
+
+    def resume_interrupted_uploads(self, log):
+        from DriveHelpers import resume_pending_uploads
+
+        pending = self.upload_sessions.pending()
+        if not pending:
+            return
+        log(timestamped_log(f"🔁 Resuming {len(pending)} interrupted upload(s)..."))
+        results = resume_pending_uploads(self.service, self.upload_sessions,
+                                         progress_callback=self.upload_progress_logger(log),
+                                         retry=self.drive_retry("resumed upload", log))
+        for file_name, result in results:
+            if isinstance(result, Exception):
+                log(timestamped_log(f"❌ Could not resume {file_name}: {result}"))
+            else:
+                log(timestamped_log(f"✅ Resumed upload of {file_name} completed."))
+
+    def update_file_metadata(self, updates, log):
+        """Set metadata on uploaded files in one batch; updates maps file ID to a body.
+
+        Streamed exports only know their row count and Date_Time span after
+        the upload, so their metadata is written here once the run is over.
+        """
+        from DriveHelpers import execute_batch
+
+        if not updates:
+            return
+        service = self.service
+        requests = {file_id: service.files().update(fileId=file_id, body=body, fields="id")
+                    for file_id, body in updates.items()}
+        started = time.perf_counter()
+        try:
+            results = retry_batch(lambda pending: execute_batch(service, pending), requests, "metadata update",
+                                  governor=self.drive_governor, log=lambda msg: log(timestamped_log(msg)))
+        except Exception as e:
+            self.metrics.record("metadata", seconds=time.perf_counter() - started, error=True)
+            log(timestamped_log(f"⚠️ Could not update file metadata: {e}"))
+            return
+        failed = [result for result in results.values() if isinstance(result, Exception)]
+        self.metrics.record("metadata", seconds=time.perf_counter() - started, rows=len(requests), error=bool(failed))
+        if failed:
+            log(timestamped_log(f"⚠️ Could not update metadata of {len(failed)} file(s): {failed[0]}"))
+
+    def delete_uploaded_rows(self, host, user, password, dbname, table_name, tracker, log,
+                             chunk_size=DEFAULT_DELETE_CHUNK, throttle_seconds=0.0):
+        """Purge the rows tracker saw in the export, in small committed chunks."""
+        if tracker.min_date_time is None:
+            log(timestamped_log(f"⚠️ No Date_Time range known for {table_name}; rows were not deleted."))
+            return 0
+        started = time.perf_counter()
+        try:
+            deleted, seconds = purge_exported_rows(host, user, password, dbname, table_name, tracker,
+                                                   chunk_size=chunk_size, throttle_seconds=throttle_seconds,
+                                                   retry=self.db_retry(f"delete from {table_name}", log))
+        except Exception:
+            self.metrics.record("delete", table_name, seconds=time.perf_counter() - started, error=True)
+            raise
+        self.metrics.record("delete", table_name, seconds=seconds, rows=deleted)
+        rate = deleted / seconds if seconds else deleted
+        log(timestamped_log(
+            f"🗑️ Deleted {deleted} exported row(s) from table {table_name} in {seconds:.1f}s ({rate:.0f} rows/s)."))
+        return deleted
+
+    def ensure_folder_path(self, folder_names, parent_id="root"):
+        """Resolve nested folder_names under parent_id, creating what is missing."""
+        return self.resolve_folder_paths([folder_names], parent_id)[0]
+
+    def get_or_create_folder(self, folder_name, parent_id):
+        return self.resolve_folder_paths([[folder_name]], parent_id)[0]
+
+    def resolve_folder_paths(self, paths, parent_id="root"):
+        """Resolve several nested folder paths under parent_id; return their IDs.
+
+        The paths are walked one level at a time. All lookups of a level go
+        to Drive in one batch request and all folders still missing are
+        created in a second one, so the number of round trips depends on the
+        depth and not on the number of paths. Folders below a folder created
+        here cannot exist yet and are not looked up.
+
+        If Drive reports a cached folder as gone (404), the cached folders of
+        these paths are dropped and the paths are resolved once more from
+        the top; which level of a path disappeared is not known. Calls run
+        one at a time, so parallel exports never create a folder twice.
+        """
+        from googleapiclient.errors import HttpError
+
+        for attempt in range(2):
+            try:
+                with self._folder_lock:
+                    return self._resolve_folder_paths(paths, parent_id)
+            except HttpError as e:
+                if e.resp.status != 404 or attempt:
+                    raise
+                for top in {names[0] for names in paths if names}:
+                    cached_id = self.folder_cache.lookup(parent_id, top)
+                    if cached_id:
+                        self.folder_cache.invalidate(cached_id)
+
+    def _resolve_folder_paths(self, paths, parent_id):
+        folder_ids = [parent_id] * len(paths)
+        created = set()
+        for depth in range(max(len(names) for names in paths)):
+            wanted = {(folder_ids[i], names[depth]) for i, names in enumerate(paths) if depth < len(names)}
+            resolved = self._resolve_folder_level(wanted, created)
+            for i, names in enumerate(paths):
+                if depth < len(names):
+                    folder_ids[i] = resolved[(folder_ids[i], names[depth])]
+        return folder_ids
+
+    def _resolve_folder_level(self, wanted, created):
+        """Return {(parent_id, name): folder_id} for wanted, adding new folder IDs to created."""
+        from DriveHelpers import FOLDER_MIMETYPE, folder_query
+
+        resolved = {}
+        missing = []
+        for parent, name in wanted:
+            cached_id = self.folder_cache.lookup(parent, name)
+            if cached_id:
+                resolved[(parent, name)] = cached_id
+            else:
+                missing.append((parent, name))
+        if not missing:
+            return resolved
+
+        service = self.service
+        lookups = {(parent, name): service.files().list(q=folder_query(name, parent), fields="files(id, name)")
+                   for parent, name in missing if parent not in created}
+        to_create = [(parent, name) for parent, name in missing if parent in created]
+        for key, response in self._folder_batch(service, lookups).items():
+            files = response.get("files", [])
+            if files:
+                resolved[key] = files[0]["id"]
+                self.folder_cache.store(*key, files[0]["id"])
+            else:
+                to_create.append(key)
+
+        creates = {(parent, name): service.files().create(
+                       body={"name": name, "mimeType": FOLDER_MIMETYPE, "parents": [parent]}, fields="id")
+                   for parent, name in to_create}
+        for key, response in self._folder_batch(service, creates).items():
+            resolved[key] = response["id"]
+            created.add(response["id"])
+            self.folder_cache.store(*key, response["id"])
+        return resolved
+
+    def _folder_batch(self, service, requests):
+        """Run one batch of folder requests, recording it as one folder stage call."""
+        from DriveHelpers import execute_batch
+
+        if not requests:
+            return {}
+        started = time.perf_counter()
+        try:
+            results = retry_batch(lambda pending: execute_batch(service, pending), requests, "folder lookup",
+                                  governor=self.drive_governor)
+        except Exception:
+            self.metrics.record("folder", seconds=time.perf_counter() - started, error=True)
+            raise
+        errors = [(key, result) for key, result in results.items() if isinstance(result, Exception)]
+        self.metrics.record("folder", seconds=time.perf_counter() - started, rows=len(requests), error=bool(errors))
+        if errors:
+            raise errors[0][1]
+        return results
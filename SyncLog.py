@@ -0,0 +1,66 @@
+import logging
+import queue
+import sys
+from collections import namedtuple
+from logging.handlers import QueueListener, RotatingFileHandler
+
+LOG_FILE = "sync.log"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+LogEvent = namedtuple("LogEvent", "channel message")
+
+
+class LogSink:
+    """Collect log lines from any thread without blocking the caller.
+
+    emit() only puts the event on two unbounded queues: one drained by the
+    GUI (see drain()), one written by a background QueueListener to a
+    rotating log file and, with console=True, to stdout. Memory therefore
+    stays flat however long a sync runs. Pass keep_events=False when nothing
+    calls drain(), e.g. in the headless runner.
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 console=False, keep_events=True):
+        self.keep_events = keep_events
+        self._events = queue.SimpleQueue()
+        self._records = queue.SimpleQueue()
+        handlers = []
+        if path:
+            file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding="utf-8", delay=True)
+            file_handler.setFormatter(logging.Formatter("%(name)-6s %(message)s"))
+            handlers.append(file_handler)
+        if console:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        self._listener = QueueListener(self._records, *handlers) if handlers else None
+        if self._listener:
+            self._listener.start()
+
+    def emit(self, channel, message):
+        if self.keep_events:
+            self._events.put(LogEvent(channel, message))
+        if self._listener:
+            self._records.put(logging.makeLogRecord({"msg": message, "levelno": logging.INFO,
+                                                     "levelname": "INFO", "name": channel}))
+
+    def channel(self, name):
+        """Return a ``log(message)`` callable bound to one channel."""
+        return lambda message: self.emit(name, message)
+
+    def drain(self, limit=2000):
+        """Return up to limit queued events, oldest first."""
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def close(self):
+        """Write out everything queued so far and stop the writer thread."""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
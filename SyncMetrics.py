@@ -0,0 +1,308 @@
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RUN_SUMMARY_DIR = "sync_runs"
+RUN_SUMMARY_KEEP = 500
+FIELDS = ("calls", "errors", "seconds", "rows", "bytes")
+# Stages recorded without a table, for Drive calls shared by a whole run.
+SHARED_STAGES = ("folder", "metadata")
+
+
+class StageClock:
+    """Iterator wrapper that times how long pulling each item takes.
+
+    Streaming exports run the DB fetch and the encoder lazily inside the
+    upload, so their time can only be measured from the iterators
+    themselves. ``seconds`` includes everything upstream of the iterator;
+    ``amount`` adds up ``measure(item)``. ``failed`` is set when the
+    iterator raised.
+    """
+
+    def __init__(self, iterable, measure=len, upstream=None):
+        self._iterator = iter(iterable)
+        self.measure = measure
+        self.upstream = upstream
+        self.seconds = 0.0
+        self.amount = 0
+        self.failed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self.seconds += time.perf_counter() - started
+            raise
+        except Exception:
+            self.seconds += time.perf_counter() - started
+            self.failed = True
+            raise
+        self.seconds += time.perf_counter() - started
+        self.amount += self.measure(item)
+        return item
+
+
+def format_duration(seconds):
+    return str(timedelta(seconds=round(seconds)))
+
+
+def format_estimate(label, estimate):
+    """One line describing a pre-flight estimate ``{"rows", "bytes", "seconds"}``."""
+    return (f"{label}: about {estimate['rows']:,} row(s), {estimate['bytes'] / 1048576:,.1f} MB, "
+            f"{format_duration(estimate['seconds'])}")
+
+
+class _ProgressEntry:
+    def __init__(self, label, estimate):
+        self.label = label
+        self.estimate = estimate or {}
+        self.started = time.monotonic()
+        self.rows = 0
+        self.bytes = 0
+        self.clocks = []
+
+    def report(self):
+        rows = self.rows + sum(clock.amount for clock, _ in self.clocks if clock)
+        nbytes = self.bytes + sum(clock.amount for _, clock in self.clocks if clock)
+        seconds = time.monotonic() - self.started
+        expected_rows = self.estimate.get("rows")
+        rows_per_s = rows / seconds if seconds and rows else None
+        if expected_rows is None:
+            eta = None
+        elif rows_per_s:
+            eta = max(expected_rows - rows, 0) / rows_per_s
+        else:
+            eta = self.estimate.get("seconds")
+        return {
+            "table": self.label,
+            "rows": rows,
+            "expected_rows": expected_rows,
+            "bytes": nbytes,
+            "expected_bytes": self.estimate.get("bytes"),
+            "seconds": round(seconds, 1),
+            "rows_per_s": round(rows_per_s) if rows_per_s else None,
+            "mb_per_s": round(nbytes / seconds / 1048576, 2) if seconds and nbytes else None,
+            "eta_seconds": round(eta) if eta is not None else None,
+        }
+
+
+class Progress:
+    """Live row and byte counts of the exports in flight, with rates and ETA.
+
+    begin() starts an export, optionally with its pre-flight estimate
+    ``{"rows", "bytes", "seconds"}``. The engine then attaches the
+    StageClocks counting its rows and encoded bytes with watch(), or adds
+    counts of buffered exports with add(); both are read live by
+    snapshot() and lines(). Exports are identified by any hashable key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def begin(self, key, label, estimate=None):
+        with self._lock:
+            self._entries[key] = _ProgressEntry(label, estimate)
+
+    def end(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def watch(self, key, rows=None, nbytes=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry.clocks.append((rows, nbytes))
+
+    def add(self, key, rows=0, nbytes=0):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry.rows += rows
+                entry.bytes += nbytes
+
+    def snapshot(self):
+        with self._lock:
+            entries = list(self._entries.values())
+        return [entry.report() for entry in entries]
+
+    def lines(self):
+        """One human-readable line per export in flight."""
+        lines = []
+        for report in self.snapshot():
+            line = f"{report['table']}: {report['rows']:,}"
+            if report["expected_rows"]:
+                percent = min(100, report["rows"] * 100 // report["expected_rows"])
+                line += f" of ~{report['expected_rows']:,} row(s) ({percent}%)"
+            else:
+                line += " row(s)"
+            if report["rows_per_s"]:
+                line += f", {report['rows_per_s']:,} rows/s"
+            if report["mb_per_s"]:
+                line += f", {report['mb_per_s']:.1f} MB/s"
+            if report["eta_seconds"] is not None:
+                line += f", ETA {format_duration(report['eta_seconds'])}"
+            lines.append(line)
+        return lines
+
+
+class Metrics:
+    """Thread-safe totals per ``(stage, table)``: calls, errors, seconds, rows, bytes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self.last_run = None
+
+    def record(self, stage, table="", seconds=0.0, rows=0, nbytes=0, error=False):
+        with self._lock:
+            totals = self._totals.setdefault((stage, table or ""), dict.fromkeys(FIELDS, 0))
+            totals["calls"] += 1
+            totals["errors"] += int(bool(error))
+            totals["seconds"] += seconds
+            totals["rows"] += rows
+            totals["bytes"] += nbytes
+
+    def record_stream(self, table, encoded):
+        """Record the fetch and encode stages of a streamed export.
+
+        encoded is the StageClock around the encoder, whose upstream is the
+        StageClock around the DB batches. Returns the seconds they took.
+        """
+        fetched = encoded.upstream
+        self.record("fetch", table, seconds=fetched.seconds, rows=fetched.amount, error=fetched.failed)
+        self.record("encode", table, seconds=max(encoded.seconds - fetched.seconds, 0.0),
+                    rows=fetched.amount, nbytes=encoded.amount, error=encoded.failed and not fetched.failed)
+        return encoded.seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(values) for key, values in self._totals.items()}
+
+    def rows_per_second(self, table):
+        """End-to-end export rate of table so far (fetch, encode and upload time), or None."""
+        with self._lock:
+            rows = self._totals.get(("fetch", table), {}).get("rows", 0)
+            seconds = sum(self._totals.get((stage, table), {}).get("seconds", 0.0)
+                          for stage in ("fetch", "encode", "upload"))
+        return rows / seconds if rows and seconds else None
+
+    def run_summary(self, before, tables, started, results):
+        """Build the JSON summary of one run from a snapshot taken at its start.
+
+        Runs never export the same table at once, so the change in each of
+        the run's tables (plus the shared stages) belongs to this run.
+        """
+        after = self.snapshot()
+        stages = []
+        for (stage, table), values in sorted(after.items()):
+            if table and table not in tables or not table and stage not in SHARED_STAGES:
+                continue
+            previous = before.get((stage, table), dict.fromkeys(FIELDS, 0))
+            delta = {field: values[field] - previous[field] for field in FIELDS}
+            if not delta["calls"]:
+                continue
+            seconds = delta["seconds"]
+            delta["seconds"] = round(seconds, 3)
+            delta["rows_per_s"] = round(delta["rows"] / seconds) if seconds else None
+            delta["mb_per_s"] = round(delta["bytes"] / seconds / 1048576, 2) if seconds else None
+            stages.append(dict(stage=stage, table=table, **delta))
+        summary = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "seconds": round(time.time() - started, 3),
+            "tables": results,
+            "stages": stages,
+        }
+        with self._lock:
+            self.last_run = summary
+        return summary
+
+    def render_prometheus(self):
+        """Return all totals in the Prometheus text exposition format."""
+        lines = []
+        snapshot = self.snapshot()
+        for field, help_text in (("calls", "Stage executions"), ("errors", "Stage executions that failed"),
+                                 ("seconds", "Seconds spent in the stage"), ("rows", "Rows handled by the stage"),
+                                 ("bytes", "Bytes produced or uploaded by the stage")):
+            name = f"sync_stage_{field}_total"
+            lines.append(f"# HELP {name} {help_text}.")
+            lines.append(f"# TYPE {name} counter")
+            for (stage, table), values in sorted(snapshot.items()):
+                lines.append(f'{name}{{stage="{stage}",table="{_escape(table)}"}} {values[field]:g}')
+        last_run = self.last_run
+        if last_run:
+            failed = sum(1 for r in last_run["tables"] if r["status"] == "failed")
+            lines += [
+                "# HELP sync_last_run_seconds Duration of the last sync run.",
+                "# TYPE sync_last_run_seconds gauge",
+                f"sync_last_run_seconds {last_run['seconds']:g}",
+                "# HELP sync_last_run_failed_tables Tables that failed in the last sync run.",
+                "# TYPE sync_last_run_failed_tables gauge",
+                f"sync_last_run_failed_tables {failed}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_run_summary(summary, name, directory=RUN_SUMMARY_DIR, keep=RUN_SUMMARY_KEEP):
+    """Write summary as ``<directory>/<name>.json`` and prune the oldest files."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+    summaries = sorted(f for f in os.listdir(directory) if f.endswith(".json"))
+    for old in summaries[:-keep]:
+        os.remove(os.path.join(directory, old))
+    return path
+
+
+class MetricsServer:
+    """Serve ``/metrics`` (Prometheus text), ``/summary`` (last run JSON) and
+    ``/progress`` (exports in flight, JSON) on a background thread."""
+
+    def __init__(self, metrics, port, host="127.0.0.1", progress=None):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] == "/metrics":
+                    body = metrics.render_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif handler.path.split("?")[0] == "/summary":
+                    body = json.dumps(metrics.last_run or {}, indent=2, default=str).encode("utf-8")
+                    content_type = "application/json"
+                elif handler.path.split("?")[0] == "/progress" and progress is not None:
+                    body = json.dumps(progress.snapshot(), indent=2).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    handler.send_error(404)
+                    return
+                handler.send_response(200)
+                handler.send_header("Content-Type", content_type)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+OUTBOX_DIR = "sync_outbox"
+JOB_FILE = "job.json"
+
+
+class Outbox:
+    """Finished exports waiting to be uploaded, kept on disk across restarts.
+
+    Every job is a directory under root holding the export files and a
+    ``job.json`` describing them. An export is written into a ``.new-``
+    directory first and only renamed into place once complete, so pending()
+    never sees half-written exports; a crash mid-extraction leaves a
+    ``.new-`` directory that discard_incomplete() removes. Jobs are removed
+    only after they were fully handled, so every job is uploaded at least
+    once.
+    """
+
+    def __init__(self, root=OUTBOX_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def create(self):
+        """Return the path of a new, empty directory to write one export into."""
+        path = os.path.join(self.root, f".new-{uuid.uuid4().hex}")
+        os.makedirs(path)
+        return path
+
+    def abandon(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def commit(self, path, job):
+        """Publish the export written to path; returns its job ID.
+
+        job["files"] lists ``{"name", "path", ...}`` entries with paths
+        relative to the job directory, in upload order.
+        """
+        self._write(path, job)
+        # IDs sort in creation order, so older exports are uploaded first.
+        job_id = f"{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        os.replace(path, os.path.join(self.root, job_id))
+        return job_id
+
+    def pending(self):
+        """Return ``[(job_id, job)]`` of all published jobs, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        jobs = []
+        for job_id in sorted(os.listdir(self.root)):
+            if job_id.startswith("."):
+                continue
+            try:
+                jobs.append((job_id, self.load(job_id)))
+            except (OSError, ValueError):
+                continue
+        return jobs
+
+    def load(self, job_id):
+        with open(os.path.join(self.root, job_id, JOB_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def update(self, job_id, job):
+        """Save job progress, e.g. the Drive IDs of files already uploaded."""
+        self._write(os.path.join(self.root, job_id), job)
+
+    def file_path(self, job_id, entry):
+        return os.path.join(self.root, job_id, entry["path"])
+
+    def remove(self, job_id):
+        shutil.rmtree(os.path.join(self.root, job_id), ignore_errors=True)
+
+    def discard_incomplete(self):
+        """Remove exports a crashed process left unfinished; returns how many."""
+        if not os.path.isdir(self.root):
+            return 0
+        stale = [name for name in os.listdir(self.root) if name.startswith(".new-")]
+        for name in stale:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        return len(stale)
+
+    def _write(self, path, job):
+        with self._lock:
+            tmp_path = os.path.join(path, JOB_FILE + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job, f, indent=2)
+            os.replace(tmp_path, os.path.join(path, JOB_FILE))
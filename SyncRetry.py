@@ -0,0 +1,210 @@
+import json
+import random
+import socket
+import ssl
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+# Drive reasons (403/429) that mean "slow down", not "forbidden".
+RATE_LIMIT_REASONS = {"userRateLimitExceeded", "rateLimitExceeded"}
+# MySQL client/server errors after which a new connection usually works.
+DB_CONNECTION_ERRNOS = {1040, 1053, 2002, 2003, 2005, 2006, 2013, 2055}
+# Lock wait timeout and deadlock: the statement can simply run again.
+DB_LOCK_ERRNOS = {1205, 1213}
+
+
+class RetryPolicy(namedtuple("RetryPolicy", "max_attempts base_delay max_delay")):
+    """How often and how patiently one error class is retried.
+
+    The n-th retry waits between half and all of ``base_delay * 2**(n-1)``,
+    capped at max_delay; the jitter keeps parallel workers from retrying in
+    lockstep. A server-supplied Retry-After is never undercut.
+    """
+
+    def delay(self, attempt, retry_after=None):
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(ceiling / 2, ceiling)
+        return max(delay, retry_after or 0)
+
+
+# error class -> policy; classes missing here ("fatal") are never retried.
+RETRY_RULES = {
+    "rate_limit": RetryPolicy(max_attempts=8, base_delay=2.0, max_delay=64.0),
+    "server": RetryPolicy(max_attempts=6, base_delay=1.0, max_delay=32.0),
+    "transport": RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0),
+    "db_connection": RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=30.0),
+    "db_lock": RetryPolicy(max_attempts=5, base_delay=0.5, max_delay=10.0),
+}
+
+
+def _drive_reason(error):
+    try:
+        content = error.content.decode("utf-8") if isinstance(error.content, bytes) else error.content
+        details = json.loads(content)["error"]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+    errors = details.get("errors") or [{}]
+    return errors[0].get("reason") or details.get("status")
+
+
+def classify(error):
+    """Return the error class of an exception: a key of RETRY_RULES or "fatal"."""
+    resp = getattr(error, "resp", None)
+    if resp is not None and getattr(resp, "status", None) is not None:
+        status = int(resp.status)
+        if status == 429 or status == 403 and _drive_reason(error) in RATE_LIMIT_REASONS:
+            return "rate_limit"
+        if status >= 500 or status == 408:
+            return "server"
+        return "fatal"
+    if type(error).__module__.startswith("mysql.connector"):
+        errno = getattr(error, "errno", None)
+        if errno in DB_LOCK_ERRNOS:
+            return "db_lock"
+        if errno in DB_CONNECTION_ERRNOS or type(error).__name__ in ("OperationalError", "InterfaceError"):
+            return "db_connection"
+        return "fatal"
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout, socket.gaierror, ssl.SSLError)):
+        return "transport"
+    if type(error).__module__.startswith("httplib2"):
+        return "transport"
+    return "fatal"
+
+
+def is_retryable(error, rules=RETRY_RULES):
+    return classify(error) in rules
+
+
+def retry_after(error):
+    """Seconds from a Retry-After header on an HttpError, if any."""
+    resp = getattr(error, "resp", None)
+    try:
+        return float(resp.get("retry-after")) if resp is not None and resp.get("retry-after") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class DriveGovernor:
+    """Cap concurrent Drive requests and slow all of them down on rate limits.
+
+    Every request holds a slot while it runs. A rate-limit error halves the
+    number of slots (down to min_concurrency) and pauses new requests for
+    the retry delay; after recover_after successes in a row one slot is
+    given back, up to max_concurrency.
+    """
+
+    def __init__(self, max_concurrency=8, min_concurrency=1, recover_after=20):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.recover_after = recover_after
+        self.limit = max_concurrency
+        self._active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._active >= self.limit:
+                    self._cond.wait()
+                else:
+                    break
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def succeeded(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.recover_after and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def throttled(self, pause_seconds):
+        with self._cond:
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            self._successes = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + pause_seconds)
+
+
+def retry_call(fn, what, rules=RETRY_RULES, governor=None, log=None, sleep=time.sleep):
+    """Call fn() until it succeeds or its error class runs out of attempts.
+
+    Each error class counts its own attempts, so e.g. a rate limit followed
+    by a 5xx does not use up the 5xx budget. With a governor every attempt
+    holds one of its slots. log, if given, receives one line per retry.
+    """
+    attempts = Counter()
+    while True:
+        try:
+            if governor is None:
+                result = fn()
+            else:
+                with governor.slot():
+                    result = fn()
+        except Exception as e:
+            error_class = classify(e)
+            policy = rules.get(error_class)
+            attempts[error_class] += 1
+            if policy is None or attempts[error_class] >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempts[error_class], retry_after(e))
+            if governor is not None and error_class == "rate_limit":
+                governor.throttled(delay)
+            if log:
+                log(f"🔁 {what}: {error_class} error ({e}); retry {attempts[error_class]} of "
+                    f"{policy.max_attempts - 1} in {delay:.1f}s")
+            sleep(delay)
+            continue
+        if governor is not None:
+            governor.succeeded()
+        return result
+
+
+def retry_batch(execute, requests, what, rules=RETRY_RULES, governor=None, log=None, sleep=time.sleep):
+    """Run a batch of requests, sending only the failed ones again.
+
+    execute(requests) returns ``{key: response or exception}``. Items that
+    failed with a retryable error are resent after a backoff until they
+    succeed or run out of attempts; the result keeps their last error.
+    """
+    results = {}
+    attempts = Counter()
+    pending = dict(requests)
+    while pending:
+        outcome = retry_call(lambda: execute(pending), what, rules, governor, log, sleep)
+        retry = {}
+        delay = 0.0
+        rate_limited = False
+        for key, result in outcome.items():
+            results[key] = result
+            if not isinstance(result, Exception):
+                continue
+            error_class = classify(result)
+            policy = rules.get(error_class)
+            attempts[key] += 1
+            if policy is None or attempts[key] >= policy.max_attempts:
+                continue
+            retry[key] = pending[key]
+            delay = max(delay, policy.delay(attempts[key], retry_after(result)))
+            rate_limited = rate_limited or error_class == "rate_limit"
+        if retry:
+            if governor is not None and rate_limited:
+                governor.throttled(delay)
+            if log:
+                log(f"🔁 {what}: {len(retry)} of {len(pending)} request(s) failed; retrying them in {delay:.1f}s")
+            sleep(delay)
+        pending = retry
+    return results
@@ -0,0 +1,298 @@
+import heapq
+import itertools
+import random
+import threading
+from datetime import datetime, timedelta
+
+# Longest single Event.wait; fire times are re-checked against the wall clock
+# after every wake-up, so clock jumps (NTP, DST, sleep) are picked up.
+MAX_WAIT_SECONDS = 60
+OVERLAP_POLICIES = ("coalesce", "skip")
+# A failed run is retried at most this often, waiting about retry_seconds,
+# then twice that, and so on (with jitter), before the job's next firing.
+MAX_RUN_RETRIES = 5
+
+
+class IntervalTrigger:
+    """Fire every ``interval``, anchored to the first fire time.
+
+    Fire times are computed from the previous *scheduled* time, not from
+    when a run finished, so they do not drift. Slots missed while a run
+    overran are collapsed into the next one.
+    """
+
+    def __init__(self, interval, start=None):
+        if interval.total_seconds() <= 0:
+            raise ValueError("interval must be greater than 0 seconds")
+        self.interval = interval
+        self.start = start
+
+    def next_fire(self, after, previous=None):
+        if previous is None:
+            return self.start or after
+        fire = previous + self.interval
+        if fire <= after:
+            missed = (after - fire) // self.interval + 1
+            fire += missed * self.interval
+        return fire
+
+    def __str__(self):
+        return f"every {self.interval}"
+
+
+class DailyTrigger:
+    """Fire once a day at ``HH:MM:SS`` local time."""
+
+    def __init__(self, time_str):
+        self.time_str = time_str
+        self.time = datetime.strptime(time_str, "%H:%M:%S").time()
+
+    def next_fire(self, after, previous=None):
+        fire = datetime.combine(after.date(), self.time)
+        if fire <= after:
+            fire = datetime.combine(after.date() + timedelta(days=1), self.time)
+        return fire
+
+    def __str__(self):
+        return f"daily at {self.time_str}"
+
+
+def _cron_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Invalid cron step in {text!r}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field {text!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronTrigger:
+    """Fire on a five-field cron expression: minute hour day month weekday.
+
+    Fields accept ``*``, numbers, ranges, lists and ``/step``. Weekdays run
+    0-6 from Sunday (7 is Sunday too). As in cron, when both day-of-month
+    and weekday are restricted a day matching either one fires.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {expression!r}")
+        self.expression = expression
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment):
+        in_days = moment.day in self.days
+        # datetime.weekday() is 0 for Monday; cron counts from Sunday.
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_fire(self, after, previous=None):
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * 5)
+        while moment <= limit:
+            if moment.month not in self.months:
+                year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+
+def parse_trigger(spec):
+    """Build a trigger from ``HH:MM:SS`` (daily) or a five-field cron expression."""
+    spec = spec.strip()
+    if len(spec.split()) == 5:
+        return CronTrigger(spec)
+    try:
+        return DailyTrigger(spec)
+    except ValueError:
+        raise ValueError(f"Expected HH:MM:SS or a cron expression, got {spec!r}")
+
+
+class Job:
+    def __init__(self, name, trigger, tables, retry_seconds=None, attempt=0, origin=None):
+        self.name = name
+        self.trigger = trigger
+        self.tables = list(tables)
+        self.retry_seconds = retry_seconds
+        self.attempt = attempt
+        # The job added to the scheduler; retries share its next fire time.
+        self.origin = origin or self
+        self.next_fire = None
+
+    def retry(self, tables):
+        """The job that retries tables after this one failed."""
+        return Job(self.name, self.trigger, tables, self.retry_seconds, self.attempt + 1, self.origin)
+
+    def retry_delay(self):
+        ceiling = self.retry_seconds * 2 ** self.attempt
+        return timedelta(seconds=random.uniform(ceiling / 2, ceiling))
+
+
+class Scheduler:
+    """Run sync jobs from one thread and a heap of next fire times.
+
+    The thread sleeps on an Event until the earliest job is due, so it does
+    not wake up every second and wakes at once on stop() or add_job().
+    ``run_tables(tables)`` does the work on its own thread and raises when a
+    run failed. Jobs with retry_seconds are then retried with exponential
+    backoff, but only for the tables in the exception's ``retry_tables``
+    (all of them if it has none), and never past the job's next firing,
+    which covers them anyway.
+
+    A table is never exported by two runs at once. With the "coalesce"
+    policy a table that is still busy is run once more right after its
+    current run finishes, however many firings asked for it meanwhile; with
+    "skip" those firings are dropped for it.
+    """
+
+    def __init__(self, run_tables, log, overlap="coalesce", now=datetime.now):
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"overlap must be one of {', '.join(OVERLAP_POLICIES)}")
+        self.run_tables = run_tables
+        self.log = log
+        self.overlap = overlap
+        self.now = now
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._busy = set()
+        self._pending = {}
+        self._thread = None
+
+    def add_job(self, name, trigger, tables, retry_seconds=None):
+        job = Job(name, trigger, tables, retry_seconds)
+        self._schedule(job, trigger.next_fire(self.now()))
+        return job
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="sync-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1):
+        """Stop firing jobs. Runs already started finish in the background."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def _schedule(self, job, fire_time, retry=False):
+        with self._lock:
+            heapq.heappush(self._heap, (fire_time, next(self._seq), job, retry))
+            if not retry:
+                job.next_fire = fire_time
+        if retry:
+            self.log(f"⏳ Retry {job.attempt} of {job.name} for {', '.join(job.tables)} "
+                     f"at {fire_time:%Y-%m-%d %H:%M:%S}")
+        else:
+            self.log(f"⏳ Next run of {job.name} ({job.trigger}) at {fire_time:%Y-%m-%d %H:%M:%S}")
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            with self._lock:
+                due = self._heap[0][0] if self._heap else None
+            now = self.now()
+            if due is None or due > now:
+                wait = MAX_WAIT_SECONDS if due is None else min((due - now).total_seconds(), MAX_WAIT_SECONDS)
+                self._wakeup.wait(wait)
+                continue
+            with self._lock:
+                fire_time, _, job, retry = heapq.heappop(self._heap)
+            if not retry:
+                self._schedule(job, job.trigger.next_fire(self.now(), fire_time))
+            self._fire(job)
+
+    def _fire(self, job):
+        with self._lock:
+            busy = [t for t in job.tables if t in self._busy]
+            free = [t for t in job.tables if t not in self._busy]
+            if busy and self.overlap == "coalesce":
+                for table in busy:
+                    self._pending.setdefault(table, job)
+            self._busy.update(free)
+        if busy:
+            action = "queued after the running export" if self.overlap == "coalesce" else "skipped"
+            self.log(f"⚠️ {job.name}: {', '.join(busy)} still running; {action}.")
+        if free:
+            self._start_run(job, free)
+
+    def _start_run(self, job, tables):
+        threading.Thread(target=self._run, args=(job, tables), name=f"sync-run-{job.name}", daemon=True).start()
+
+    def _retry(self, job, tables):
+        if not job.retry_seconds or self._stopped.is_set():
+            return
+        if not tables:
+            self.log(f"⚠️ {job.name}: the failures are not transient; waiting for the next run.")
+            return
+        if job.attempt >= MAX_RUN_RETRIES:
+            self.log(f"⚠️ {job.name}: giving up after {job.attempt} retries; waiting for the next run.")
+            return
+        retry_time = self.now() + job.retry_delay()
+        next_fire = job.origin.next_fire
+        if next_fire is not None and retry_time >= next_fire:
+            self.log(f"⏳ {job.name}: the next run at {next_fire:%Y-%m-%d %H:%M:%S} comes before a retry; "
+                     f"waiting for it.")
+            return
+        self._schedule(job.retry(tables), retry_time, retry=True)
+
+    def _run(self, job, tables):
+        try:
+            self.log(f"▶️ Running {job.name} for tables: {', '.join(tables)}")
+            self.run_tables(tables)
+            self.log(f"✅ {job.name} completed.")
+        except Exception as e:
+            self.log(f"❌ {job.name} error: {e}")
+            self._retry(job, getattr(e, "retry_tables", tables))
+        finally:
+            with self._lock:
+                self._busy.difference_update(tables)
+                follow_up = [t for t in self._pending if t not in self._busy]
+                follow_up_job = self._pending[follow_up[0]] if follow_up else None
+                for table in follow_up:
+                    del self._pending[table]
+                if self._stopped.is_set():
+                    follow_up = []
+                self._busy.update(follow_up)
+            if follow_up:
+                # Every firing that found these tables busy is served by one run.
+                self._start_run(follow_up_job, follow_up)
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+
+from DBHelpers import TableScan, position_condition
+
+
+class JsonStore:
+    """Small thread-safe key/value store persisted to one JSON file.
+
+    Every write goes through a temporary file and ``os.replace`` so a crash
+    never leaves a half-written state file behind.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, data):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            data = self._load()
+            data[key] = value
+            self._save(data)
+
+    def remove(self, key):
+        with self._lock:
+            data = self._load()
+            if data.pop(key, None) is not None:
+                self._save(data)
+
+    def values(self):
+        with self._lock:
+            return list(self._load().values())
+
+
+class WatermarkStore(JsonStore):
+    """Last exported ``Date_Time`` (and primary key) per source table.
+
+    A watermark is only written after the export containing it was uploaded,
+    so a failed run is simply exported again on the next tick.
+    """
+
+    def __init__(self, path="sync_watermarks.json"):
+        super().__init__(path)
+
+    @staticmethod
+    def key(host, dbname, table):
+        return f"{host}/{dbname}/{table}"
+
+
+class FingerprintStore(JsonStore):
+    """What the last upload of each table contained, to skip unchanged ones.
+
+    An entry holds the export scope (start date, format, splitting), the
+    ``[row count, latest Date_Time]`` probe and the SHA-256 of the uploaded
+    file. A table whose probe or content hash matches is not uploaded again.
+    """
+
+    def __init__(self, path="sync_fingerprints.json"):
+        super().__init__(path)
+
+    @staticmethod
+    def key(host, dbname, table):
+        return WatermarkStore.key(host, dbname, table)
+
+
+def incremental_query(table, watermark, key_column, start_date_str):
+    """Build the ``(query, params)`` that exports only rows after watermark.
+
+    Without a watermark the export starts at start_date_str. Rows are ordered
+    by ``Date_Time`` (then key_column) so the last exported row is the new
+    watermark. Without a key column, rows sharing the watermark's second are
+    exported again so the ones committed after the last export are not lost.
+    """
+    order_by = f"Date_Time, `{key_column}`" if key_column else "Date_Time"
+    if not watermark:
+        return f"SELECT * FROM `{table}` WHERE Date_Time >= %s ORDER BY {order_by};", (start_date_str,)
+    key = None
+    if key_column and watermark.get("key_column") == key_column:
+        key = watermark.get("key")
+    where, params = position_condition(key_column, watermark["date_time"], key)
+    return f"SELECT * FROM `{table}` WHERE {where} ORDER BY {order_by};", tuple(params)
+
+
+def incremental_scan(table, watermark, key_column, start_date_str):
+    """Like incremental_query, as a ``(TableScan, None)`` read in pages."""
+    if not watermark:
+        return TableScan(table, key_column, start=start_date_str), None
+    key = None
+    if key_column and watermark.get("key_column") == key_column:
+        key = watermark.get("key")
+    return TableScan(table, key_column, after=(watermark["date_time"], key)), None
@@ -0,0 +1,212 @@
+import json
+import re
+import threading
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+
+from googleapiclient.discovery import build_from_document
+
+from DriveHelpers import discovery_document
+
+_NAME_RE = re.compile(r"name='((?:[^'\\]|\\.)*)'")
+_PARENT_RE = re.compile(r"'([^']+)' in parents")
+
+
+class FakeDrive:
+    """In-memory stand-in for the Drive v3 files API.
+
+    It answers the requests googleapiclient sends for ``files().list``,
+    ``files().create`` (metadata, multipart and resumable uploads),
+    ``files().update`` (metadata and content), ``about().get`` and batch requests
+    of those. Only the size of uploaded content is kept, so multi-gigabyte
+    runs do not hold the data. ``calls`` counts requests by kind; the
+    requests inside a batch are counted as well.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.calls = Counter()
+        self.bytes_uploaded = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def client(self):
+        """Return a Drive service bound to this fake; use one per thread."""
+        return build_from_document(discovery_document("drive", "v3"), http=FakeDriveHttp(self))
+
+    def uploaded_files(self):
+        return [f for f in self.files.values() if f["mimeType"] != "application/vnd.google-apps.folder"]
+
+    def _create(self, metadata, size=0):
+        with self._lock:
+            self._next_id += 1
+            file_id = f"fake{self._next_id}"
+            self.files[file_id] = {
+                "id": file_id,
+                "name": metadata.get("name"),
+                "mimeType": metadata.get("mimeType", "application/octet-stream"),
+                "parents": metadata.get("parents", []),
+                "size": size,
+            }
+            for field in ("description", "appProperties"):
+                if field in metadata:
+                    self.files[file_id][field] = metadata[field]
+            self.bytes_uploaded += size
+        return file_id
+
+    def handle(self, uri, method, body, headers):
+        parsed = urlparse(uri)
+        query = parse_qs(parsed.query)
+        upload_type = query.get("uploadType", [None])[0]
+        if uri in self._sessions:
+            self.calls["upload.chunk"] += 1
+            return self._upload_chunk(uri, body, headers)
+        if parsed.path.startswith("/batch/"):
+            self.calls["batch"] += 1
+            return self._batch(body, headers)
+        if parsed.path.endswith("/about"):
+            self.calls["about.get"] += 1
+            return 200, {}, {"user": {"emailAddress": "benchmark@example.com"}}
+        if method == "GET" and parsed.path.endswith("/files"):
+            self.calls["files.list"] += 1
+            return 200, {}, {"files": self._list(query.get("q", [""])[0])}
+        if method == "POST" and upload_type == "resumable":
+            self.calls["upload.session"] += 1
+            with self._lock:
+                session = f"https://fake.upload/session/{len(self._sessions) + 1}"
+                self._sessions[session] = {"metadata": json.loads(body or "{}"), "size": 0}
+            return 200, {"location": session}, None
+        if method == "POST" and upload_type == "multipart":
+            self.calls["upload.multipart"] += 1
+            metadata, size = _split_multipart(body, headers)
+            return 200, {}, {"id": self._create(metadata, size)}
+        if method == "POST" and parsed.path.endswith("/files"):
+            self.calls["files.create"] += 1
+            metadata = json.loads(body or "{}")
+            missing = [p for p in metadata.get("parents", []) if p != "root" and p not in self.files]
+            if missing:
+                return 404, {}, {"error": {"code": 404, "message": f"File not found: {missing[0]}"}}
+            return 200, {}, {"id": self._create(metadata)}
+        if method == "PATCH" and upload_type in ("media", "multipart"):
+            self.calls["upload.update"] += 1
+            file_id = parsed.path.rsplit("/", 1)[1]
+            metadata, size = _split_multipart(body, headers) if upload_type == "multipart" else ({}, len(body or b""))
+            with self._lock:
+                if file_id not in self.files:
+                    return 404, {}, {"error": {"code": 404, "message": f"File not found: {file_id}"}}
+                self.files[file_id].update(metadata, size=size)
+                self.bytes_uploaded += size
+            return 200, {}, {"id": file_id}
+        if method == "PATCH" and "/files/" in parsed.path:
+            self.calls["files.update"] += 1
+            file_id = parsed.path.rsplit("/", 1)[1]
+            with self._lock:
+                if file_id not in self.files:
+                    return 404, {}, {"error": {"code": 404, "message": f"File not found: {file_id}"}}
+                self.files[file_id].update(json.loads(body or "{}"))
+            return 200, {}, {"id": file_id}
+        self.calls["other"] += 1
+        return 404, {}, {"error": {"code": 404, "message": f"{method} {parsed.path} is not faked"}}
+
+    def _list(self, q):
+        name = _NAME_RE.search(q)
+        parent = _PARENT_RE.search(q)
+        name = name.group(1).replace("\\'", "'") if name else None
+        with self._lock:
+            return [{"id": f["id"], "name": f["name"]} for f in self.files.values()
+                    if (name is None or f["name"] == name) and (parent is None or parent.group(1) in f["parents"])]
+
+    def _batch(self, body, headers):
+        """Answer a multipart/mixed batch by handling every part on its own."""
+        content_type = headers.get("content-type", headers.get("Content-Type", ""))
+        boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1)
+        parts = [p for p in body.split("--" + boundary) if p.strip("\r\n-")]
+        answer = []
+        for part in parts:
+            part_headers, request = re.split(r"\r?\n\r?\n", part.lstrip("\r\n"), maxsplit=1)
+            content_id = re.search(r"Content-ID: <(.*)>", part_headers, re.IGNORECASE).group(1)
+            request_line, rest = request.split("\n", 1)
+            method, path, _ = request_line.split(" ")
+            request_body = (re.split(r"\r?\n\r?\n", rest, maxsplit=1) + [""])[1]
+            status, _, payload = self.handle("https://www.googleapis.com" + path, method,
+                                             request_body.strip() or None, {})
+            answer.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n")
+        answer.append(f"--{boundary}--\r\n")
+        return 200, {"content-type": f"multipart/mixed; boundary={boundary}"}, "".join(answer)
+
+    def _upload_chunk(self, uri, body, headers):
+        session = self._sessions[uri]
+        if body is not None and hasattr(body, "read"):
+            body = body.read()
+        if body:
+            session["size"] += len(body)
+        content_range = headers.get("Content-Range", headers.get("content-range", ""))
+        total = content_range.rsplit("/", 1)[-1]
+        if total != "*" and total and int(total) == session["size"]:
+            del self._sessions[uri]
+            return 200, {}, {"id": self._create(session["metadata"], session["size"])}
+        range_header = {"range": f"bytes=0-{session['size'] - 1}"} if session["size"] else {}
+        return 308, range_header, None
+
+
+def _split_multipart(body, headers):
+    """Return ``(metadata, content_size)`` of a multipart/related upload body."""
+    if isinstance(body, str):
+        body = body.encode("latin-1")
+    content_type = headers.get("content-type", headers.get("Content-Type", ""))
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode()
+    parts = [p for p in body.split(b"--" + boundary) if p.strip(b"\r\n-")]
+    payloads = []
+    for part in parts[:2]:
+        separator = b"\r\n\r\n" if b"\r\n\r\n" in part else b"\n\n"
+        payloads.append(part.split(separator, 1)[1])
+    content = payloads[1]
+    for ending in (b"\r\n", b"\n"):
+        if content.endswith(ending):
+            content = content[:-len(ending)]
+            break
+    return json.loads(payloads[0]), len(content)
+
+
+class _Response(dict):
+    def __init__(self, status, headers):
+        super().__init__(headers)
+        self.status = status
+        self.reason = "OK" if status < 400 else "Error"
+        self["status"] = str(status)
+
+
+class FakeDriveHttp:
+    """httplib2.Http replacement that routes every request to a FakeDrive."""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        status, response_headers, payload = self.drive.handle(uri, method, body, headers or {})
+        if isinstance(payload, str):
+            content = payload.encode("utf-8")
+        elif payload is not None:
+            response_headers = dict(response_headers, **{"content-type": "application/json"})
+            content = json.dumps(payload).encode("utf-8")
+        else:
+            content = b""
+        return _Response(status, response_headers), content
+
+
+class FakeDriveClients:
+    """ThreadLocalService look-alike handing out FakeDrive clients."""
+
+    def __init__(self, drive):
+        self.drive = drive
+        self._local = threading.local()
+
+    def get(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self.drive.client()
+        return service
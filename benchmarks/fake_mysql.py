@@ -0,0 +1,164 @@
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
+
+# mysql.connector FieldType codes and charset ids used in cursor.description.
+_LONG, _DOUBLE, _DATETIME, _VAR_STRING = 3, 5, 12, 253
+_UTF8MB4 = 45
+
+# Shaped like the st0x station tables: an auto-increment id, Date_Time, part
+# identifiers, a verdict and a block of measurement columns.
+COLUMNS = (
+    [("id", _LONG), ("Date_Time", _DATETIME), ("Barcode", _VAR_STRING), ("Model", _VAR_STRING),
+     ("Result", _VAR_STRING)]
+    + [(f"Value{i}", _DOUBLE) for i in range(1, 11)]
+)
+START_TIME = datetime(2024, 1, 1)
+# What information_schema reports for such a table.
+AVG_ROW_LENGTH = 120
+
+_TABLE_RE = re.compile(r"(?:FROM|DELETE FROM)\s+`([^`]+)`", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"LIMIT\s+(\d+)", re.IGNORECASE)
+
+
+def synthetic_rows(start, stop):
+    """Rows start..stop-1 of a synthetic station table, one per second."""
+    for i in range(start, stop):
+        base = (i % 1000) * 0.001
+        yield (
+            i + 1, START_TIME + timedelta(seconds=i), f"SN{i:012d}", "MODEL-A" if i % 3 else "MODEL-B",
+            "NG" if i % 97 == 0 else "OK",
+            1.0 + base, 2.0 + base, 3.0 + base, 4.0 + base, 5.0 + base,
+            6.0 + base, 7.0 + base, 8.0 + base, 9.0 + base, 10.0 + base,
+        )
+
+
+# The measurement block only depends on i % 1000 and the time of day on
+# i % 86400, so their text is made once.
+_RAW_VALUES = [tuple(repr(v + k * 0.001).encode() for v in range(1, 11)) for k in range(1000)]
+_RAW_TIMES = [b" %02d:%02d:%02d" % (t // 3600, t // 60 % 60, t % 60) for t in range(86400)]
+
+
+def synthetic_raw_rows(start, stop):
+    """synthetic_rows() as a raw cursor returns them: the text the server sends.
+
+    A real server sends text anyway, so this is built about as cheaply as
+    synthetic_rows() builds its Python values.
+    """
+    day, day_text = None, None
+    for i in range(start, stop):
+        if i // 86400 != day:
+            day = i // 86400
+            day_text = (START_TIME + timedelta(days=day)).strftime("%Y-%m-%d").encode()
+        yield (
+            b"%d" % (i + 1), day_text + _RAW_TIMES[i % 86400], b"SN%012d" % i,
+            b"MODEL-A" if i % 3 else b"MODEL-B", b"NG" if i % 97 == 0 else b"OK",
+        ) + _RAW_VALUES[i % 1000]
+
+
+class FakeMySQL:
+    """Synthetic MySQL server holding ``rows`` rows in every table.
+
+    Rows are generated while they are fetched, so even 10M-row tables use
+    no memory up front. ``connect`` matches ``mysql.connector.connect``.
+    DELETEs only decrement a per-table row count. Only the keyset position
+    and LIMIT of a SELECT are honoured; other conditions match every row.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.remaining = {}
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def connect(self, **config):
+        with self._lock:
+            self.calls["connect"] += 1
+        return _Connection(self)
+
+    def table_rows(self, table):
+        with self._lock:
+            return self.remaining.setdefault(table, self.rows)
+
+
+class _Connection:
+    def __init__(self, server):
+        self.server = server
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def cursor(self, buffered=None, raw=None):
+        return _Cursor(self.server, raw)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Cursor:
+    def __init__(self, server, raw=False):
+        self.server = server
+        self.raw = raw
+        self.description = None
+        self.rowcount = -1
+        self._rows = iter(())
+
+    def execute(self, query, params=None):
+        server = self.server
+        statement = query.lstrip().split(None, 1)[0].upper()
+        with server._lock:
+            server.calls[statement.lower()] += 1
+        if "KEY_COLUMN_USAGE" in query:
+            self.description = [("COLUMN_NAME", _VAR_STRING, None, None, None, None, 1, 0, _UTF8MB4)]
+            self._rows = iter([("id",)])
+            return
+        if "AVG_ROW_LENGTH" in query:
+            self.description = [("AVG_ROW_LENGTH", _LONG, None, None, None, None, 1, 0, 63)]
+            self._rows = iter([(AVG_ROW_LENGTH,)])
+            return
+        table = _TABLE_RE.search(query).group(1)
+        if statement == "EXPLAIN":
+            self.description = [("rows", _LONG, None, None, None, None, 1, 0, 63)]
+            self._rows = iter([(server.table_rows(table),)])
+            return
+        if "COUNT(*)" in query:
+            rows = server.table_rows(table)
+            self.description = [("COUNT(*)", _LONG, None, None, None, None, 0, 0, 63),
+                                ("MAX(Date_Time)", _DATETIME, None, None, None, None, 1, 0, 63)]
+            last = next(synthetic_rows(rows - 1, rows), None)
+            self._rows = iter([(rows, last[1] if last else None)])
+            return
+        if statement == "DELETE":
+            limit = int(_LIMIT_RE.search(query).group(1))
+            with server._lock:
+                left = server.remaining.setdefault(table, server.rows)
+                self.rowcount = min(limit, left)
+                server.remaining[table] = left - self.rowcount
+            return
+        self.description = [(name, code, None, None, None, None, 1, 0, _UTF8MB4) for name, code in COLUMNS]
+        rows = synthetic_raw_rows if self.raw else synthetic_rows
+        start, stop = 0, server.table_rows(table)
+        limit = _LIMIT_RE.search(query)
+        if limit:
+            # A keyset page: ids are row numbers + 1 and ascend with Date_Time.
+            if "` > %s" in query:
+                start = int(params[-1])
+            stop = min(stop, start + int(limit.group(1)))
+        self._rows = rows(start, stop)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        return list(islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
@@ -0,0 +1,214 @@
+"""Measure the export pipeline against synthetic MySQL data and a fake Drive.
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --rows 10000 1000000 --formats csv csv.gz --json baseline.json
+    python -m benchmarks.run_benchmarks --baseline baseline.json
+
+Run it from the repository root. Every (stage, rows, format) case runs in
+a fresh interpreter so its peak RSS is its own. Stages:
+
+    extract  stream rows out of the cursor only
+    encode   extract and encode to the export format
+    auto     SyncEngine.run_all_queries, uploading to the fake Drive
+    manual   SyncEngine.process_manual_upload, uploading to the fake Drive
+    bundle   SyncEngine.run_manual_bundle of --tables tables into one zip
+    purge    SyncEngine.delete_uploaded_rows in chunks
+
+With --baseline the run exits with status 1 when any case lost more than
+--tolerance of its rows/s.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+STAGES = ("extract", "encode", "auto", "manual", "bundle", "purge")
+DEFAULT_ROWS = (10000, 100000)
+TABLE = "st04 fs data"
+DB_ARGS = ("bench-host", "bench", "bench", "bench_db")
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(stage, rows, fmt, stream, resumable, tables, split_by=None, split_size=None):
+    """Run one case in this process and return its metrics."""
+    import mysql.connector
+
+    from benchmarks.fake_drive import FakeDrive, FakeDriveClients
+    from benchmarks.fake_mysql import FakeMySQL
+    from DBHelpers import RangeTracker, get_pool, open_query_stream
+    from ExportFormats import iter_export_chunks, supports_raw_rows
+    from SyncEngine import SyncEngine, make_options
+
+    server = FakeMySQL(rows)
+    mysql.connector.connect = server.connect
+    drive = FakeDrive()
+    os.chdir(tempfile.mkdtemp(prefix="sync-bench-"))
+    engine = SyncEngine(drive_clients=FakeDriveClients(drive))
+    options = make_options(db_args=DB_ARGS, format=fmt, stream=stream, resumable=resumable,
+                           incremental=False, workers=tables, start_date="2024-01-01", split_by=split_by)
+    if split_size:
+        options["split_size"] = split_size
+    table_names = list(engine.tables_and_queries)[:tables] if tables > 1 else [TABLE]
+    log = lambda msg: None
+    total_rows = rows * len(table_names)
+    total_bytes = 0
+
+    started = time.perf_counter()
+    if stage in ("extract", "encode"):
+        query = f"SELECT * FROM `{TABLE}`;"
+        raw = supports_raw_rows(fmt)
+        description, batches = open_query_stream(*DB_ARGS, query, raw=raw)
+        if stage == "extract":
+            for _ in batches:
+                pass
+        else:
+            columns = [d[0] for d in description]
+            for chunk in iter_export_chunks(fmt, columns, batches, description, raw):
+                total_bytes += len(chunk)
+        total_rows = rows
+    elif stage == "auto":
+        engine.run_all_queries(table_names, options, log, auto_mode=True)
+        total_bytes = drive.bytes_uploaded
+    elif stage == "manual":
+        engine.process_manual_upload(f"SELECT * FROM `{TABLE}`;", TABLE, options, log)
+        total_bytes = drive.bytes_uploaded
+        total_rows = rows
+    elif stage == "bundle":
+        engine.run_manual_bundle(table_names, "2024-01-01 00:00:00", "2100-01-01 00:00:00", options, log)
+        total_bytes = drive.bytes_uploaded
+    elif stage == "purge":
+        tracker = RangeTracker("id")
+        tracker.min_date_time, tracker.max_date_time, tracker.max_key = "2024-01-01", "2100-01-01", rows
+        get_pool(*DB_ARGS)
+        engine.delete_uploaded_rows(*DB_ARGS, TABLE, tracker, log=log)
+        total_rows = rows
+    seconds = time.perf_counter() - started
+
+    return {
+        "stage": stage,
+        "rows": rows,
+        "format": fmt,
+        "stream": stream,
+        "resumable": resumable,
+        "tables": len(table_names),
+        "split": f"{split_by}:{options['split_size']}" if split_by else None,
+        "seconds": round(seconds, 3),
+        "rows_per_s": round(total_rows / seconds) if seconds else None,
+        "mb_per_s": round(total_bytes / seconds / 1048576, 2) if seconds and total_bytes else None,
+        "mb": round(total_bytes / 1048576, 2),
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1) or None,
+        "drive_calls": dict(drive.calls),
+        "db_calls": dict(server.calls),
+    }
+
+
+def case_key(result):
+    key = f"{result['stage']}/{result['rows']}/{result['format']}/{'stream' if result['stream'] else 'buffered'}"
+    if result["resumable"]:
+        key += "/resumable"
+    if result["tables"] > 1:
+        key += f"/x{result['tables']}"
+    if result.get("split"):
+        key += f"/{result['split']}"
+    return key
+
+
+def format_calls(calls):
+    return " ".join(f"{name}={count}" for name, count in sorted(calls.items())) or "-"
+
+
+def print_header():
+    print(f"{'case':<34} {'seconds':>8} {'rows/s':>10} {'MB/s':>7} {'MB':>8} {'RSS MB':>7}  API calls")
+
+
+def print_result(r):
+    print(f"{case_key(r):<34} {r['seconds']:>8} {r['rows_per_s'] or '-':>10} {r['mb_per_s'] or '-':>7} "
+          f"{r['mb']:>8} {r['peak_rss_mb'] or '-':>7}  {format_calls(r['drive_calls'])} "
+          f"{format_calls(r['db_calls'])}", flush=True)
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {case_key(r): r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        before = baseline.get(case_key(r))
+        if before and before["rows_per_s"] and r["rows_per_s"]:
+            change = r["rows_per_s"] / before["rows_per_s"] - 1
+            print(f"{case_key(r):<34} {before['rows_per_s']:>10} -> {r['rows_per_s']:>10} rows/s ({change:+.1%})")
+            if change < -tolerance:
+                regressions.append(case_key(r))
+    if regressions:
+        print(f"Regressions beyond {tolerance:.0%}: {', '.join(regressions)}")
+    return not regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the export pipeline with local stand-ins.")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS),
+                        help="rows per table, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--formats", nargs="+", default=["csv"], help="export formats to measure")
+    parser.add_argument("--buffered", action="store_true", help="measure the buffered path instead of streaming")
+    parser.add_argument("--resumable", action="store_true", help="upload through the resumable spool path")
+    parser.add_argument("--tables", type=int, default=1, help="tables exported concurrently by the auto stage")
+    parser.add_argument("--split-by", choices=("rows", "mb", "hour", "day"),
+                        help="split auto/manual exports into parts")
+    parser.add_argument("--split-size", type=int, help="rows or MB per part")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare rows/s against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed rows/s loss against the baseline")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        result = run_case(args.stages[0], args.rows[0], args.formats[0], not args.buffered, args.resumable,
+                          args.tables, args.split_by, args.split_size)
+        print(json.dumps(result))
+        return 0
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    print_header()
+    for rows in args.rows:
+        for fmt in args.formats:
+            for stage in args.stages:
+                if stage in ("extract", "purge") and fmt != args.formats[0]:
+                    continue
+                command = [sys.executable, "-m", "benchmarks.run_benchmarks", "--child", "--stages", stage,
+                           "--rows", str(rows), "--formats", fmt, "--tables", str(args.tables)]
+                command += ["--buffered"] if args.buffered else []
+                command += ["--resumable"] if args.resumable else []
+                command += ["--split-by", args.split_by] if args.split_by else []
+                command += ["--split-size", str(args.split_size)] if args.split_size else []
+                completed = subprocess.run(command, cwd=repo_root, capture_output=True, text=True)
+                if completed.returncode:
+                    print(completed.stderr, file=sys.stderr)
+                    return completed.returncode
+                results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+                print_result(results[-1])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        return 0 if compare(results, args.baseline, args.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from SyncEngine import TablesFailed
+from SyncScheduler import IntervalTrigger, Scheduler
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+INTERVAL = timedelta(minutes=5)
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Runs:
+    """run_tables that records (time, tables) of every call and fails the first one."""
+
+    def __init__(self, clock, failing_tables):
+        self.clock = clock
+        self.failing_tables = failing_tables
+        self.calls = []
+        self._cond = threading.Condition()
+
+    def __call__(self, tables):
+        with self._cond:
+            self.calls.append((self.clock(), list(tables)))
+            self._cond.notify_all()
+            first = len(self.calls) == 1
+        if first:
+            raise TablesFailed(list(tables), self.failing_tables)
+
+    def wait_for(self, count, timeout=5):
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.calls) >= count, timeout)
+
+
+# The scheduler thread re-reads the fake clock every few milliseconds.
+@mock.patch("SyncScheduler.MAX_WAIT_SECONDS", 0.005)
+class IntervalRetryTest(unittest.TestCase):
+    def start(self, retry_seconds):
+        clock = FakeClock(T0)
+        runs = Runs(clock, failing_tables=["b"])
+        lines = []
+        scheduler = Scheduler(runs, lines.append, now=clock)
+        scheduler.add_job("job", IntervalTrigger(INTERVAL), ["a", "b"], retry_seconds=retry_seconds)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        self.assertTrue(runs.wait_for(1))
+        return clock, runs, lines
+
+    def test_failed_tables_are_retried_before_the_next_interval_fire(self):
+        # The first retry waits 30-60s.
+        clock, runs, lines = self.start(retry_seconds=60)
+        clock.now = T0 + timedelta(seconds=61)
+        self.assertTrue(runs.wait_for(2))
+        self.assertEqual(runs.calls, [(T0, ["a", "b"]), (T0 + timedelta(seconds=61), ["b"])])
+
+    def test_retry_landing_after_the_next_fire_is_left_to_it(self):
+        # The first retry waits 300-600s, not before the next fire at T0 + 5 minutes.
+        clock, runs, lines = self.start(retry_seconds=600)
+        clock.now = T0 + INTERVAL - timedelta(seconds=1)
+        self.assertFalse(runs.wait_for(2, timeout=0.2))
+        clock.now = T0 + INTERVAL
+        self.assertTrue(runs.wait_for(2))
+        self.assertEqual(runs.calls, [(T0, ["a", "b"]), (T0 + INTERVAL, ["a", "b"])])
+        self.assertTrue(any("comes before a retry" in line for line in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()